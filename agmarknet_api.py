@@ -1,13 +1,18 @@
 
 from __future__ import annotations
+import os, datetime as dt
 import pandas as pd, requests
+from functools import partial
 from typing import List, Optional
+from net import session, with_retry, fetch_all
+from price_store import PriceStore
 
 DEFAULT_BASE = "https://api.ceda.ashoka.edu.in"
 
 class AgmarknetClient:
     def __init__(self, base_url: str = DEFAULT_BASE, endpoint_path: str = "/agmarknet/prices",
-                 api_key: str | None = None, timeout: int = 30):
+                 api_key: str | None = None, timeout: int = 30, http: requests.Session | None = None):
+        self.http = http or session()
         self.base = base_url.rstrip("/")
         self.endpoint_path = endpoint_path if endpoint_path.startswith("/") else "/" + endpoint_path
         self.timeout = timeout
@@ -20,7 +25,10 @@ class AgmarknetClient:
             if params is not None and "api-key" not in params:
                 params = {**params, "api-key": self.api_key}
         url = f"{self.base}{path}"
-        r = requests.get(url, params=params, headers=headers, timeout=self.timeout)
+        return with_retry("agmarknet", self._request, url, params, headers)
+
+    def _request(self, url: str, params: dict | None, headers: dict):
+        r = self.http.get(url, params=params, headers=headers, timeout=self.timeout)
         if r.status_code >= 400:
             raise requests.HTTPError(
                 f"HTTP {r.status_code} for {url} params={params}. "
@@ -49,25 +57,94 @@ class AgmarknetClient:
             df["Date"] = pd.to_datetime(df["Date"]).dt.date
         return df
 
+    def prices_windowed(self, date_from: str, date_to: str, window_days: int = 30, **filters) -> pd.DataFrame:
+        """``prices`` over [date_from, date_to] split into ``window_days`` windows that are requested concurrently."""
+        start, end = pd.Timestamp(date_from), pd.Timestamp(date_to)
+        bounds = [(s, min(s + pd.Timedelta(days=window_days - 1), end))
+                  for s in pd.date_range(start, end, freq=f"{window_days}D")]
+        results = fetch_all({s: partial(self.prices, date_from=str(s.date()), date_to=str(e.date()), **filters)
+                             for s, e in bounds})
+        for res in results.values():
+            if isinstance(res, Exception): raise res
+        frames = [results[s] for s, _ in bounds if not results[s].empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+PANEL_KEYS = ["State", "Market", "Variety"]
+
+def _daily_price(df: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+    if "ModalPrice" in df.columns:
+        return df.groupby(by, as_index=False)["ModalPrice"].mean().rename(columns={"ModalPrice":"Price"})
+    if {"MinPrice","MaxPrice"}.issubset(df.columns):
+        tmp = df.groupby(by, as_index=False)[["MinPrice","MaxPrice"]].mean(); tmp["Price"]=(tmp["MinPrice"]+tmp["MaxPrice"])/2.0
+        return tmp[[*by, "Price"]]
+    out = df.groupby(by, as_index=False).size(); out["Price"]=float("nan"); return out[[*by, "Price"]]
+
+STORE_COLUMNS = {"Date": "date", "State": "state", "Market": "market", "Variety": "variety", "Commodity": "commodity",
+                 "MinPrice": "min_price", "MaxPrice": "max_price", "ModalPrice": "modal_price"}
+
+def _store_rows(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.rename(columns=STORE_COLUMNS)
+    out = out[[c for c in STORE_COLUMNS.values() if c in out.columns]].copy()
+    if "modal_price" in out.columns: out["price"] = pd.to_numeric(out["modal_price"], errors="coerce")
+    elif {"min_price", "max_price"}.issubset(out.columns):
+        out["price"] = (pd.to_numeric(out["min_price"], errors="coerce") + pd.to_numeric(out["max_price"], errors="coerce")) / 2.0
+    return out
+
+def _latest_date(path: str | None) -> dt.date | None:
+    if not path or not os.path.exists(path): return None
+    dates = pd.to_datetime(pd.read_csv(path, usecols=["Date"])["Date"], errors="coerce").dropna()
+    return dates.max().date() if len(dates) else None
+
+def _merge(path: str, new: pd.DataFrame, since: dt.date, by: List[str]) -> pd.DataFrame:
+    """Existing rows before ``since`` plus ``new``, which replaces everything from ``since`` on."""
+    if not os.path.exists(path): return new
+    old = pd.read_csv(path)
+    old["Date"] = pd.to_datetime(old["Date"]).dt.date
+    out = pd.concat([old[old["Date"] < since], new], ignore_index=True)
+    return out.drop_duplicates(subset=by, keep="last").sort_values(by)
+
 def fetch_basmati_prices_csv(out_csv: str, state: str | None = None, market: str | None = None,
                              variety_keywords: List[str] | None = None, date_from: str | None = None,
                              date_to: str | None = None, commodity_name: str = "Paddy",
                              base_url: str = DEFAULT_BASE, endpoint_path: str = "/agmarknet/prices",
-                             api_key: str | None = None) -> str:
-    df = AgmarknetClient(base_url=base_url, endpoint_path=endpoint_path, api_key=api_key).prices(
-        commodity=commodity_name, state=state, market=market, date_from=date_from, date_to=date_to
-    )
+                             api_key: str | None = None, panel_csv: str | None = None,
+                             sync: bool = False, window_days: int = 30, store: str | None = None) -> str:
+    """Save the daily mean price to ``out_csv``; ``panel_csv`` additionally keeps one series per state/market/variety.
+
+    With ``sync`` only dates from the latest one already stored onwards are requested (the earlier of ``out_csv``'s
+    and ``panel_csv``'s; that day is fetched again in case it was incomplete), in ``window_days`` windows fetched
+    concurrently, and merged into the existing files; if either file has no stored date the range starts at
+    ``date_from``. With ``store`` the raw rows (min/max/modal price per state, market and variety) are also
+    upserted into that SQLite price store.
+    """
+    client = AgmarknetClient(base_url=base_url, endpoint_path=endpoint_path, api_key=api_key)
+    filters = dict(commodity=commodity_name, state=state, market=market)
+    since = None
+    if sync:  # resume from the earlier of the files' latest dates, so neither one misses history
+        latest = [_latest_date(out_csv)] + ([_latest_date(panel_csv)] if panel_csv else [])
+        since = None if None in latest else min(latest)
+    if sync and (since or date_from):
+        since = since or pd.Timestamp(date_from).date()
+        df = client.prices_windowed(str(since), date_to or dt.date.today().isoformat(), window_days, **filters)
+    else:
+        since = None
+        df = client.prices(date_from=date_from, date_to=date_to, **filters)
+    if df.empty and since is not None:
+        return out_csv  # nothing new; keep the stored files as they are
     if df.empty:
-        pd.DataFrame(columns=["Date","Price"]).to_csv(out_csv, index=False); return out_csv
+        pd.DataFrame(columns=["Date","Price"]).to_csv(out_csv, index=False)
+        if panel_csv: pd.DataFrame(columns=["Date", *PANEL_KEYS, "Price"]).to_csv(panel_csv, index=False)
+        return out_csv
     if variety_keywords and "Variety" in df.columns:
         import re
         pat = "|".join([re.escape(str(x)) for x in variety_keywords])
         df = df[df["Variety"].str.contains(pat, case=False, na=False)].copy()
-    if "ModalPrice" in df.columns:
-        daily = df.groupby("Date", as_index=False)["ModalPrice"].mean().rename(columns={"ModalPrice":"Price"})
-    elif {"MinPrice","MaxPrice"}.issubset(df.columns):
-        tmp = df.groupby("Date", as_index=False)[["MinPrice","MaxPrice"]].mean(); tmp["Price"]=(tmp["MinPrice"]+tmp["MaxPrice"])/2.0
-        daily = tmp[["Date","Price"]]
-    else:
-        daily = df.groupby("Date", as_index=False).size(); daily["Price"]=float("nan"); daily=daily[["Date","Price"]]
-    daily.sort_values("Date").to_csv(out_csv, index=False); return out_csv
+    if store: PriceStore(store).upsert(_store_rows(df), "agmarknet")
+    daily = _daily_price(df, ["Date"]).sort_values("Date")
+    if panel_csv:
+        keys = PANEL_KEYS  # always all of them, as the data.gov.in panel: a key the API did not return is "NA"
+        panel = _daily_price(df.assign(**{c: "NA" for c in keys if c not in df.columns}), ["Date", *keys]).sort_values(["Date", *keys])
+        if since is not None: panel = _merge(panel_csv, panel, since, ["Date", *keys])
+        panel.to_csv(panel_csv, index=False)
+    if since is not None: daily = _merge(out_csv, daily, since, ["Date"])
+    daily.to_csv(out_csv, index=False); return out_csv
@@ -0,0 +1,136 @@
+from __future__ import annotations
+import os, re, time, json
+import numpy as np, pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+from utils import load_config, ensure_dir, today_str
+from tech_indicators import FeatureState, feature_columns
+from train import fit_sarimax, _metrics, _xgb_model
+from price_store import load_prices, price_query
+from pipeline import build_features
+
+_LAG = re.compile(r"^(.*)_lag(\d+)$")
+
+def _future_exog(features: pd.DataFrame, cols: list[str], pos: int, steps: int) -> np.ndarray:
+    """Exogenous block for ``steps`` days after row ``pos`` using only what was known at ``pos``:
+    raw columns are carried forward, lag columns read the last known value of their base column."""
+    k = np.arange(1, steps + 1)
+    out = np.empty((steps, len(cols)))
+    for j, c in enumerate(cols):
+        m = _LAG.match(c)
+        base, lag = (m.group(1), int(m.group(2))) if m and m.group(1) in features.columns else (c, 0)
+        out[:, j] = features[base].to_numpy(dtype=float)[np.minimum(pos + k - lag, pos)]
+    return out
+
+def _scores(prefix: str, actual: pd.Series, pred: pd.Series) -> dict:
+    ok = actual.notna() & pred.notna()
+    return {f"{prefix}_{k}": v for k, v in _metrics(actual[ok], pred[ok]).items()} if ok.any() else {}
+
+def _run_chunk(price_s: pd.Series, features: pd.DataFrame, y: pd.Series, resid: pd.Series, params: np.ndarray,
+               sar_kw: dict, xgb_cfg: dict | None, origins: list[int], max_h: int, retrain_every: int) -> list[dict]:
+    """Walk one contiguous block of origins: a single fixed-parameter filter, then ``extend`` per origin."""
+    x_cols = [c for c in features.columns if c != "price"]
+    exo_cols = [c for c in x_cols if c not in set(feature_columns())]
+    pos_of = {d: i for i, d in enumerate(features.index)}
+    first = origins[0]
+    model = SARIMAX(y.iloc[:first + 1], order=sar_kw["order"], seasonal_order=sar_kw["seasonal_order"],
+                    enforce_stationarity=False, enforce_invertibility=False)
+    res = model.filter(params)
+    state = FeatureState.from_series(price_s.loc[:y.index[first]])
+    prev, xgb, out = first, None, []
+    for n, o in enumerate(origins):
+        if o > prev:
+            res = res.extend(y.iloc[prev + 1:o + 1])
+            state.extend(price_s.loc[y.index[prev + 1]:y.index[o]])
+            prev = o
+        origin_date = y.index[o]
+        base = np.asarray(res.forecast(steps=max_h), dtype=float)
+        hybrid = base.copy()
+        if xgb_cfg and xgb_cfg.get("enabled", True):
+            if xgb is None or n % retrain_every == 0:
+                r = resid.loc[:origin_date].dropna()
+                Xtr = features.loc[r.index, x_cols]
+                keep = Xtr.notna().all(axis=1)
+                xgb = _xgb_model(xgb_cfg); xgb.fit(Xtr[keep], r[keep].values)
+            fut_idx = pd.date_range(origin_date + pd.Timedelta(days=1), periods=max_h, freq="D")
+            price_feats = state.copy().extend(pd.Series(price_s.loc[origin_date], index=fut_idx))
+            fut = pd.concat([price_feats.drop(columns=["price"]),
+                             pd.DataFrame(_future_exog(features, exo_cols, pos_of[origin_date], max_h), index=fut_idx, columns=exo_cols)],
+                            axis=1)[x_cols].ffill().bfill()
+            hybrid = base + xgb.predict(fut)
+        out.append({"origin": origin_date, "actual": y.iloc[o + 1:o + 1 + max_h].to_numpy(dtype=float),
+                    "baseline": base, "hybrid": hybrid})
+    return out
+
+def walk_forward(price_s: pd.Series, features: pd.DataFrame, sarimax_cfg: dict, xgb_cfg: dict | None,
+                 horizons: list[int], n_origins: int = 100, step_days: int = 7, retrain_every: int = 4,
+                 max_workers: int = 1) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Rolling-origin evaluation of the hybrid model without refitting SARIMAX at every origin.
+
+    SARIMAX is estimated once on the data before the first origin; each later origin only extends the
+    Kalman filter state with the new observations (fixed parameters). The XGBoost residual model is
+    retrained every ``retrain_every`` origins. Returns (per-origin/horizon metrics, summary per horizon).
+    """
+    horizons = sorted(set(int(h) for h in horizons)); max_h = horizons[-1]
+    features = features.copy(); features["price"] = price_s
+    df = features.dropna()
+    y = df["price"].asfreq("D")
+    last = len(y) - 1 - max_h
+    origins = [last - i * step_days for i in range(n_origins) if last - i * step_days >= 2 * max(30, step_days)][::-1]
+    if not origins:
+        raise ValueError(f"Not enough history for a {max_h}-day backtest: {len(y)} usable rows.")
+    sar_kw = dict(order=tuple(sarimax_cfg.get("order", (1, 1, 1))),
+                  seasonal_order=tuple(sarimax_cfg.get("seasonal_order", (0, 1, 1, 7))),
+                  maxiter=sarimax_cfg.get("maxiter", 50))
+    sar = fit_sarimax(y.iloc[:origins[0] + 1], **sar_kw)
+    params = np.asarray(sar.params)
+    one_step = SARIMAX(y, order=sar_kw["order"], seasonal_order=sar_kw["seasonal_order"],
+                       enforce_stationarity=False, enforce_invertibility=False).filter(params).fittedvalues
+    resid = y - one_step  # one-step-ahead errors with the fixed parameters: no look-ahead into later origins
+
+    # contiguous chunks, sized in whole retrain cycles so the XGBoost cadence is the same as a serial run
+    n_chunks = max(1, min(max_workers, len(origins) // max(1, retrain_every)))
+    size = -(-len(origins) // n_chunks); size = -(-size // retrain_every) * retrain_every
+    chunks = [origins[i:i + size] for i in range(0, len(origins), size)]
+    args = (price_s, features, y, resid, params, sar_kw, xgb_cfg)
+    if len(chunks) == 1:
+        results = _run_chunk(*args, chunks[0], max_h, retrain_every)
+    else:
+        with ProcessPoolExecutor(max_workers=len(chunks)) as ex:
+            futs = [ex.submit(_run_chunk, *args, c, max_h, retrain_every) for c in chunks]
+            results = [r for f in futs for r in f.result()]
+
+    rows, summary = [], []
+    for h in horizons:
+        acts, bases, hybs = [], [], []
+        for r in results:
+            a = pd.Series(r["actual"][:h]); acts.append(a)
+            bases.append(pd.Series(r["baseline"][:h])); hybs.append(pd.Series(r["hybrid"][:h]))
+            rows.append({"origin": r["origin"].date(), "horizon": h,
+                         **_scores("baseline", a, bases[-1]), **_scores("hybrid", a, hybs[-1])})
+        a = pd.concat(acts, ignore_index=True)
+        summary.append({"horizon": h, "origins": len(results),
+                        **_scores("baseline", a, pd.concat(bases, ignore_index=True)),
+                        **_scores("hybrid", a, pd.concat(hybs, ignore_index=True))})
+    return pd.DataFrame(rows), pd.DataFrame(summary)
+
+def run_backtest(config_path: str = "config.yaml", horizons=None, n_origins: int | None = None,
+                 step_days: int | None = None, retrain_every: int | None = None, max_workers: int | None = None):
+    cfg = load_config(config_path)
+    bcfg = cfg.get("backtest", {}) or {}
+    price_s = load_prices(price_query(cfg))
+    feats = build_features(price_s, cfg)
+    t0 = time.perf_counter()
+    per_origin, summary = walk_forward(
+        price_s, feats, cfg.get("model", {}).get("sarimax", {}), cfg.get("model", {}).get("xgboost", {}),
+        horizons or cfg.get("horizons", [7, 30, 180]), n_origins or bcfg.get("origins", 100),
+        step_days or bcfg.get("step_days", 7), retrain_every or bcfg.get("retrain_every", 4),
+        max_workers or bcfg.get("max_workers", 1))
+    out_root = os.path.join("artifacts", today_str(), "backtest"); ensure_dir(out_root)
+    per_origin.to_csv(os.path.join(out_root, "backtest_origins.csv"), index=False)
+    summary.to_csv(os.path.join(out_root, "backtest_summary.csv"), index=False)
+    with open(os.path.join(out_root, "backtest_summary.json"), "w", encoding="utf-8") as f:
+        json.dump({"seconds": round(time.perf_counter() - t0, 3), "horizons": summary.to_dict(orient="records")}, f, indent=2)
+    print(summary.to_string(index=False))
+    print(f"Done in {time.perf_counter() - t0:.1f}s. Artifacts at: {out_root}")
+    return summary
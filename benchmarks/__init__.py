@@ -0,0 +1,4 @@
+"""Offline benchmarks: synthetic data, local stand-ins for the price/exogenous APIs and timed scenarios.
+
+Run ``python -m benchmarks --help`` from the repository root.
+"""
@@ -0,0 +1,39 @@
+from __future__ import annotations
+import os
+import typer
+from benchmarks.scenarios import SCENARIOS, Scale
+from benchmarks.runner import BASELINE_DIR, run_suite, compare, save, load
+
+app = typer.Typer(help="Offline benchmarks on synthetic data with local API stand-ins")
+
+@app.command("list")
+def list_scenarios():
+    for s in SCENARIOS.values():
+        typer.echo(f"{s.name:<22} {s.doc}")
+
+@app.command("run")
+def run(scenarios: list[str] = typer.Option(None, "--scenario", "-s", help="Scenario(s) to run (default: all)"),
+        years: float = typer.Option(3, help="Years of daily history"),
+        markets: int = typer.Option(10, help="Markets in the synthetic panel (fetcher scenarios)"),
+        seed: int = typer.Option(0, help="Random seed for the synthetic data"),
+        latency_ms: float = typer.Option(20.0, help="Added per-request latency of the stand-in APIs"),
+        repeats: int = typer.Option(3, help="Timed runs per scenario"),
+        warmup: int = typer.Option(1, help="Untimed runs before timing"),
+        config: str = typer.Option("config.yaml", help="Config file for model settings"),
+        save_as: str = typer.Option(None, help=f"Save the results as {BASELINE_DIR}/<name>.json"),
+        baseline: str = typer.Option(None, help="Baseline name or JSON path to compare against"),
+        threshold: float = typer.Option(0.10, help="Relative change reported as slower/faster")):
+    """Run the scenarios, optionally saving a baseline and comparing against an earlier one."""
+    result = run_suite(scenarios, Scale(years=years, markets=markets, seed=seed, latency_ms=latency_ms),
+                       repeats=repeats, warmup=warmup, config_path=config, log=typer.echo)
+    if save_as:
+        typer.echo(f"Saved: {save(result, os.path.join(BASELINE_DIR, save_as + '.json'))}")
+    if baseline:
+        path = baseline if baseline.endswith(".json") else os.path.join(BASELINE_DIR, baseline + ".json")
+        rows = compare(result, load(path), threshold)
+        for r in rows:
+            typer.echo(f"{r['scenario']:<22} {r['baseline_s']} -> {r['run_s']}  x{r['ratio']}  {r['status']}")
+        if any(r["status"] == "slower" for r in rows): raise typer.Exit(1)
+
+if __name__ == "__main__":
+    app()
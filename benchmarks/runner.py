@@ -0,0 +1,83 @@
+from __future__ import annotations
+import os, sys, json, time, hashlib, platform, statistics, subprocess, datetime as dt
+from benchmarks.scenarios import SCENARIOS, BenchEnv, Scale
+from profiling import Profiler
+
+BASELINE_DIR = os.path.join("benchmarks", "baselines")
+
+def _versions() -> dict:
+    out = {"python": platform.python_version()}
+    for mod in ("numpy", "pandas", "statsmodels", "xgboost", "requests"):
+        try: out[mod] = __import__(mod).__version__
+        except Exception: pass
+    return out
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def _config_hash(cfg: dict) -> str:
+    return hashlib.sha1(json.dumps({k: v for k, v in cfg.items() if k != "cache"}, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+def run_scenario(env: BenchEnv, name: str, repeats: int = 3, warmup: int = 1) -> dict:
+    """Time ``repeats`` runs of a scenario after ``warmup`` untimed ones; each timed run is profiled for its
+    stage breakdown, peak RSS and HTTP counts (reported for the median run)."""
+    run, reset = SCENARIOS[name].setup(env)
+    for _ in range(warmup):
+        if reset: reset()
+        run()
+    runs = []
+    for _ in range(repeats):
+        if reset: reset()
+        prof = Profiler(sample_seconds=0.01)
+        with prof:
+            t0 = time.perf_counter(); run(); seconds = time.perf_counter() - t0
+        runs.append((seconds, prof.report()))
+    times = sorted(s for s, _ in runs)
+    median = statistics.median(times)
+    report = min(runs, key=lambda r: abs(r[0] - median))[1]
+    return {"median_s": round(median, 4), "min_s": round(times[0], 4), "max_s": round(times[-1], 4), "repeats": repeats,
+            "peak_rss_mb": report["peak_rss_mb"], "http": report["http"],
+            "stages": {k: v["total_s"] for k, v in report["stages"].items()}}
+
+def run_suite(names: list[str] | None = None, scale: Scale | None = None, repeats: int = 3, warmup: int = 1,
+              config_path: str = "config.yaml", log=print) -> dict:
+    scale = scale or Scale()
+    names = names or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown: raise ValueError(f"Unknown scenarios {unknown} (expected some of {list(SCENARIOS)})")
+    results = {}
+    with BenchEnv(scale, config_path) as env:
+        meta = {"created": dt.datetime.now().isoformat(timespec="seconds"), "commit": _git_commit(),
+                "platform": platform.platform(), "cpu_count": os.cpu_count(), "versions": _versions(),
+                "scale": vars(scale), "config": _config_hash(env.cfg), "rows": {"series": len(env.series), "panel": len(env.panel)}}
+        for name in names:
+            log(f"{name} ...")
+            results[name] = run_scenario(env, name, repeats, warmup)
+            log(f"  median {results[name]['median_s']:.4f}s (min {results[name]['min_s']:.4f}, max {results[name]['max_s']:.4f})")
+    return {"meta": meta, "results": results}
+
+def compare(run: dict, baseline: dict, threshold: float = 0.10) -> list[dict]:
+    """Median time per scenario against ``baseline``; ``status`` flags changes beyond ``threshold``."""
+    rows = []
+    for name, res in run["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            rows.append({"scenario": name, "baseline_s": None, "run_s": res["median_s"], "ratio": None, "status": "new"}); continue
+        ratio = res["median_s"] / old["median_s"] if old["median_s"] else None
+        status = "ok" if ratio is None or abs(ratio - 1) <= threshold else ("slower" if ratio > 1 else "faster")
+        rows.append({"scenario": name, "baseline_s": old["median_s"], "run_s": res["median_s"],
+                     "ratio": None if ratio is None else round(ratio, 3), "status": status})
+    if run["meta"].get("scale") != baseline.get("meta", {}).get("scale"):
+        print("Warning: baseline was recorded at a different scale", file=sys.stderr)
+    return rows
+
+def save(result: dict, path: str) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f: json.dump(result, f, indent=2)
+    return path
+
+def load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f: return json.load(f)
@@ -0,0 +1,162 @@
+from __future__ import annotations
+import os, sys, copy, shutil, tempfile, subprocess
+from dataclasses import dataclass
+from typing import Callable
+from benchmarks import synth
+from benchmarks.stubs import StubData, StubServer
+
+@dataclass
+class Scale:
+    years: float = 3
+    markets: int = 10
+    seed: int = 0
+    latency_ms: float = 20.0
+
+class BenchEnv:
+    """A scratch directory, the local API stand-ins and a config pointing every source at them.
+
+    Open-Meteo, data.gov.in and Agmarknet are served by ``StubServer``. yfinance's endpoints are not configurable,
+    so its series are written straight into a fresh fetch cache instead, which the pipeline then reads as a
+    cache hit; no scenario touches the network.
+    """
+    def __init__(self, scale: Scale, config_path: str = "config.yaml"):
+        from utils import load_config
+        self.scale = scale
+        self.root = tempfile.mkdtemp(prefix="rice-bench-")
+        self.series = synth.daily_prices(scale.years, scale.seed)
+        self.panel = synth.price_panel(scale.years, scale.markets, scale.seed)
+        self.stub = StubServer(StubData(self.panel, scale.seed), latency=scale.latency_ms / 1000.0)
+        cfg = copy.deepcopy(load_config(config_path))
+        cfg["cache"] = {"enabled": True, "path": self.path("cache.sqlite"), "ttl_hours": 24}
+        self.cfg = cfg
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def __enter__(self):
+        import weather, data_gov_india
+        self.stub.__enter__()
+        self._saved = {(weather, "OPEN_METEO_URL"): weather.OPEN_METEO_URL, (data_gov_india, "BASE"): data_gov_india.BASE,
+                       (data_gov_india, "SPOOL_ROOT"): data_gov_india.SPOOL_ROOT,
+                       (data_gov_india, "SCHEMA_CACHE"): data_gov_india.SCHEMA_CACHE}
+        weather.OPEN_METEO_URL = f"{self.stub.url}/v1/forecast"
+        data_gov_india.BASE = f"{self.stub.url}/resource"
+        data_gov_india.SPOOL_ROOT = self.path("datagov_pages")
+        data_gov_india.SCHEMA_CACHE = self.path("datagov_schema.json")
+        return self
+
+    def __exit__(self, *exc):
+        for (mod, name), value in self._saved.items(): setattr(mod, name, value)
+        self.stub.__exit__(*exc)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def reset_cache(self):
+        """A new fetch cache holding only the yfinance series (weather is fetched from the stand-in)."""
+        from cache import FetchCache
+        path = self.cfg["cache"]["path"]
+        if os.path.exists(path): os.remove(path)
+        cache = FetchCache(path, self.cfg["cache"]["ttl_hours"])
+        for key, meta in (self.cfg.get("indicators") or {}).items():
+            if not meta or not meta.get("enabled", False) or key not in synth.TICKERS: continue
+            idx = synth.date_index(max(self.scale.years, (meta.get("lookback_days", 365) + 30) / 365))
+            cache.write("yfinance", meta["ticker"], synth.indicator(key, idx, self.scale.seed).to_frame("close"),
+                        covers_from=idx[0])
+
+@dataclass
+class Scenario:
+    """``setup(env)`` returns ``(run, reset)``: ``run`` is timed, ``reset`` (or None) runs untimed before it."""
+    name: str
+    setup: Callable[[BenchEnv], tuple[Callable, Callable | None]]
+    doc: str = ""
+
+def _rolling_features(env: BenchEnv):
+    from tech_indicators import rolling_features
+    return (lambda: rolling_features(env.series)), None
+
+def _build_features(env: BenchEnv):
+    from pipeline import build_features
+    return (lambda: build_features(env.series, env.cfg)), env.reset_cache
+
+def _train_kwargs(env: BenchEnv) -> dict:
+    m = env.cfg.get("model", {})
+    return dict(sarimax_cfg=m.get("sarimax", {}), xgb_cfg=m.get("xgboost", {}), test_size_days=m.get("test_size_days", 60))
+
+def _train_models(env: BenchEnv):
+    from pipeline import build_features
+    from train import train_models
+    env.reset_cache()
+    feats = build_features(env.series, env.cfg)
+    return (lambda: train_models(env.series, feats, env.path("models"), **_train_kwargs(env))), None
+
+def _train_streaming(env: BenchEnv):
+    from pipeline import build_features
+    from train import train_models
+    env.reset_cache()
+    feats = build_features(env.series, env.cfg, path=env.path("features.npy"))
+    kw = _train_kwargs(env)
+    kw["xgb_cfg"] = {**kw["xgb_cfg"], "data": "quantile"}
+    return (lambda: train_models(env.series, feats, env.path("models_streaming"), **kw)), None
+
+def _forecast(env: BenchEnv):
+    from pipeline import build_features, make_future_features_builder, FeatureState
+    from train import train_models
+    from infer import forecast
+    env.reset_cache()
+    tr = train_models(env.series, build_features(env.series, env.cfg), env.path("models"), **_train_kwargs(env))
+    builder = make_future_features_builder(env.cfg, FeatureState.from_series(env.series))
+    horizons = env.cfg.get("horizons", [7, 30, 180])
+    return (lambda: forecast(tr.sarimax_model_path, tr.xgb_model_path, env.series, builder, horizons,
+                             env.path("out"), plot=False, intervals=env.cfg.get("intervals"))), None
+
+def _simulate_paths(env: BenchEnv):
+    from train import fit_sarimax
+    from infer import hybrid_paths, PATHS
+    import numpy as np
+    m = env.cfg.get("model", {}).get("sarimax", {})
+    sar = fit_sarimax(env.series.dropna(), order=tuple(m.get("order", (1, 1, 1))),
+                      seasonal_order=tuple(m.get("seasonal_order", (0, 1, 1, 7))), maxiter=m.get("maxiter", 50))
+    errors = np.random.default_rng(env.scale.seed).standard_normal(60)
+    return (lambda: hybrid_paths(sar, np.zeros(180), int(env.cfg.get("intervals", {}).get("paths", PATHS)), errors, 0)), None
+
+def _fetch_datagov(env: BenchEnv):
+    from data_gov_india import fetch_datagov_prices_csv
+    out = env.path("datagov.csv")
+    return (lambda: fetch_datagov_prices_csv("bench-key", "bench-resource", out, commodity_filter="Rice",
+                                             panel_csv=env.path("datagov_panel.csv"), resume=False)), None
+
+def _fetch_agmarknet(env: BenchEnv, sync: bool):
+    from agmarknet_api import fetch_basmati_prices_csv
+    out = env.path("agmarknet.csv")
+    date_from = str(env.panel["date"].min().date())
+    def reset():
+        if os.path.exists(out): os.remove(out)
+    return (lambda: fetch_basmati_prices_csv(out, variety_keywords=synth.VARIETIES, date_from=date_from,
+                                             base_url=env.stub.url, panel_csv=env.path("agmarknet_panel.csv"),
+                                             sync=sync)), reset
+
+HEAVY_MODULES = ("statsmodels", "xgboost", "sklearn", "yfinance", "matplotlib")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _startup(env: BenchEnv, code: str, light: bool):
+    """A fresh interpreter running ``code``; with ``light`` it also fails if any of ``HEAVY_MODULES`` got imported."""
+    if light:
+        code += f"\nimport sys; heavy = sorted({{m.split('.')[0] for m in sys.modules}} & {set(HEAVY_MODULES)!r})" \
+                "\nassert not heavy, f'heavy modules imported: {heavy}'"
+    return (lambda: subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, check=True, capture_output=True)), None
+
+SCENARIOS = {s.name: s for s in [
+    Scenario("import_cli", lambda env: _startup(env, "import cli", light=True), "fresh interpreter: import cli"),
+    Scenario("startup_fetch_help", lambda env: _startup(
+        env, "import sys, cli; sys.argv = ['cli.py', 'fetch-datagov', '--help']\ntry: cli.app()\nexcept SystemExit: pass", light=True),
+        "fresh interpreter: cli.py fetch-datagov --help, without loading the model stack"),
+    Scenario("import_pipeline", lambda env: _startup(env, "import pipeline", light=True), "fresh interpreter: import pipeline"),
+    Scenario("rolling_features", _rolling_features, "price features for the national series"),
+    Scenario("build_features", _build_features, "price + exogenous features; weather from the stand-in, yfinance cached"),
+    Scenario("train_models", _train_models, "SARIMAX + XGBoost fits on the built features"),
+    Scenario("train_streaming", _train_streaming, "train_models on memory-mapped features, XGBoost fed by chunks"),
+    Scenario("forecast", _forecast, "hybrid forecast for the configured horizons from saved artifacts"),
+    Scenario("simulate_paths", _simulate_paths, "Monte Carlo hybrid paths, 180 days, resampled innovations"),
+    Scenario("fetch_datagov", _fetch_datagov, "every data.gov.in page of the synthetic panel, concurrently"),
+    Scenario("fetch_agmarknet", lambda env: _fetch_agmarknet(env, sync=False), "one Agmarknet request for the whole range"),
+    Scenario("fetch_agmarknet_sync", lambda env: _fetch_agmarknet(env, sync=True), "windowed, concurrent Agmarknet sync"),
+]}
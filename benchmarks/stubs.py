@@ -0,0 +1,100 @@
+from __future__ import annotations
+import io, json, time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+from benchmarks import synth
+
+class StubData:
+    """What the stand-ins serve: one synthetic panel, exposed in each API's own shape."""
+    def __init__(self, panel: pd.DataFrame, seed: int = 0):
+        self.seed = seed
+        self.panel = panel
+        day = panel["date"].dt.strftime("%Y-%m-%d")
+        # data.gov.in retail/wholesale resource: lower-case fields, one record per centre and day
+        self.datagov = pd.DataFrame({"date": day, "state": panel["state"], "centre": panel["market"],
+                                     "commodity": "Rice", "variety": panel["variety"],
+                                     "retail": panel["modal_price"].astype(str), "wholesale": panel["min_price"].astype(str)})
+        self.datagov_records = self.datagov.to_dict("records")
+        self.agmarknet = panel.assign(date=day)
+
+class StubHandler(BaseHTTPRequestHandler):
+    data: StubData
+    latency: float = 0.0
+    counts: dict
+
+    def _send(self, code: int, body: bytes, ctype: str = "application/json"):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers(); self.wfile.write(body)
+
+    def _json(self, payload, code: int = 200):
+        self._send(code, json.dumps(payload).encode("utf-8"))
+
+    def do_GET(self):
+        if self.latency: time.sleep(self.latency)
+        url = urlparse(self.path)
+        qs = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        route = url.path.strip("/").split("/")[0] if url.path.strip("/") else ""
+        self.counts[route] = self.counts.get(route, 0) + 1
+        if url.path.startswith("/resource/"): return self._datagov(qs)
+        if url.path == "/agmarknet/prices": return self._agmarknet(qs)
+        if url.path == "/v1/forecast": return self._open_meteo(qs)
+        self._json({"error": f"unknown path {url.path}"}, 404)
+
+    def _datagov(self, qs: dict):
+        """Paged like api.data.gov.in: ``limit``/``offset``, a ``total`` count, JSON records or a CSV page."""
+        if not qs.get("api-key"): return self._json({"error": "Key not authorised"}, 403)
+        df, recs = self.data.datagov, self.data.datagov_records
+        if qs.get("from") or qs.get("to"):
+            keep = pd.Series(True, index=df.index)
+            if qs.get("from"): keep &= df["date"] >= qs["from"]
+            if qs.get("to"): keep &= df["date"] <= qs["to"]
+            df = df[keep]; recs = [recs[i] for i in df.index]
+        limit, offset = int(qs.get("limit", 10)), int(qs.get("offset", 0))
+        if qs.get("format") == "csv":
+            buf = io.StringIO(); df.iloc[offset:offset + limit].to_csv(buf, index=False)
+            return self._send(200, buf.getvalue().encode("utf-8"), "text/csv")
+        page = recs[offset:offset + limit]
+        self._json({"status": "ok", "total": len(recs), "count": len(page), "limit": str(limit),
+                    "offset": str(offset), "records": page})
+
+    def _agmarknet(self, qs: dict):
+        """A JSON list of market rows, filtered like the CEDA endpoint (commodity by substring)."""
+        df = self.data.agmarknet
+        if qs.get("commodity"): df = df[df["commodity"].str.contains(qs["commodity"], case=False, regex=False)]
+        for k in ("state", "market", "variety"):
+            if qs.get(k): df = df[df[k] == qs[k]]
+        if qs.get("from"): df = df[df["date"] >= qs["from"]]
+        if qs.get("to"): df = df[df["date"] <= qs["to"]]
+        self._json(df.head(int(qs.get("limit", 100000))).to_dict("records"))
+
+    def _open_meteo(self, qs: dict):
+        """``past_days`` of history plus the default 7 forecast days, as Open-Meteo's ``daily`` block."""
+        today = pd.Timestamp.today().normalize()
+        idx = pd.date_range(today - pd.Timedelta(days=int(qs.get("past_days", 0))), today + pd.Timedelta(days=6), freq="D")
+        w = synth.weather(idx, float(qs["latitude"]), self.data.seed)
+        self._json({"latitude": float(qs["latitude"]), "longitude": float(qs["longitude"]),
+                    "daily": {"time": [d.strftime("%Y-%m-%d") for d in idx],
+                              "temperature_2m_mean": w["temp_mean"].tolist(), "precipitation_sum": w["precip"].tolist()}})
+
+    def log_message(self, fmt, *args):
+        pass
+
+class StubServer:
+    """data.gov.in, CEDA Agmarknet and Open-Meteo stand-ins on one local port, with ``latency`` seconds added
+    to every response to mimic a network round trip."""
+    def __init__(self, data: StubData, latency: float = 0.0, host: str = "127.0.0.1"):
+        handler = type("Handler", (StubHandler,), {"data": data, "latency": latency, "counts": {}})
+        self.httpd = ThreadingHTTPServer((host, 0), handler)
+        self.httpd.daemon_threads = True
+        self.counts = handler.counts
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="bench-stub", daemon=True)
+
+    def __enter__(self):
+        self._thread.start(); return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown(); self.httpd.server_close()
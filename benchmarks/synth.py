@@ -0,0 +1,52 @@
+from __future__ import annotations
+import numpy as np, pandas as pd
+
+STATES = ["Punjab", "Haryana", "Uttar Pradesh", "Delhi", "Rajasthan", "Madhya Pradesh", "Bihar", "West Bengal"]
+VARIETIES = ["1121", "1509", "1718", "PB-1", "Sharbati"]
+TICKERS = {"usd_inr": ("USDINR=X", 83.0, 0.003), "brent": ("BZ=F", 80.0, 0.02)}
+
+def date_index(years: float, end: str | pd.Timestamp | None = None) -> pd.DatetimeIndex:
+    end = pd.Timestamp(end or pd.Timestamp.today()).normalize()
+    return pd.date_range(end - pd.Timedelta(days=int(round(365 * years)) - 1), end, freq="D")
+
+def _walk(rng: np.random.Generator, n: int, level: float, vol: float, season: float = 0.0) -> np.ndarray:
+    """Log random walk with an annual cycle; strictly positive."""
+    t = np.arange(n)
+    return level * np.exp(np.cumsum(rng.normal(0.0, vol, n)) + season * np.sin(2 * np.pi * t / 365.25))
+
+def daily_prices(years: float = 3, seed: int = 0, end=None) -> pd.Series:
+    """One national daily price series, shaped like ``load_prices`` output."""
+    idx = date_index(years, end)
+    rng = np.random.default_rng(seed)
+    return pd.Series(_walk(rng, len(idx), 3500.0, 0.006, 0.05), index=idx, name="price")
+
+def markets(n: int) -> list[dict]:
+    return [{"state": STATES[i % len(STATES)], "market": f"Market-{i:04d}", "variety": VARIETIES[i % len(VARIETIES)],
+             "commodity": "Paddy(Dhan)(Basmati)"} for i in range(n)]
+
+def price_panel(years: float = 3, n_markets: int = 10, seed: int = 0, end=None, missing: float = 0.05) -> pd.DataFrame:
+    """Long raw market rows (date, state, market, variety, commodity, min/max/modal price): one row per market
+    and trading day, with a ``missing`` share of days dropped at random as in real arrival data."""
+    idx = date_index(years, end)
+    rng = np.random.default_rng(seed)
+    frames = []
+    for m in markets(n_markets):
+        modal = _walk(rng, len(idx), rng.uniform(2500, 4500), 0.008, rng.uniform(0.02, 0.08))
+        spread = rng.uniform(0.02, 0.08, len(idx))
+        keep = rng.random(len(idx)) >= missing
+        frames.append(pd.DataFrame({"date": idx[keep], **m, "min_price": (modal * (1 - spread))[keep].round(),
+                                    "max_price": (modal * (1 + spread))[keep].round(), "modal_price": modal[keep].round()}))
+    return pd.concat(frames, ignore_index=True).sort_values(["date", "market"], ignore_index=True)
+
+def indicator(key: str, index: pd.DatetimeIndex, seed: int = 0) -> pd.Series:
+    ticker, level, vol = TICKERS[key]
+    rng = np.random.default_rng(seed + sum(map(ord, key)))
+    return pd.Series(_walk(rng, len(index), level, vol), index=index, name=ticker)
+
+def weather(index: pd.DatetimeIndex, lat: float, seed: int = 0) -> pd.DataFrame:
+    """Daily mean temperature and precipitation with a seasonal cycle, keyed on latitude."""
+    rng = np.random.default_rng(seed + int(lat * 1000))
+    doy = index.dayofyear.to_numpy()
+    temp = 25 - 0.3 * (lat - 25) + 8 * np.sin(2 * np.pi * (doy - 100) / 365.25) + rng.normal(0, 1.5, len(index))
+    rain = np.where(rng.random(len(index)) < 0.2 + 0.4 * ((doy > 170) & (doy < 270)), rng.gamma(1.5, 6, len(index)), 0.0)
+    return pd.DataFrame({"temp_mean": temp.round(1), "precip": rain.round(1)}, index=index)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+import os, time, sqlite3
+from contextlib import closing
+from typing import Callable, Optional
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (source TEXT, key TEXT, fetched_at REAL, covers_from TEXT, cols TEXT,
+                                 PRIMARY KEY (source, key));
+CREATE TABLE IF NOT EXISTS obs (source TEXT, key TEXT, date TEXT, col TEXT, value REAL,
+                                PRIMARY KEY (source, key, date, col));
+"""
+
+class FetchCache:
+    """On-disk (SQLite) store of daily frames keyed by (source, key), e.g. ("yfinance", "BZ=F")."""
+    def __init__(self, path: str = "artifacts/cache.sqlite", ttl_hours: float = 12):
+        self.path = path
+        self.ttl = float(ttl_hours) * 3600
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _meta(self, con, source: str, key: str):
+        return con.execute("SELECT fetched_at, covers_from, cols FROM meta WHERE source=? AND key=?",
+                           (source, key)).fetchone()
+
+    def read(self, source: str, key: str) -> Optional[pd.DataFrame]:
+        with closing(self._connect()) as con:
+            meta = self._meta(con, source, key)
+            if meta is None: return None
+            rows = con.execute("SELECT date, col, value FROM obs WHERE source=? AND key=?", (source, key)).fetchall()
+        cols = meta[2].split(",") if meta[2] else []
+        if not rows: return pd.DataFrame(columns=cols, index=pd.DatetimeIndex([], name="date"), dtype=float)
+        df = pd.DataFrame(rows, columns=["date", "col", "value"]).pivot(index="date", columns="col", values="value")
+        df.index = pd.to_datetime(df.index); df.columns.name = None
+        return df.reindex(columns=cols or list(df.columns)).sort_index()
+
+    def write(self, source: str, key: str, df: pd.DataFrame, covers_from: pd.Timestamp | None = None):
+        """Upsert the rows of ``df`` and mark (source, key) as fetched now."""
+        long = df.rename_axis("date").reset_index().melt(id_vars="date", var_name="col", value_name="value").dropna()
+        recs = [(source, key, d.strftime("%Y-%m-%d"), str(c), float(v))
+                for d, c, v in zip(pd.to_datetime(long["date"]), long["col"], long["value"])]
+        with closing(self._connect()) as con, con:
+            old = self._meta(con, source, key)
+            if covers_from is None and old is not None: covers_from = pd.Timestamp(old[1])
+            cols = ",".join(map(str, df.columns)) if len(df.columns) else (old[2] if old else "")
+            con.executemany("INSERT OR REPLACE INTO obs VALUES (?,?,?,?,?)", recs)
+            con.execute("INSERT OR REPLACE INTO meta VALUES (?,?,?,?,?)",
+                        (source, key, time.time(), str(pd.Timestamp(covers_from).date()) if covers_from is not None else None, cols))
+
+    def fetch(self, source: str, key: str, fetch_fn: Callable[[pd.Timestamp], pd.DataFrame],
+              start: pd.Timestamp) -> pd.DataFrame:
+        """Return the cached frame for (source, key), calling ``fetch_fn(since)`` only when needed.
+
+        A fresh entry (younger than the TTL) that reaches back to ``start`` is returned as-is. A stale one is
+        topped up from its last cached day; an entry that does not reach back far enough is refetched in full.
+        """
+        start = pd.Timestamp(start).normalize()
+        with closing(self._connect()) as con:
+            meta = self._meta(con, source, key)
+        if meta is not None and meta[1] and pd.Timestamp(meta[1]) <= start:
+            cached = self.read(source, key)
+            if time.time() - meta[0] < self.ttl:
+                return cached
+            fetched_day = pd.Timestamp.fromtimestamp(meta[0]).normalize()
+            last = cached.index.max() if len(cached) else start
+            since = max(min(last, fetched_day) - pd.Timedelta(days=1), start)
+            new = fetch_fn(since)
+            self.write(source, key, new if new is not None else cached.iloc[:0])
+            return cached if new is None or new.empty else new.combine_first(cached)[list(cached.columns) or list(new.columns)]
+        new = fetch_fn(start)
+        if new is None: new = pd.DataFrame()
+        self.write(source, key, new, covers_from=start)
+        return new
+
+def open_cache(cfg: dict) -> FetchCache | None:
+    c = cfg.get("cache", {}) or {}
+    if not c.get("enabled", False): return None
+    return FetchCache(c.get("path", os.path.join("artifacts", "cache.sqlite")), c.get("ttl_hours", 12))
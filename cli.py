@@ -1,35 +1,148 @@
 
 from __future__ import annotations
 import typer
-from pipeline import run_pipeline
-from data_sources.agmarknet_api import fetch_basmati_prices_csv
-from data_sources.data_gov_india import fetch_datagov_prices_csv
+
+# each command imports what it runs: fetch commands never load statsmodels, xgboost, yfinance or matplotlib
 
 app = typer.Typer(help="Rice Predictions CLI")
 
+def _configure_fetch(config: str):
+    """Apply the config's ``fetch`` section (worker bound and per-source retries) before a download."""
+    from net import configure
+    from utils import load_config
+    configure(load_config(config).get("fetch"))
+
 @app.command("run-all")
 def run_all(config: str = typer.Option("config.yaml", help="Config file"),
-            horizons: list[int] = typer.Option(None, help="Horizons in days, e.g., --horizons 7 30 180")):
-    run_pipeline(config_path=config, horizons=horizons)
+            horizons: list[int] = typer.Option(None, help="Horizons in days, e.g., --horizons 7 30 180"),
+            plots: str = typer.Option(None, help="inline, background or off (defaults to output.plots)"),
+            force_stage: list[str] = typer.Option(None, help="Recompute this stage and everything after it, e.g. --force-stage train"),
+            dry_run: bool = typer.Option(False, help="Print which stages would run or be reused, without running them")):
+    """Fetch, build features, train and forecast; stages whose inputs are unchanged reuse their stored outputs."""
+    from pipeline import run_pipeline
+    run_pipeline(config_path=config, horizons=horizons, plots=plots, force=force_stage or (), dry_run=dry_run)
+
+@app.command("update")
+def update(config: str = typer.Option("config.yaml", help="Config file"),
+           horizons: list[int] = typer.Option(None, help="Horizons in days, e.g., --horizons 7 30 180"),
+           plots: str = typer.Option(None, help="inline, background or off (defaults to output.plots)")):
+    """Extend the saved models with new prices (full refit only when scheduled or drifting), then forecast."""
+    from update import run_update
+    run_update(config_path=config, horizons=horizons, plots=plots)
+
+@app.command("run-panel")
+def run_panel_cmd(config: str = typer.Option("config.yaml", help="Config file"),
+                  panel_csv: str = typer.Option(None, help="Long Date,<keys>,Price CSV (defaults to the configured price source)"),
+                  workers: int = typer.Option(None, help="Worker processes (defaults to panel.max_workers)"),
+                  horizons: list[int] = typer.Option(None, help="Horizons in days, e.g., --horizons 7 30 180")):
+    from panel import run_panel
+    run_panel(config_path=config, horizons=horizons, panel_csv=panel_csv, max_workers=workers)
+
+@app.command("run-hierarchy")
+def run_hierarchy_cmd(config: str = typer.Option("config.yaml", help="Config file"),
+                      panel_csv: str = typer.Option(None, help="Long Date,<keys>,Price CSV (defaults to the configured price source)"),
+                      method: str = typer.Option(None, help="bottom_up, ols or mint (defaults to hierarchy.method)"),
+                      workers: int = typer.Option(None, help="Worker processes (defaults to hierarchy.max_workers)"),
+                      horizons: list[int] = typer.Option(None, help="Horizons in days; the longest one is forecast")):
+    """Forecast every national, state, market and panel series and reconcile them into coherent forecasts."""
+    from hierarchy import run_hierarchy
+    run_hierarchy(config_path=config, horizons=horizons, panel_csv=panel_csv, method=method, max_workers=workers)
+
+@app.command("backtest")
+def backtest(config: str = typer.Option("config.yaml", help="Config file"),
+             origins: int = typer.Option(None, help="Number of forecast origins (defaults to backtest.origins)"),
+             step_days: int = typer.Option(None, help="Days between consecutive origins"),
+             retrain_every: int = typer.Option(None, help="Retrain the XGBoost residual model every N origins"),
+             workers: int = typer.Option(None, help="Worker processes for blocks of origins"),
+             horizons: list[int] = typer.Option(None, help="Horizons in days, e.g., --horizons 7 30 180")):
+    from backtest import run_backtest
+    run_backtest(config_path=config, horizons=horizons, n_origins=origins, step_days=step_days,
+                 retrain_every=retrain_every, max_workers=workers)
+
+@app.command("tune")
+def tune_cmd(config: str = typer.Option("config.yaml", help="Config file"),
+             budget: float = typer.Option(None, help="Wall-clock budget in seconds (defaults to tune.budget_seconds)"),
+             workers: int = typer.Option(None, help="Worker processes (defaults to tune.max_workers)"),
+             overlay: str = typer.Option(None, help="Where to write the best settings (defaults to tune.overlay)")):
+    """Search SARIMAX orders and XGBoost settings with successive halving; write the best as a config overlay."""
+    from tune import run_tune
+    run_tune(config_path=config, budget_seconds=budget, max_workers=workers, overlay_path=overlay)
+
+@app.command("what-if")
+def what_if(scenarios: str = typer.Argument(..., help="YAML/JSON list of {name, shocks: {column: {pct|shift|path}}}"),
+            config: str = typer.Option("config.yaml", help="Config file"),
+            horizon: int = typer.Option(None, help="Days ahead (defaults to the longest configured horizon)"),
+            model: str = typer.Option("", help="Model under artifacts/models, e.g. panel/<slug> (default: main)")):
+    """Forecast exogenous what-if scenarios (e.g. USD/INR +3%, rainfall -30%) with the trained models, all at once."""
+    from whatif import run_whatif
+    run_whatif(scenarios, config_path=config, horizon=horizon, model=model)
+
+@app.command("serve")
+def serve_cmd(config: str = typer.Option("config.yaml", help="Config file"),
+              host: str = typer.Option(None, help="Bind address (defaults to server.host)"),
+              port: int = typer.Option(None, help="Port (defaults to server.port)")):
+    from server import serve
+    serve(config_path=config, host=host, port=port)
+
+@app.command("profile")
+def profile(target: str = typer.Option("run-all", help="Command to profile: run-all or update"),
+            config: str = typer.Option("config.yaml", help="Config file"),
+            horizons: list[int] = typer.Option(None, help="Horizons in days, e.g., --horizons 7 30 180"),
+            plots: str = typer.Option(None, help="inline, background or off (defaults to output.plots)"),
+            cprofile: list[str] = typer.Option(None, help="Also run these stages under cProfile, e.g. --cprofile sarimax_full"),
+            out_dir: str = typer.Option("artifacts/profiles", help="Where the JSON report and Chrome trace go"),
+            baseline: str = typer.Option(None, help="Earlier report JSON to compare stage times against")):
+    """Run a pipeline command with stage timers, sampled RSS and per-source HTTP counts."""
+    from profiling import profile_run
+    if target not in ("run-all", "update"): raise typer.BadParameter("target must be one of run-all, update")
+    if target == "run-all": from pipeline import run_pipeline as runner
+    else: from update import run_update as runner
+    report = profile_run(lambda: runner(config_path=config, horizons=horizons, plots=plots),
+                         out_dir=out_dir, cprofile=cprofile or (), baseline=baseline)
+    typer.echo(f"Wall {report['wall_s']}s, peak RSS {report['peak_rss_mb']} MB")
+    for name, s in sorted(report["stages"].items(), key=lambda kv: -kv[1]["total_s"]):
+        typer.echo(f"  {name:<32} {s['total_s']:>9.3f}s  x{s['count']:<4} peak {s['peak_rss_mb']} MB")
+    for source, h in report["http"].items():
+        traffic = "requests/bytes not measured" if h["requests"] is None else f"{h['requests']} requests, {h['bytes']} bytes"
+        typer.echo(f"  http {source:<27} {h['calls']} calls, {traffic}, {h['retries']} retries, {h['seconds']:.3f}s")
+    for row in report.get("compare", [])[:10]:
+        typer.echo(f"  vs baseline {row['stage']:<24} {row['baseline_s']} -> {row['run_s']} ({row['delta_s']:+}s)"
+                   if row["delta_s"] is not None else f"  vs baseline {row['stage']:<24} {row['baseline_s']} -> {row['run_s']}")
+    typer.echo(f"Saved: {', '.join(report['paths'].values())}")
 
 @app.command("fetch-agmarknet")
-def fetch_agmarknet(out_csv: str = typer.Option("data/basmati_prices.csv"),
+def fetch_agmarknet(config: str = typer.Option("config.yaml", help="Config file (fetch.max_workers and fetch.retry)"),
+                    out_csv: str = typer.Option("data/basmati_prices.csv"),
                     state: str = typer.Option(None), market: str = typer.Option(None),
                     variety_keywords: str = typer.Option("Basmati,1121,1509,1718,PB-1"),
                     date_from: str = typer.Option(None), date_to: str = typer.Option(None),
-                    commodity_name: str = typer.Option("Paddy")):
+                    commodity_name: str = typer.Option("Paddy"),
+                    panel_csv: str = typer.Option(None, help="Also save per state/market/variety prices here"),
+                    sync: bool = typer.Option(False, help="Only fetch dates after the latest stored one and merge"),
+                    window_days: int = typer.Option(30, help="Days per concurrent request window in --sync mode"),
+                    store: str = typer.Option(None, help="Also upsert the raw rows into this SQLite price store")):
+    from agmarknet_api import fetch_basmati_prices_csv
+    _configure_fetch(config)
     keys = [k.strip() for k in variety_keywords.split(",") if k.strip()]
-    path = fetch_basmati_prices_csv(out_csv, state, market, keys, date_from, date_to, commodity_name)
+    path = fetch_basmati_prices_csv(out_csv, state, market, keys, date_from, date_to, commodity_name, panel_csv=panel_csv,
+                                    sync=sync, window_days=window_days, store=store)
     typer.echo(f"Saved: {path}")
 
 @app.command("fetch-datagov")
-def fetch_datagov(api_key: str = typer.Option(...),
+def fetch_datagov(config: str = typer.Option("config.yaml", help="Config file (fetch.max_workers and fetch.retry)"),
+                  api_key: str = typer.Option(...),
                   resource_id: str = typer.Option(...),
                   out_csv: str = typer.Option("data/basmati_prices.csv"),
                   commodity: str = typer.Option("Rice"),
                   state: str = typer.Option(None), centre: str = typer.Option(None),
-                  date_from: str = typer.Option(None), date_to: str = typer.Option(None)):
-    path = fetch_datagov_prices_csv(api_key, resource_id, out_csv, commodity, state, centre, date_from, date_to)
+                  date_from: str = typer.Option(None), date_to: str = typer.Option(None),
+                  panel_csv: str = typer.Option(None, help="Also save per state/centre prices here (State,Market,Variety keys)"),
+                  resume: bool = typer.Option(True, help="Continue an interrupted download from its saved pages"),
+                  store: str = typer.Option(None, help="Also upsert the cleaned rows into this SQLite price store")):
+    from data_gov_india import fetch_datagov_prices_csv
+    _configure_fetch(config)
+    path = fetch_datagov_prices_csv(api_key, resource_id, out_csv, commodity, state, centre, date_from, date_to,
+                                    panel_csv=panel_csv, resume=resume, store=store)
     typer.echo(f"Saved: {path}")
 
 if __name__ == "__main__":
@@ -10,3 +10,18 @@ def load_price_csv(path: str, date_col: str = "Date", price_col: str = "Price",
     df = df.sort_values(date_col).set_index(date_col)
     s = df[price_col].astype(float).asfreq(freq).ffill()
     return s.rename("price")
+
+def load_panel_csv(path: str, keys: list[str], date_col: str = "Date", price_col: str = "Price",
+                   freq: str = "D") -> dict[tuple, pd.Series]:
+    """Read a long ``Date,<keys...>,Price`` CSV into one daily, forward-filled series per key tuple."""
+    df = pd.read_csv(path)
+    missing = [c for c in [date_col, price_col, *keys] if c not in df.columns]
+    if missing:
+        raise ValueError(f"Panel CSV is missing columns {missing}. Found: {df.columns.tolist()}")
+    df[date_col] = pd.to_datetime(df[date_col])
+    out = {}
+    for key, g in df.groupby(keys, sort=True):
+        key = key if isinstance(key, tuple) else (key,)
+        s = g.groupby(date_col)[price_col].mean().sort_index().astype(float).asfreq(freq).ffill()
+        out[key] = s.rename("price")
+    return out
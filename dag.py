@@ -0,0 +1,141 @@
+from __future__ import annotations
+import os, json, time, shutil, hashlib, datetime as dt
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable
+import numpy as np, pandas as pd
+from profiling import stage as timed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+META = "stage.json"
+
+def _feed(h, obj):
+    if isinstance(obj, (pd.Series, pd.DataFrame)):
+        h.update(b"pd"); _feed(h, [str(obj.dtypes) if isinstance(obj, pd.Series) else list(map(str, obj.dtypes)),
+                                   list(map(str, obj.columns)) if isinstance(obj, pd.DataFrame) else str(obj.name)])
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(f"nd{obj.dtype.str}{obj.shape}".encode()); h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"[{len(obj)}".encode())
+        for item in obj: _feed(h, item)
+    elif isinstance(obj, dict):
+        h.update(f"{{{len(obj)}".encode())
+        for k in sorted(obj, key=str): _feed(h, str(k)); _feed(h, obj[k])
+    else:
+        h.update(json.dumps(obj, sort_keys=True, default=str).encode())
+
+def fingerprint(*parts) -> str:
+    """sha256 over ``parts``: arrays and pandas objects by content, containers recursively, the rest as JSON."""
+    h = hashlib.sha256()
+    _feed(h, list(parts))
+    return h.hexdigest()
+
+@lru_cache(maxsize=None)
+def code_version(files: tuple[str, ...]) -> str:
+    """Content hash of the given source files (relative to this directory)."""
+    h = hashlib.sha256()
+    for name in files:
+        h.update(name.encode())
+        with open(os.path.join(HERE, name), "rb") as f: h.update(f.read())
+    return h.hexdigest()
+
+@dataclass
+class Stage:
+    """One step of a pipeline.
+
+    ``run(inputs, out_dir)`` gets the values of ``deps`` by name, writes whatever it produces under ``out_dir``
+    and returns the stage's value; ``load(out_dir)`` rebuilds that value from the files. A stage without ``load``
+    is a source: it runs every time (with ``out_dir`` None) and is fingerprinted by what it returns, so stages
+    below unchanged data stay cached. Every other stage is fingerprinted by its ``config`` sections, the
+    ``code`` files and the fingerprints of its ``deps``.
+    """
+    name: str
+    run: Callable[[dict, str | None], object]
+    deps: tuple[str, ...] = ()
+    config: tuple[str, ...] = ()
+    code: tuple[str, ...] = ()
+    load: Callable[[str], object] | None = None
+
+class ArtifactStore:
+    """Stage outputs under ``root/<stage>/<fingerprint>``; an entry counts once its ``stage.json`` is written.
+    The ``keep`` most recently used entries of each stage are kept."""
+    def __init__(self, root: str, keep: int = 5):
+        self.root, self.keep = root, keep
+
+    def path(self, name: str, fp: str) -> str:
+        return os.path.join(self.root, name, fp[:16])
+
+    def has(self, name: str, fp: str) -> bool:
+        return os.path.exists(os.path.join(self.path(name, fp), META))
+
+    def touch(self, name: str, fp: str):
+        os.utime(os.path.join(self.path(name, fp), META))
+
+    def begin(self, name: str, fp: str) -> str:
+        path = self.path(name, fp)
+        shutil.rmtree(path, ignore_errors=True); os.makedirs(path)
+        return path
+
+    def commit(self, name: str, fp: str, **info):
+        with open(os.path.join(self.path(name, fp), META), "w", encoding="utf-8") as f:
+            json.dump({"stage": name, "fingerprint": fp, "created": dt.datetime.now().isoformat(timespec="seconds"), **info}, f, indent=2)
+        self.prune(name)
+
+    def prune(self, name: str):
+        base = os.path.join(self.root, name)
+        entries = sorted((e for e in os.scandir(base) if e.is_dir()),
+                         key=lambda e: os.path.getmtime(os.path.join(e.path, META)) if os.path.exists(os.path.join(e.path, META)) else 0,
+                         reverse=True)
+        for e in entries[self.keep:]:
+            shutil.rmtree(e.path, ignore_errors=True)
+
+def downstream(stages: list[Stage], names) -> set[str]:
+    """``names`` and every stage that depends on them, directly or not."""
+    out = set(names)
+    for s in stages:
+        if any(d in out for d in s.deps): out.add(s.name)
+    return out
+
+def run_dag(stages: list[Stage], cfg: dict, store: ArtifactStore, force=(), dry_run: bool = False) -> tuple[dict, list[dict]]:
+    """Run ``stages`` (in dependency order), reusing stored outputs whose fingerprint is unchanged.
+
+    Stages named in ``force`` are recomputed along with everything downstream of them. With ``dry_run`` only
+    the sources run; the plan says what the other stages would do. Returns (values by stage, plan rows).
+    """
+    known = {s.name for s in stages}
+    unknown = [n for n in force if n not in known]
+    if unknown:
+        raise ValueError(f"Unknown stage(s) {unknown}; stages are {[s.name for s in stages]}")
+    forced = downstream(stages, force)
+    values, fps, plan = {}, {}, []
+    for s in stages:
+        t0 = time.perf_counter()
+        if s.load is None:
+            with timed(f"stage:{s.name}"):
+                values[s.name] = s.run({d: values[d] for d in s.deps}, None)
+            fps[s.name] = fingerprint(s.name, {k: cfg.get(k) for k in s.config}, values[s.name])
+            action = "source"
+        else:
+            fps[s.name] = fingerprint(s.name, {k: cfg.get(k) for k in s.config}, code_version(s.code),
+                                      [fps[d] for d in s.deps])
+            cached = s.name not in forced and store.has(s.name, fps[s.name])
+            action = "cached" if cached else ("forced" if s.name in forced else "run")
+            if not dry_run:
+                with timed(f"stage:{s.name}", action=action):
+                    if cached:
+                        values[s.name] = s.load(store.path(s.name, fps[s.name])); store.touch(s.name, fps[s.name])
+                    else:
+                        values[s.name] = s.run({d: values[d] for d in s.deps}, store.begin(s.name, fps[s.name]))
+                        store.commit(s.name, fps[s.name], deps={d: fps[d] for d in s.deps},
+                                     seconds=round(time.perf_counter() - t0, 4))
+        plan.append({"stage": s.name, "action": action, "fingerprint": fps[s.name][:12],
+                     "seconds": None if dry_run and s.load is not None else round(time.perf_counter() - t0, 4)})
+    return values, plan
+
+def print_plan(plan: list[dict], dry_run: bool = False):
+    verb = {"source": "read", "cached": "cached", "run": "would run" if dry_run else "ran",
+            "forced": "would run (forced)" if dry_run else "ran (forced)"}
+    for row in plan:
+        secs = f"  {row['seconds']:.3f}s" if row["seconds"] is not None else ""
+        print(f"  {row['stage']:<10} {verb[row['action']]:<19} {row['fingerprint']}{secs}")
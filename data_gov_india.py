@@ -1,9 +1,21 @@
-
 from __future__ import annotations
-import os, io, re
+import os, io, re, json, glob, shutil, hashlib
+from functools import partial
 import pandas as pd, requests
+from net import session, with_retry, fetch_all
+from price_store import PriceStore
 
 BASE = "https://api.data.gov.in/resource"
+# the panel CSV has the same key columns as Agmarknet's (agmarknet_api.PANEL_KEYS and the default panel.keys):
+# centre is the market, and the commodity stands in for the variety when a resource has none
+PANEL_KEYS = {"state": "State", "centre": "Market", "variety": "Variety"}
+DATE_COLUMNS = ["date", "reported_date", "price_date", "created_date", "month", "day"]
+PRICE_COLUMNS = ["retail", "wholesale", "modal_price", "price", "wholesale_price", "retail_price"]
+KEY_COLUMNS = ["commodity", "state", "centre", "variety"]
+PAGE_LIMIT = 1000
+SAMPLE_ROWS = 500
+SPOOL_ROOT = os.path.join("artifacts", "datagov_pages")
+SCHEMA_CACHE = os.path.join("artifacts", "datagov_schema.json")
 
 def _extract_resource_id(s: str) -> str:
     s = (s or "").strip()
@@ -12,81 +24,199 @@ def _extract_resource_id(s: str) -> str:
     if s.startswith("resource/"): return s.split("/", 1)[1]
     return s
 
-def fetch_datagov_prices_csv(api_key: str, resource_id: str, out_csv: str = "basmati_prices.csv",
-                             commodity_filter: str = "Rice", state: str | None = None,
-                             centre: str | None = None, date_from: str | None = None,
-                             date_to: str | None = None, prefer_csv: bool = False) -> str:
-    """Fetch from data.gov.in and save Date,Price CSV. Always saves in working dir."""
-    rid = _extract_resource_id(resource_id)
-    if not rid:
-        raise ValueError("Invalid Resource ID: use the UUID (e.g., 9ef84268-d588-465a-a308-a864a43d0070).")
-    url = f"{BASE}/{rid}"
-    session = requests.Session()
-    limit, offset, rows = 1000, 0, []
-
-    while True:
-        params = {"api-key": api_key, "limit": limit, "offset": offset, "format": "csv" if prefer_csv else "json"}
-        if date_from: params["from"] = date_from
-        if date_to: params["to"] = date_to
-        r = session.get(url, params=params, timeout=45)
-        if r.status_code in (404, 405):
-            raise requests.HTTPError(f"{r.status_code} for {url}. Check Resource ID rid='{rid}'. Full: {r.url}", response=r)
-        r.raise_for_status()
-        ct = (r.headers.get("content-type") or "").lower()
-        if prefer_csv or "csv" in ct:
-            df_chunk = pd.read_csv(io.StringIO(r.text))
-            if df_chunk.empty: break
-            rows.append(df_chunk); break
-        else:
+def _get(url: str, params: dict) -> requests.Response:
+    r = session().get(url, params=params, timeout=45)
+    if r.status_code in (404, 405):
+        raise requests.HTTPError(f"{r.status_code} for {url}. Check Resource ID. Full: {r.url}", response=r)
+    r.raise_for_status()
+    return r
+
+def _payload(r: requests.Response) -> dict:
+    try:
+        return r.json()
+    except Exception as e:
+        raise ValueError(f"Non-JSON response (first 300 chars): {(r.text or '')[:300]}") from e
+
+def _infer_schema(sample: pd.DataFrame) -> dict:
+    """Pick the date, price and key columns of a resource from a sample of its rows (original column names)."""
+    names = {str(c).lower(): c for c in sample.columns}
+    dates = [c for c in DATE_COLUMNS if c in names]
+    if not dates:
+        for c in names:
             try:
-                payload = r.json()
-            except Exception as e:
-                raise ValueError(f"Non-JSON response (first 300 chars): {(r.text or '')[:300]}") from e
-            chunk = payload.get("records", [])
-            if not chunk: break
-            rows.extend(chunk)
-            if len(chunk) < limit: break
-            offset += limit
+                pd.to_datetime(sample[names[c]]); dates.append(c); break
+            except Exception: pass
+    if not dates:
+        raise ValueError("No date-like column found in dataset.")
+    prices = [c for c in PRICE_COLUMNS if c in names]
+    if not prices:
+        prices = [c for c in names if c != dates[0] and pd.to_numeric(sample[names[c]], errors="coerce").notna().any()]
+        if not prices:
+            raise ValueError("No numeric price column detected.")
+    keys = [c for c in KEY_COLUMNS if c in names and c not in (dates[0], prices[0])]
+    return {"date": dates[0], "price": prices[0], "keys": keys,
+            "usecols": [str(names[c]) for c in (dates[0], prices[0], *keys)]}
 
-    if not rows:
-        pd.DataFrame(columns=["Date","Price"]).to_csv(out_csv, index=False)
-        return out_csv
+def _load_schema(rid: str) -> dict | None:
+    try:
+        with open(SCHEMA_CACHE, "r", encoding="utf-8") as f: return json.load(f).get(rid)
+    except (OSError, ValueError):
+        return None
+
+def _save_schema(rid: str, schema: dict):
+    try:
+        with open(SCHEMA_CACHE, "r", encoding="utf-8") as f: cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[rid] = schema
+    os.makedirs(os.path.dirname(SCHEMA_CACHE) or ".", exist_ok=True)
+    with open(SCHEMA_CACHE + ".tmp", "w", encoding="utf-8") as f: json.dump(cache, f, indent=1)
+    os.replace(SCHEMA_CACHE + ".tmp", SCHEMA_CACHE)
+
+def _resolve_schema(rid: str, sample: pd.DataFrame, cached: dict | None) -> dict | None:
+    """The cached schema of ``rid`` if the sample still has its columns, else one inferred from the sample and cached."""
+    if cached is not None and set(cached["usecols"]) <= set(map(str, sample.columns)): return cached
+    if sample.empty: return None
+    schema = _infer_schema(sample.head(SAMPLE_ROWS))
+    _save_schema(rid, schema)
+    return schema
+
+def _typed(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """Lower-case columns with the schema's dtypes: datetime date, float price and categorical keys."""
+    df.columns = [str(c).lower() for c in df.columns]
+    df[schema["date"]] = pd.to_datetime(df[schema["date"]], errors="coerce")
+    df[schema["price"]] = pd.to_numeric(df[schema["price"]], errors="coerce")
+    for c in schema["keys"]:
+        if c in df.columns: df[c] = df[c].astype("category")
+    return df
+
+def _page_frame(records: list[dict], schema: dict) -> pd.DataFrame:
+    """One page of records as a typed frame holding only the schema's columns."""
+    return _typed(pd.DataFrame.from_records(records, columns=schema["usecols"]), schema)
+
+def _page_path(spool: str, offset: int) -> str:
+    return os.path.join(spool, f"{offset:010d}.pkl")
 
-    if isinstance(rows[0], pd.DataFrame):
-        df = pd.concat(rows, ignore_index=True)
+def _save_page(spool: str, offset: int, df: pd.DataFrame):
+    tmp = _page_path(spool, offset) + ".tmp"
+    df.to_pickle(tmp); os.replace(tmp, _page_path(spool, offset))  # a page file exists only once complete
+
+def _fetch_page(url: str, params: dict, schema: dict, spool: str, offset: int, limit: int) -> int:
+    records = _payload(with_retry("datagov", _get, url, {**params, "limit": limit, "offset": offset})).get("records", [])
+    _save_page(spool, offset, _page_frame(records, schema))
+    return len(records)
+
+def _download_pages(url: str, params: dict, rid: str, spool: str,
+                    limit: int = PAGE_LIMIT) -> tuple[list[str], dict | None]:
+    """Fetch every page of a JSON resource into ``spool``; return the page files in offset order and the schema.
+
+    The first response gives the record total and, unless the resource's schema is already cached, the sample
+    it is inferred from; the remaining pages are then requested concurrently. Pages already in ``spool`` from
+    an interrupted run are not requested again.
+    """
+    os.makedirs(spool, exist_ok=True)
+    meta_path = os.path.join(spool, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f: total = json.load(f)["total"]
+        schema = _load_schema(rid)
+    else:
+        payload = _payload(with_retry("datagov", _get, url, {**params, "limit": limit, "offset": 0}))
+        records = payload.get("records", [])
+        schema = _resolve_schema(rid, pd.DataFrame.from_records(records[:SAMPLE_ROWS]), _load_schema(rid))
+        if schema is None: return [], None
+        _save_page(spool, 0, _page_frame(records, schema))
+        total = int(payload["total"]) if str(payload.get("total", "")).isdigit() else None
+        with open(meta_path, "w", encoding="utf-8") as f: json.dump({"total": total, "limit": limit}, f)
+    if schema is None:
+        raise RuntimeError(f"No cached schema for resource {rid}; rerun with resume=False")
+    if total is None:  # no record count: page serially from the last completed offset until a short page
+        offset = 0
+        while os.path.exists(_page_path(spool, offset)):
+            if len(pd.read_pickle(_page_path(spool, offset))) < limit: break
+            offset += limit
+        else:
+            while _fetch_page(url, params, schema, spool, offset, limit) == limit: offset += limit
     else:
-        df = pd.DataFrame(rows)
+        todo = [o for o in range(0, total, limit) if not os.path.exists(_page_path(spool, o))]
+        results = fetch_all({o: partial(_fetch_page, url, params, schema, spool, o, limit) for o in todo})
+        failed = [e for e in results.values() if isinstance(e, Exception)]
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {-(-total // limit)} pages failed; completed pages are kept in "
+                               f"{spool} and a rerun resumes from them") from failed[0]
+    return sorted(glob.glob(os.path.join(spool, "*.pkl"))), schema
 
-    df.columns = [c.lower() for c in df.columns]
+def _filter(df: pd.DataFrame, commodity_filter: str | None, state: str | None, centre: str | None) -> pd.DataFrame:
     if "commodity" in df.columns and commodity_filter:
         df = df[df["commodity"].str.contains(commodity_filter, case=False, na=False)]
     if state and "state" in df.columns:
         df = df[df["state"].str.contains(state, case=False, na=False)]
     if centre and "centre" in df.columns:
         df = df[df["centre"].str.contains(centre, case=False, na=False)]
+    return df
 
-    date_candidates = [c for c in ["date","reported_date","price_date","created_date","month","day"] if c in df.columns]
-    if not date_candidates:
-        for c in df.columns:
-            try:
-                pd.to_datetime(df[c]); date_candidates.append(c); break
-            except Exception: pass
-    if not date_candidates:
-        raise ValueError("No date-like column found in dataset.")
+def fetch_datagov_prices_csv(api_key: str, resource_id: str, out_csv: str = "basmati_prices.csv",
+                             commodity_filter: str = "Rice", state: str | None = None,
+                             centre: str | None = None, date_from: str | None = None,
+                             date_to: str | None = None, prefer_csv: bool = False,
+                             panel_csv: str | None = None, resume: bool = True, store: str | None = None) -> str:
+    """Fetch from data.gov.in and save Date,Price CSV. Always saves in working dir.
 
-    price_candidates = [c for c in ["retail","wholesale","modal_price","price","wholesale_price","retail_price"] if c in df.columns]
-    if not price_candidates:
-        num_cols = [c for c in df.columns if pd.to_numeric(df[c], errors='coerce').notna().any()]
-        if not num_cols:
-            raise ValueError("No numeric price column detected.")
-        price_candidates = [num_cols[0]]
+    JSON pages are downloaded concurrently into ``artifacts/datagov_pages/<resource>-<query>/`` and removed once
+    the CSV is written; with ``resume`` an interrupted download continues from the pages already there.
+    The date, price and key columns are detected on a sample of the first rows and cached per resource in
+    ``artifacts/datagov_schema.json``; every page is then parsed into just those columns, with categorical keys.
+    With ``panel_csv`` the per-state/centre daily prices are saved there as well, keyed like Agmarknet's panel
+    (Date,State,Market,Variety,Price with the centre as market and the commodity as variety if there is none);
+    with ``store`` the cleaned rows are upserted into that SQLite price store (centre as market).
+    """
+    rid = _extract_resource_id(resource_id)
+    if not rid:
+        raise ValueError("Invalid Resource ID: use the UUID (e.g., 9ef84268-d588-465a-a308-a864a43d0070).")
+    url = f"{BASE}/{rid}"
+    params = {"api-key": api_key, "format": "csv" if prefer_csv else "json"}
+    if date_from: params["from"] = date_from
+    if date_to: params["to"] = date_to
+
+    spool = None
+    if prefer_csv:
+        text = with_retry("datagov", _get, url, {**params, "limit": PAGE_LIMIT, "offset": 0}).text
+        schema = _resolve_schema(rid, pd.read_csv(io.StringIO(text), nrows=SAMPLE_ROWS, dtype=str), _load_schema(rid))
+        chunks = [] if schema is None else [_typed(pd.read_csv(
+            io.StringIO(text), usecols=schema["usecols"],
+            dtype={c: ("category" if c.lower() in schema["keys"] else str) for c in schema["usecols"]}), schema)]
+    else:
+        query = json.dumps({k: v for k, v in params.items() if k != "api-key"}, sort_keys=True)
+        spool = os.path.join(SPOOL_ROOT, f"{rid}-{hashlib.sha1(query.encode()).hexdigest()[:12]}")
+        if not resume: shutil.rmtree(spool, ignore_errors=True)
+        pages, schema = _download_pages(url, params, rid, spool, PAGE_LIMIT)
+        chunks = (pd.read_pickle(p) for p in pages)
+    frames = [c for c in (_filter(c, commodity_filter, state, centre) for c in chunks) if not c.empty]
+
+    if not frames:
+        pd.DataFrame(columns=["Date","Price"]).to_csv(out_csv, index=False)
+        if panel_csv: pd.DataFrame(columns=["Date", *PANEL_KEYS.values(), "Price"]).to_csv(panel_csv, index=False)
+        if spool: shutil.rmtree(spool, ignore_errors=True)
+        return out_csv
+    df = pd.concat(frames, ignore_index=True)  # pages with different categories concat to object: recast
+    for c in schema["keys"]:
+        if c in df.columns: df[c] = df[c].astype("category")
 
-    date_col, price_col = date_candidates[0], price_candidates[0]
-    df[date_col] = pd.to_datetime(df[date_col], errors="coerce")
-    df[price_col] = pd.to_numeric(df[price_col], errors="coerce")
+    date_col, price_col = schema["date"], schema["price"]
     df = df.dropna(subset=[date_col, price_col])
 
-    daily = (df.groupby(df[date_col].dt.date, as_index=False)[price_col].mean()
-             .rename(columns={date_col:"Date", price_col:"Price"}).sort_values("Date"))
+    if store:
+        rows = df[[c for c in (date_col, price_col, "state", "centre", "variety", "commodity") if c in df.columns]]
+        PriceStore(store).upsert(rows.rename(columns={date_col: "date", price_col: "price", "centre": "market"}), "datagov")
+    day = df[date_col].dt.date.rename("Date")
+    daily = (df.groupby(day)[price_col].mean().reset_index()
+             .rename(columns={price_col:"Price"}).sort_values("Date"))
     daily.to_csv(out_csv, index=False)
+    if panel_csv:
+        src = {"state": "state", "centre": "centre", "variety": "variety" if "variety" in df.columns else "commodity"}
+        keys = {PANEL_KEYS[k]: (df[c].astype(object).fillna("NA") if c in df.columns and c not in (date_col, price_col) else "NA")
+                for k, c in src.items()}
+        panel = (df[[price_col]].assign(**keys).groupby([day, *PANEL_KEYS.values()])[price_col].mean().reset_index()
+                 .rename(columns={price_col: "Price"}).sort_values(["Date", *PANEL_KEYS.values()]))
+        panel.to_csv(panel_csv, index=False)
+    if spool: shutil.rmtree(spool, ignore_errors=True)
     return out_csv
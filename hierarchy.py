@@ -0,0 +1,158 @@
+from __future__ import annotations
+import os, time
+import numpy as np, pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils import load_config, ensure_dir, today_str
+from csv_source import load_panel_csv
+from price_store import load_prices, price_query
+from model_store import read_manifest
+from sinks import output_formats, write_table
+from profiling import stage
+
+ALL = "ALL"
+METHODS = ("bottom_up", "ols", "mint")
+
+def summing_matrix(bottom: list[tuple]) -> tuple[list[tuple], sp.csr_matrix]:
+    """Nodes (aggregates first: national, then every key prefix level, then the bottom series) and the sparse
+    (nodes x bottom) matrix S that maps bottom-level values to every node.
+
+    Prices average rather than add up, so an aggregate's row holds 1/n on each of its n bottom series: a node's
+    price is the mean of the series below it. Aggregate keys are padded with ``ALL``.
+    """
+    depth = len(bottom[0]) if bottom else 0
+    agg: dict[tuple, list[int]] = {}
+    for j, key in enumerate(bottom):
+        for level in range(depth):
+            agg.setdefault(tuple(key[:level]) + (ALL,) * (depth - level), []).append(j)
+    nodes = sorted(agg, key=lambda k: (-k.count(ALL), k)) + list(bottom)
+    rows, cols, vals = [], [], []
+    for i, key in enumerate(nodes[:len(agg)]):
+        members = agg[key]
+        rows += [i] * len(members); cols += members; vals += [1.0 / len(members)] * len(members)
+    k, n = len(agg), len(bottom)
+    rows += list(range(k, k + n)); cols += list(range(n)); vals += [1.0] * n
+    return nodes, sp.csr_matrix((vals, (rows, cols)), shape=(k + n, n))
+
+def aggregate(S: sp.csr_matrix, values: np.ndarray) -> np.ndarray:
+    """(nodes x dates) node series from (bottom x dates) ``values``: S applied to the known values only, so a
+    series missing on a day does not pull its aggregates towards zero."""
+    known = np.isfinite(values)
+    total = S @ np.where(known, values, 0.0)
+    weight = S @ known.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weight > 0, total / weight, np.nan)
+
+def reconcile(S: sp.csr_matrix, base: np.ndarray, method: str = "mint", variances: np.ndarray | None = None) -> np.ndarray:
+    """Coherent (nodes x steps) forecasts from independent ``base`` forecasts of every node (rows as in S).
+
+    ``bottom_up`` aggregates the bottom forecasts; ``ols`` and ``mint`` project ``base`` onto the coherent
+    subspace, ``S (S' W^-1 S)^-1 S' W^-1 base``, with W the identity or the diagonal of the nodes' one-step
+    error ``variances`` (MinT with a diagonal covariance). With S = [A; I] the normal matrix is a diagonal plus
+    A' Wa^-1 A, so it is inverted through the Woodbury identity: one sparse LU of an (aggregates x aggregates)
+    matrix, never a dense (bottom x bottom) one. Aggregates without a finite base forecast are left out of the
+    fit; bottom series must all have one.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown reconciliation method '{method}' (expected one of {', '.join(METHODS)})")
+    m, n = S.shape
+    k = m - n
+    A, ya, yb = S[:k], base[:k], base[k:]
+    if not np.isfinite(yb).all():
+        raise ValueError("Every bottom-level series needs a base forecast")
+    if method == "bottom_up" or k == 0:
+        return np.asarray(S @ yb)
+    w = np.ones(m) if method == "ols" or variances is None else np.asarray(variances, dtype=float).copy()
+    w[~np.isfinite(w) | (w <= 0)] = np.nanmedian(np.where(w > 0, w, np.nan)) if (w > 0).any() else 1.0
+    keep = np.isfinite(ya).all(axis=1)
+    A_, wa, wb = A[keep], w[:k][keep], w[k:]
+    u = yb + wb[:, None] * (A_.T @ (ya[keep] / wa[:, None]))  # D^-1 S' W^-1 base, with D = diag(1 / wb)
+    C = (sp.diags(wa) + A_ @ sp.diags(wb) @ A_.T).tocsc()
+    beta = u - wb[:, None] * (A_.T @ splu(C).solve(np.asarray(A_ @ u)))
+    return np.asarray(S @ beta)
+
+def _variance(model_dir: str) -> float:
+    errors = np.asarray((read_manifest(model_dir) or {}).get("holdout_errors") or [], dtype=float)
+    errors = errors[np.isfinite(errors)]
+    return float(errors.var()) if len(errors) > 1 else np.nan
+
+def run_hierarchy(config_path: str = "config.yaml", horizons=None, panel_csv: str | None = None,
+                  method: str | None = None, max_workers: int | None = None) -> pd.DataFrame:
+    """Base forecasts for every node of the market hierarchy (national, each key prefix, each panel series),
+    reconciled so that every aggregate equals the mean of the series below it.
+
+    Nodes are fitted like ``run_panel`` series, across a process pool. Bottom series with fewer than
+    ``panel.min_obs`` observations, or whose fit fails, are left out of the hierarchy.
+    """
+    from panel import _init_worker, _run_series, series_slug, DEFAULT_KEYS
+    from pipeline import exogenous_features
+    cfg = load_config(config_path)
+    pcfg, hcfg = cfg.get("panel", {}) or {}, cfg.get("hierarchy", {}) or {}
+    keys = list(pcfg.get("keys", DEFAULT_KEYS))
+    method = method or hcfg.get("method", "mint")
+    if method not in METHODS:
+        raise ValueError(f"Unknown reconciliation method '{method}' (expected one of {', '.join(METHODS)})")
+    H = max(horizons or cfg.get("horizons", [7, 30, 180]))
+    series = load_panel_csv(panel_csv, keys) if panel_csv else load_prices(price_query(cfg, panel=True))
+    min_obs = int(pcfg.get("min_obs", 180))
+    bottom = sorted(k for k, s in series.items() if s.notna().sum() >= min_obs)
+    if not bottom:
+        raise ValueError(f"No panel series with at least {min_obs} observations")
+
+    with stage("hierarchy_aggregate"):
+        nodes, S = summing_matrix(bottom)
+        panel = pd.concat({k: series[k] for k in bottom}, axis=1).sort_index()
+        node_values = aggregate(S, panel.to_numpy(dtype=float).T)
+    k = len(nodes) - len(bottom)
+    node_series = {key: pd.Series(node_values[i], index=panel.index, name="price").dropna() for i, key in enumerate(nodes[:k])}
+    node_series.update({key: series[key] for key in bottom})
+
+    # bands are not reconciled; the analytic ones are enough for the base fits
+    wcfg = {**cfg, "intervals": {"method": "analytic"}}
+    models_root = os.path.join("artifacts", "models", "hierarchy"); ensure_dir(models_root)
+    out_root = os.path.join("artifacts", today_str(), "hierarchy"); ensure_dir(out_root)
+    end = panel.index.max() + pd.Timedelta(days=H)
+    exo = exogenous_features(pd.date_range(panel.index.min(), end, freq="D"), cfg)
+    workers = max_workers or hcfg.get("max_workers") or pcfg.get("max_workers") or os.cpu_count() or 1
+    print(f"Hierarchy: {k} aggregates + {len(bottom)} series, {workers} workers")
+    base, status, t0 = {}, {}, time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(exo, wcfg, models_root)) as ex:
+        futs = {ex.submit(_run_series, key, s, [H]): key for key, s in node_series.items()}
+        for i, fut in enumerate(as_completed(futs), 1):
+            key = futs[fut]
+            try:
+                rec = fut.result()
+            except Exception as e:
+                rec = {"status": "failed", "error": f"{type(e).__name__}: {e}", "forecast": None}
+            status[key] = rec["status"] if rec["status"] == "ok" else f"{rec['status']}: {rec['error']}"
+            if rec.get("forecast") is not None:
+                base[key] = rec["forecast"].set_index("date")["forecast"]
+            print(f"[{i}/{len(futs)}] {' / '.join(map(str, key))}: {rec['status']} - {time.perf_counter() - t0:.1f}s elapsed")
+
+    failed = [key for key in bottom if key not in base]
+    if failed:
+        print(f"Leaving {len(failed)} bottom series without a forecast out of the hierarchy")
+        bottom = [key for key in bottom if key in base]
+        nodes, S = summing_matrix(bottom)
+        k = len(nodes) - len(bottom)
+    dates = pd.date_range(panel.index.max() + pd.Timedelta(days=1), periods=H, freq="D")
+    # a series that ends before the panel does has its forecast held over the remaining days
+    Y = np.vstack([base[key].reindex(base[key].index.union(dates)).ffill().reindex(dates).to_numpy(dtype=float)
+                   if key in base else np.full(H, np.nan) for key in nodes])
+    var = np.array([_variance(os.path.join(models_root, series_slug(key))) for key in nodes])
+    with stage("reconcile", nodes=len(nodes), steps=H):
+        R = reconcile(S, Y, method, var)
+
+    names = ["national"] + keys
+    out = pd.DataFrame({
+        **{c: np.repeat([key[i] for key in nodes], H) for i, c in enumerate(keys)},
+        "level": np.repeat([names[len(keys) - key.count(ALL)] for key in nodes], H),
+        "step": np.tile(np.arange(1, H + 1), len(nodes)), "date": np.tile(dates.to_numpy(), len(nodes)),
+        "base": Y.ravel(), "forecast": R.ravel()})
+    for fmt in output_formats(cfg):
+        write_table(out, os.path.join(out_root, "hierarchy_forecasts"), fmt)
+    pd.DataFrame([{**dict(zip(keys, key)), "status": st} for key, st in status.items()]).to_csv(
+        os.path.join(out_root, "hierarchy_summary.csv"), index=False)
+    print(f"Done. {len(nodes)} nodes reconciled ({method}). Artifacts at: {out_root}")
+    return out
@@ -1,39 +1,135 @@
 
 from __future__ import annotations
-import os, pandas as pd, numpy as np, joblib, matplotlib.pyplot as plt
-from typing import Optional
-from statsmodels.tsa.statespace.sarimax import SARIMAXResults
+import os, pandas as pd, numpy as np, joblib
+from typing import Optional, TYPE_CHECKING
+from model_store import load_sarimax_compact, load_xgb_native, read_manifest, align_features
+from sinks import PlotRenderer, write_tables
+from profiling import stage
+if TYPE_CHECKING:
+    from statsmodels.tsa.statespace.sarimax import SARIMAXResults
 
-def load_sarimax(path: str) -> SARIMAXResults: return joblib.load(path)
+PATHS = 5000
+QUANTILES = (0.025, 0.1, 0.5, 0.9, 0.975)
+MIN_ERRORS = 20  # fewer recorded holdout errors than this: Gaussian innovations instead of resampling
+
+def load_sarimax(path: str) -> SARIMAXResults:
+    return load_sarimax_compact(path) if path.endswith(".npz") else joblib.load(path)
 def load_xgb(path: Optional[str]):
-    if path and os.path.exists(path): return joblib.load(path)
-    return None
+    if not path or not os.path.exists(path): return None
+    return load_xgb_native(path) if path.endswith((".ubj", ".json")) else joblib.load(path)
 
-def forecast(sarimax_path: str, xgb_path: str | None, history_series: pd.Series, feature_maker,
-             horizons: list[int], out_dir: str, title_prefix: str = "forecast"):
-    os.makedirs(out_dir, exist_ok=True)
-    sar = load_sarimax(sarimax_path); xgb = load_xgb(xgb_path)
-    max_h = max(horizons)
-    sar_fore = sar.get_forecast(steps=max_h)
-    base_mean = sar_fore.predicted_mean
+def model_files(model_dir: str) -> tuple[str, str | None, list[str] | None]:
+    """(sarimax path, xgb path or None, training feature columns or None) for a models directory."""
+    m = read_manifest(model_dir)
+    if m is None:
+        xgb_path = os.path.join(model_dir, "xgb.pkl")
+        return os.path.join(model_dir, "sarimax.pkl"), (xgb_path if os.path.exists(xgb_path) else None), None
+    xgb_path = os.path.join(model_dir, m["xgb"]["file"]) if m.get("xgb") else None
+    return os.path.join(model_dir, m["sarimax"]["file"]), xgb_path, m.get("feature_columns")
+
+def base_forecast(sar, steps: int) -> pd.DataFrame:
+    """SARIMAX mean and 95% interval for ``steps`` days, as plain columns."""
+    sar_fore = sar.get_forecast(steps=steps)
     conf = sar_fore.conf_int(alpha=0.05)
-    lower, upper = conf.iloc[:,0], conf.iloc[:,1]
-    fut_idx = pd.date_range(history_series.index.max() + pd.Timedelta(days=1), periods=max_h, freq="D")
-    fut_feats = feature_maker(history_series, fut_idx)
+    return pd.DataFrame({"base": np.asarray(sar_fore.predicted_mean, dtype=float),
+                         "lower_95": conf.iloc[:,0].to_numpy(dtype=float), "upper_95": conf.iloc[:,1].to_numpy(dtype=float)})
+
+def _sqrt_psd(m: np.ndarray) -> np.ndarray:
+    w, v = np.linalg.eigh(m)
+    return v * np.sqrt(np.clip(w, 0.0, None))
+
+def simulate_paths(sar, steps: int, paths: int, rng=None, shocks: np.ndarray | None = None) -> np.ndarray:
+    """(steps, paths) simulated future observations of ``sar`` from the end of its sample.
+
+    Runs the fitted state-space recursion with the state held as a (k_states, paths) matrix, so every step is
+    one matrix product for all paths. Paths start from the filtered state at the last observation (drawn from
+    its covariance); ``shocks`` (steps, paths) replaces the Gaussian innovations of a single-shock model.
+    """
+    rng = np.random.default_rng(rng)
+    fr = sar.filter_results
+    scale = float(sar.scale) if fr.filter_concentrated else 1.0
+    T, R, Z = fr.transition[:, :, -1], fr.selection[:, :, -1], fr.design[:, :, -1]
+    c, d = fr.state_intercept[:, -1:], fr.obs_intercept[:, -1]
+    Q, H = fr.state_cov[:, :, -1] * scale, float(fr.obs_cov[0, 0, -1]) * scale
+    x = fr.filtered_state[:, -1:] + _sqrt_psd(fr.filtered_state_cov[:, :, -1]) @ rng.standard_normal((T.shape[0], paths))
+    if shocks is None:
+        shocks = _sqrt_psd(Q) @ rng.standard_normal((steps, Q.shape[0], paths))
+    elif Q.shape[0] != 1:
+        raise ValueError("Resampled shocks need a model with a single state shock")
+    shocks = shocks.reshape(steps, Q.shape[0], paths)
+    out = np.empty((steps, paths))
+    for t in range(steps):
+        x = c + T @ x + R @ shocks[t]
+        out[t] = d[0] + Z[0] @ x
+    if H > 0:
+        out += np.sqrt(H) * rng.standard_normal(out.shape)
+    return out
+
+def hybrid_paths(sar, correction: np.ndarray, paths: int, errors=None, rng=None) -> np.ndarray:
+    """Simulated SARIMAX paths shifted by the residual model's ``correction`` (one value per step).
+
+    Given ``errors`` (the hybrid's one-step errors on the holdout), the innovations are resampled from them,
+    centred, instead of drawn from the SARIMAX variance: they are what the residual model leaves unexplained.
+    """
+    rng = np.random.default_rng(rng)
+    steps = len(correction)
+    shocks = None
+    errors = np.asarray(errors if errors is not None else [], dtype=float)
+    errors = errors[np.isfinite(errors)]
+    if len(errors) >= MIN_ERRORS and sar.model.k_posdef == 1:
+        shocks = rng.choice(errors - errors.mean(), size=(steps, paths))
+    return simulate_paths(sar, steps, paths, rng, shocks) + np.asarray(correction, dtype=float)[:, None]
+
+def quantile_columns(paths: np.ndarray, quantiles) -> dict[str, np.ndarray]:
+    """``q<quantile>`` columns (e.g. ``q0.9``) of the per-step quantiles across paths."""
+    qs = sorted({float(q) for q in quantiles} | {0.025, 0.975})
+    return dict(zip((f"q{q:g}" for q in qs), np.quantile(paths, qs, axis=1)))
+
+def hybrid_forecast(sar, xgb, history_series: pd.Series, feature_maker, steps: int,
+                    intervals: dict | None = None, errors=None) -> pd.DataFrame:
+    """date/forecast/lower_95/upper_95 for the next ``steps`` days.
+
+    With ``intervals["method"] == "simulate"`` the band comes from ``intervals["paths"]`` Monte Carlo paths of
+    the hybrid model (see ``hybrid_paths``) and every requested quantile is added as a ``q<quantile>`` column;
+    otherwise it is the SARIMAX ``conf_int``.
+    """
+    base = base_forecast(sar, steps)
+    fut_idx = pd.date_range(history_series.index.max() + pd.Timedelta(days=1), periods=steps, freq="D")
+    fut_feats = feature_maker(history_series, fut_idx) if xgb is not None else None
+    adj = base["base"].to_numpy()
     if xgb is not None and fut_feats is not None and not fut_feats.empty:
-        resid = pd.Series(xgb.predict(fut_feats), index=fut_idx)
-        adj = base_mean.copy(); adj.loc[fut_idx] = base_mean.values + resid.values
-    else:
-        adj = base_mean
-    outs = {}
-    for h in horizons:
-        idx = fut_idx[:h]
-        df = pd.DataFrame({"date": idx, "forecast": adj.loc[idx].values, "lower_95": lower.loc[idx].values, "upper_95": upper.loc[idx].values})
-        df.to_csv(os.path.join(out_dir, f"{title_prefix}_{h}d.csv"), index=False); outs[h]=df
-        plt.figure(); hist_tail = history_series.last("120D")
-        plt.plot(hist_tail.index, hist_tail.values, label="History")
-        plt.plot(df["date"], df["forecast"], label=f"Forecast {h}d")
-        plt.fill_between(df["date"], df["lower_95"], df["upper_95"], alpha=0.2, label="95% PI")
-        plt.title(f"Rice Price {h}-Day Forecast"); plt.xlabel("Date"); plt.ylabel("Price"); plt.legend(); plt.tight_layout()
-        plt.savefig(os.path.join(out_dir, f"{title_prefix}_plot_{h}d.png"), dpi=120); plt.close()
+        adj = adj + np.asarray(xgb.predict(fut_feats), dtype=float)
+    out = pd.DataFrame({"date": fut_idx, "forecast": adj, "lower_95": base["lower_95"].values, "upper_95": base["upper_95"].values})
+    icfg = intervals or {}
+    if icfg.get("method", "analytic") == "simulate" and steps:
+        with stage("simulate", paths=int(icfg.get("paths", PATHS))):
+            sims = hybrid_paths(sar, adj - base["base"].to_numpy(), int(icfg.get("paths", PATHS)),
+                                errors if icfg.get("shocks", "bootstrap") == "bootstrap" else None, icfg.get("seed"))
+            qcols = quantile_columns(sims, icfg.get("quantiles", QUANTILES))
+        out["lower_95"], out["upper_95"] = qcols["q0.025"], qcols["q0.975"]
+        for name, v in qcols.items(): out[name] = v
+    return out
+
+def forecast(sarimax_path: str, xgb_path: str | None, history_series: pd.Series, feature_maker,
+             horizons: list[int], out_dir: str | None, title_prefix: str = "forecast", plot: bool = True,
+             formats=("parquet", "csv"), renderer: PlotRenderer | None = None, intervals: dict | None = None):
+    """Hybrid forecast per horizon. Tables go to ``out_dir`` unless it is None; plots (if ``plot``) are handed to
+    ``renderer``, which may draw them in the background, or drawn inline when no renderer is given.
+    ``intervals`` is the config section of that name (see ``hybrid_forecast``)."""
+    if out_dir: os.makedirs(out_dir, exist_ok=True)
+    with stage("load_models"):
+        sar = load_sarimax(sarimax_path); xgb = load_xgb(xgb_path)
+    manifest = read_manifest(os.path.dirname(sarimax_path)) or {}
+    cols = manifest.get("feature_columns")
+    maker = (lambda h, idx: align_features(feature_maker(h, idx), cols)) if cols else feature_maker
+    with stage("forecast", steps=max(horizons)):
+        full = hybrid_forecast(sar, xgb, history_series, maker, max(horizons), intervals, manifest.get("holdout_errors"))
+    outs = {h: full.iloc[:h].reset_index(drop=True) for h in horizons}
+    if out_dir:
+        with stage("write_tables"):
+            write_tables(outs, out_dir, title_prefix, formats)
+        if plot:
+            renderer = renderer or PlotRenderer("inline")
+            for h, df in outs.items():
+                renderer.submit(history_series, df, h, os.path.join(out_dir, f"{title_prefix}_plot_{h}d.png"))
     return outs
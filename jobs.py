@@ -0,0 +1,65 @@
+from __future__ import annotations
+import time, uuid, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+@dataclass
+class Job:
+    """One background task; ``progress`` (0..1) and ``message`` are updated by the task while it runs."""
+    name: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:8])
+    status: str = "queued"  # queued, running, done or failed
+    progress: float = 0.0
+    message: str = ""
+    result: Any = None
+    error: str | None = None
+    started: float | None = None
+    finished: float | None = None
+
+    def report(self, progress: float, message: str = ""):
+        self.progress, self.message = min(max(float(progress), 0.0), 1.0), message
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def seconds(self) -> float:
+        return ((self.finished or time.time()) - self.started) if self.started else 0.0
+
+class JobRunner:
+    """Runs ``fn(job.report, *args, **kwargs)`` on a small thread pool so callers can poll instead of block."""
+    def __init__(self, max_workers: int = 2, keep: int = 20):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.keep = keep
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs) -> Job:
+        job = Job(name)
+        with self._lock:
+            self._jobs[job.id] = job
+            done = [j.id for j in self._jobs.values() if not j.active]
+            for jid in done[:max(0, len(self._jobs) - self.keep)]:
+                del self._jobs[jid]
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn: Callable, args: tuple, kwargs: dict):
+        job.status, job.started = "running", time.time()
+        try:
+            job.result = fn(job.report, *args, **kwargs)
+            job.status = "done"; job.report(1.0, job.message)
+        except Exception as e:
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"
+        finally:
+            job.finished = time.time()
+
+    def jobs(self) -> list[Job]:
+        """Most recent first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def running(self, name: str | None = None) -> bool:
+        return any(j.active and (name is None or j.name == name) for j in self.jobs())
@@ -0,0 +1,65 @@
+from __future__ import annotations
+import os, json, datetime as dt
+import numpy as np, pandas as pd
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+TAIL = 64  # observations kept with the state; enough to re-filter and extend, independent of history length
+
+def save_sarimax(res, path: str) -> dict:
+    """Write parameters, model spec and the filter state ``TAIL`` steps before the end, plus those last
+    observations. Rebuilding from this gives exactly the forecasts of the full results object."""
+    mod = res.model
+    endog = pd.Series(np.asarray(mod.endog).ravel(), index=res.fittedvalues.index)
+    i = max(0, len(endog) - TAIL)
+    tail = endog.iloc[i:]
+    spec = {"order": list(mod.order), "seasonal_order": list(mod.seasonal_order),
+            "enforce_stationarity": bool(mod.enforce_stationarity), "enforce_invertibility": bool(mod.enforce_invertibility),
+            "nobs": int(len(endog)), "last_date": str(pd.Timestamp(tail.index[-1]).date()) if isinstance(tail.index, pd.DatetimeIndex) else None,
+            "freq": (tail.index.freqstr or pd.infer_freq(tail.index)) if isinstance(tail.index, pd.DatetimeIndex) and len(tail) > 2 else None}
+    np.savez(path, params=np.asarray(res.params, dtype=float), param_names=np.array(res.param_names),
+             state=res.predicted_state[:, i], state_cov=res.predicted_state_cov[:, :, i],
+             tail=tail.to_numpy(dtype=float), tail_index=tail.index.asi8 if isinstance(tail.index, pd.DatetimeIndex) else np.asarray(tail.index),
+             spec=json.dumps(spec))
+    return spec
+
+def load_sarimax_compact(path: str):
+    """Rebuild a forecast-capable SARIMAXResults from ``save_sarimax`` output (supports get_forecast, extend, simulate)."""
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    with np.load(path, allow_pickle=False) as z:
+        spec = json.loads(str(z["spec"]))
+        idx = pd.DatetimeIndex(z["tail_index"], freq=spec.get("freq")) if spec.get("last_date") else pd.RangeIndex(len(z["tail"]))
+        tail = pd.Series(z["tail"], index=idx)
+        mod = SARIMAX(tail, order=tuple(spec["order"]), seasonal_order=tuple(spec["seasonal_order"]),
+                      enforce_stationarity=spec["enforce_stationarity"], enforce_invertibility=spec["enforce_invertibility"])
+        mod.initialize_known(z["state"], z["state_cov"])
+        return mod.filter(z["params"])
+
+def save_xgb(model, path: str):
+    model.save_model(path)  # native JSON/UBJ, chosen by the file extension
+
+def load_xgb_native(path: str):
+    from xgboost import XGBRegressor
+    model = XGBRegressor(); model.load_model(path)
+    return model
+
+def write_manifest(model_dir: str, **info) -> str:
+    path = os.path.join(model_dir, MANIFEST)
+    manifest = {"format": FORMAT_VERSION, "created": dt.datetime.now().isoformat(timespec="seconds"), **info}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+def read_manifest(model_dir: str) -> dict | None:
+    path = os.path.join(model_dir, MANIFEST)
+    if not os.path.exists(path): return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def align_features(feats: pd.DataFrame, columns: list[str] | None) -> pd.DataFrame:
+    """Reorder ``feats`` to the training column order recorded in the manifest; missing columns are an error."""
+    if not columns: return feats
+    missing = [c for c in columns if c not in feats.columns]
+    if missing:
+        raise ValueError(f"Future features are missing {len(missing)} training column(s): {missing[:5]}")
+    return feats[columns]
@@ -0,0 +1,79 @@
+from __future__ import annotations
+import time, threading, requests
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Callable, Hashable
+from profiling import record_http
+
+DEFAULT_RETRY = {"attempts": 3, "backoff_seconds": 1.0}
+UNMETERED = {"yfinance"}  # sources with their own HTTP client: the session hook never sees their requests
+_settings = {"max_workers": 8, "retry": {}}
+_session: requests.Session | None = None
+_lock = threading.Lock()
+_current = threading.local()  # the source of the with_retry call running on this thread, for byte counts
+
+def configure(fetch_cfg: dict | None):
+    """Apply the ``fetch`` section of config.yaml (pool size and per-source retry policy)."""
+    global _session
+    fetch_cfg = fetch_cfg or {}
+    with _lock:
+        workers = int(fetch_cfg.get("max_workers", _settings["max_workers"]))
+        if workers != _settings["max_workers"]: _session = None
+        _settings["max_workers"] = workers
+        _settings["retry"] = dict(fetch_cfg.get("retry", {}) or {})
+
+def max_workers() -> int:
+    return _settings["max_workers"]
+
+def session() -> requests.Session:
+    """Process-wide Session whose connection pool is sized for ``max_workers`` concurrent requests."""
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=_settings["max_workers"], pool_maxsize=_settings["max_workers"])
+            s.mount("https://", adapter); s.mount("http://", adapter)
+            s.hooks["response"].append(_count_response)
+            _session = s
+        return _session
+
+def _count_response(r: requests.Response, *args, **kwargs):
+    record_http(getattr(_current, "source", None) or urlparse(r.url).netloc,
+                requests=1, nbytes=len(r.content or b""))
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+def with_retry(source: str, fn: Callable, *args, **kwargs):
+    """Call ``fn`` with exponential backoff on transient errors, using the policy configured for ``source``."""
+    policy = {**DEFAULT_RETRY, **(_settings["retry"].get(source) or {})}
+    attempts, backoff = max(1, int(policy["attempts"])), float(policy["backoff_seconds"])
+    outer, _current.source = getattr(_current, "source", None), source
+    t0 = time.perf_counter()
+    try:
+        for i in range(attempts):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if i == attempts - 1 or not _retryable(e):
+                    record_http(source, errors=1); raise
+                record_http(source, retries=1)
+                time.sleep(backoff * 2 ** i)
+    finally:
+        _current.source = outer
+        record_http(source, calls=1, seconds=time.perf_counter() - t0, metered=source not in UNMETERED)
+
+def fetch_all(tasks: dict[Hashable, Callable], workers: int | None = None) -> dict:
+    """Run zero-argument callables concurrently; each value is the callable's result or the exception it raised."""
+    if not tasks: return {}
+    workers = max(1, min(workers or max_workers(), len(tasks)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as ex:
+        futs = {k: ex.submit(fn) for k, fn in tasks.items()}
+    out = {}
+    for k, f in futs.items():
+        try: out[k] = f.result()
+        except Exception as e: out[k] = e
+    return out
@@ -0,0 +1,116 @@
+from __future__ import annotations
+import os, re, time
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils import load_config, ensure_dir, today_str
+from csv_source import load_panel_csv
+from price_store import load_prices, price_query
+from sinks import output_formats, write_table
+from pipeline import exogenous_features, make_future_features_builder, FeatureState
+from tech_indicators import rolling_features
+from train import train_models
+from infer import forecast
+
+DEFAULT_KEYS = ["State", "Market", "Variety"]
+_WORKER: dict = {}
+
+def series_slug(key: tuple) -> str:
+    return "__".join(re.sub(r"[^A-Za-z0-9]+", "-", str(v)).strip("-") or "NA" for v in key)
+
+def model_history(cfg: dict, model: str = "") -> pd.Series:
+    """Price history of a model under artifacts/models: the configured series for the main model ("") and the
+    matching panel series for ``panel/<slug>``."""
+    if not model:
+        return load_prices(price_query(cfg))
+    if not model.startswith("panel/"):
+        raise ValueError(f"No price history for model '{model}' (expected the main model or panel/<slug>)")
+    slug = model.split("/", 1)[1]
+    for key, s in load_prices(price_query(cfg, panel=True)).items():
+        if series_slug(key) == slug: return s
+    raise KeyError(f"No panel series for '{slug}'")
+
+def _init_worker(exo: pd.DataFrame | None, cfg: dict, models_root: str):
+    # exogenous columns are shipped once per worker process, not once per series
+    _WORKER.update(exo=exo, cfg=cfg, models_root=models_root)
+
+def _run_series(key: tuple, series: pd.Series, horizons: list[int]) -> dict:
+    cfg, exo = _WORKER["cfg"], _WORKER["exo"]
+    t0 = time.perf_counter()
+    rec = {"key": key, "status": "ok", "error": None, "n_obs": int(series.notna().sum()), "metrics": None, "forecast": None}
+    try:
+        feats = rolling_features(series)
+        if exo is not None and len(exo.columns):
+            feats = pd.concat([feats, exo.reindex(feats.index)], axis=1)
+        mcfg = cfg.get("model", {})
+        tr = train_models(series=series, features=feats, artifacts_dir=os.path.join(_WORKER["models_root"], series_slug(key)),
+                          sarimax_cfg=mcfg.get("sarimax", {}), xgb_cfg=mcfg.get("xgboost", {}),
+                          test_size_days=mcfg.get("test_size_days", 60))
+        builder = make_future_features_builder(cfg, FeatureState.from_series(series), exo=exo)
+        outs = forecast(tr.sarimax_model_path, tr.xgb_model_path, series, builder, horizons, None,
+                        intervals=cfg.get("intervals"))
+        rec["metrics"] = tr.metrics
+        rec["forecast"] = pd.concat([df.assign(horizon=h) for h, df in outs.items()], ignore_index=True)
+    except Exception as e:
+        rec.update(status="failed", error=f"{type(e).__name__}: {e}")
+    rec["seconds"] = round(time.perf_counter() - t0, 3)
+    return rec
+
+def _summary_row(keys: list[str], rec: dict) -> dict:
+    row = {**dict(zip(keys, rec["key"])), "status": rec["status"], "error": rec["error"],
+           "n_obs": rec["n_obs"], "seconds": rec.get("seconds")}
+    for kind, m in (rec.get("metrics") or {}).items():
+        row.update({f"{kind}_{name}": v for name, v in m.items()})
+    return row
+
+def run_panel(config_path: str = "config.yaml", horizons=None, panel_csv: str | None = None,
+              max_workers: int | None = None) -> pd.DataFrame:
+    """Train and forecast every (state, market, variety) series of the panel CSV across a process pool.
+
+    Exogenous features are built once for the union of all date ranges. A failing series is recorded in
+    ``panel_summary.csv`` and does not stop the others; forecasts are consolidated in ``panel_forecasts.csv``.
+    """
+    cfg = load_config(config_path)
+    pcfg = cfg.get("panel", {}) or {}
+    keys = list(pcfg.get("keys", DEFAULT_KEYS))
+    series = load_panel_csv(panel_csv, keys) if panel_csv else load_prices(price_query(cfg, panel=True))
+    hz = horizons or cfg.get("horizons", [7, 30, 180])
+    min_obs = int(pcfg.get("min_obs", 180))
+    todo = {k: s for k, s in series.items() if s.notna().sum() >= min_obs}
+    records = [{"key": k, "status": "skipped", "error": f"fewer than {min_obs} observations",
+                "n_obs": int(s.notna().sum()), "seconds": 0.0} for k, s in series.items() if k not in todo]
+
+    out_root = os.path.join("artifacts", today_str(), "panel"); ensure_dir(out_root)
+    models_root = os.path.join("artifacts", "models", "panel"); ensure_dir(models_root)
+    exo = None
+    if todo:
+        start = min(s.index.min() for s in todo.values())
+        end = max(s.index.max() for s in todo.values()) + pd.Timedelta(days=max(hz))
+        exo = exogenous_features(pd.date_range(start, end, freq="D"), cfg)
+
+    workers = max_workers or pcfg.get("max_workers") or os.cpu_count() or 1
+    print(f"Panel: {len(todo)} series to fit, {len(records)} skipped, {workers} workers")
+    frames, n_failed, t0 = [], 0, time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(exo, cfg, models_root)) as ex:
+        futs = {ex.submit(_run_series, k, s, hz): k for k, s in todo.items()}
+        for i, fut in enumerate(as_completed(futs), 1):
+            key = futs[fut]
+            try:
+                rec = fut.result()
+            except Exception as e:  # worker process died (e.g. BrokenProcessPool); isolate it to this series
+                rec = {"key": key, "status": "failed", "error": f"{type(e).__name__}: {e}", "n_obs": len(todo[key]), "seconds": None}
+            n_failed += rec["status"] != "ok"
+            if rec.get("forecast") is not None:
+                frames.append(rec.pop("forecast").assign(**dict(zip(keys, key))))
+            records.append(rec)
+            print(f"[{i}/{len(futs)}] {' / '.join(map(str, key))}: {rec['status']} ({rec['seconds']}s) "
+                  f"- {n_failed} failed, {time.perf_counter() - t0:.1f}s elapsed")
+
+    summary = pd.DataFrame([_summary_row(keys, r) for r in records])
+    summary.to_csv(os.path.join(out_root, "panel_summary.csv"), index=False)
+    if frames:
+        fc = pd.concat(frames, ignore_index=True)
+        fc = fc[keys + ["horizon", "date", "forecast", "lower_95", "upper_95"]]
+        for fmt in output_formats(cfg):
+            write_table(fc, os.path.join(out_root, "panel_forecasts"), fmt)
+    print(f"Done. {len(frames)} series forecast, {n_failed} failed. Artifacts at: {out_root}")
+    return summary
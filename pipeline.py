@@ -1,99 +1,239 @@
-
-# --- pipeline.py (v3) with heavy-duty path bootstrapping + dual import modes ---
 from __future__ import annotations
-import sys, pathlib, os
-ROOT = pathlib.Path(__file__).resolve().parent
-
-# 1) Put repo root and subfolders on sys.path
-paths = [str(ROOT), str(ROOT / "data_sources"), str(ROOT / "features"), str(ROOT / "model")]
-for p in paths:
-    if p not in sys.path:
-        sys.path.insert(0, p)
-
-# 2) Ensure __init__.py exists in module folders (so package-style works)
-for sub in ("data_sources", "features", "model"):
-    d = ROOT / sub
-    if d.is_dir():
-        initf = d / "__init__.py"
-        if not initf.exists():
-            try:
-                initf.write_text("", encoding="utf-8")
-            except Exception:
-                pass
-
-import pandas as pd
-from utils import load_config, ensure_dir, today_str
-
-# 3) Try package imports first, then flat
-try:
-    from data_sources.csv_source import load_price_csv
-    from data_sources.yfinance_source import fetch_yf
-except Exception:
-    from csv_source import load_price_csv
-    from yfinance_source import fetch_yf
+import os, json, shutil
+import numpy as np, pandas as pd
+from functools import partial
+from utils import load_config, today_str
+from cache import open_cache
+from net import configure as configure_fetch, fetch_all
+from sinks import plot_renderer, output_formats
+from price_store import load_prices, price_query
+from profiling import stage
+from dag import Stage, ArtifactStore, run_dag, print_plan, META as STAGE_META
+from tech_indicators import feature_matrix, feature_columns, FeatureState
+from weather import fetch_weather_daily, combine_regions
 
-try:
-    from features.tech_indicators import rolling_features
-    from features.weather import aggregate_regions
-except Exception:
-    from tech_indicators import rolling_features
-    from weather import aggregate_regions
-
-try:
-    from model.train import train_models
-    from model.infer import forecast
-except Exception:
-    from train import train_models
-    from infer import forecast
+# yfinance (yfinance_source), statsmodels/xgboost (train, infer) are imported where they are used, so that
+# importing this module for its feature helpers stays cheap
 
-def build_features(price_s: pd.Series, cfg: dict) -> pd.DataFrame:
-    df = rolling_features(price_s)
-    ind_cfg = cfg.get("indicators", {})
-    for key, meta in ind_cfg.items():
-        if not meta or not meta.get("enabled", False): 
-            continue
-        s = fetch_yf(meta.get("ticker"), meta.get("lookback_days", 365))
-        if s is None or s.empty:
+IND_LAGS = [1, 3, 7, 14, 30]
+WEATHER_LAGS = [1, 3, 7, 14]
+
+def _staged(name: str, fn, *args, **kwargs):
+    with stage(name):
+        return fn(*args, **kwargs)
+
+def fetch_exogenous(cfg: dict, past_days: int = 365) -> tuple[dict, pd.DataFrame | None]:
+    """Download every enabled indicator and weather region concurrently; returns ({key: series}, weather frame)."""
+    from yfinance_source import fetch_yf
+    configure_fetch(cfg.get("fetch"))
+    cache = open_cache(cfg)
+    tasks = {}
+    for key, meta in (cfg.get("indicators", {}) or {}).items():
+        if not meta or not meta.get("enabled", False):
             continue
-        s = s.reindex(df.index).ffill()
-        df[f"ind_{key}"] = s
-        for l in [1,3,7,14,30]:
-            df[f"ind_{key}_lag{l}"] = s.shift(l)
-    w_cfg = cfg.get("weather", {})
-    if w_cfg.get("enabled", False) and w_cfg.get("regions"):
-        wdf = aggregate_regions(w_cfg["regions"], past_days=max(365, len(df)))
-        wdf = wdf.reindex(df.index).ffill()
-        df = df.join(wdf, how="left")
-        for col in [c for c in wdf.columns if c.endswith("_avg")]:
-            for l in [1,3,7,14]:
-                df[f"{col}_lag{l}"] = wdf[col].shift(l)
-    return df
-
-def make_future_features_builder(cfg: dict):
+        tasks[("ind", key)] = partial(_staged, f"fetch:yfinance:{key}", fetch_yf, meta.get("ticker"),
+                                      meta.get("lookback_days", 365), cache=cache)
+    w_cfg = cfg.get("weather", {}) or {}
+    regions = (w_cfg.get("regions") or []) if w_cfg.get("enabled", False) else []
+    for reg in regions:
+        tasks[("wx", reg["name"])] = partial(_staged, f"fetch:open_meteo:{reg['name']}", fetch_weather_daily,
+                                             reg["lat"], reg["lon"], past_days=past_days, cache=cache)
+    with stage("fetch_exogenous", tasks=len(tasks)):
+        results = fetch_all(tasks)
+    indicators = {}
+    for (kind, key), res in results.items():
+        if kind == "wx" and isinstance(res, Exception):
+            raise res
+        if kind == "ind" and not isinstance(res, Exception) and res is not None and not res.empty:
+            indicators[key] = res
+    frames = {key: res for (kind, key), res in results.items() if kind == "wx"}
+    return indicators, (combine_regions(frames) if frames else None)
+
+def _align(obj, index: pd.DatetimeIndex):
+    return obj.reindex(obj.index.union(index)).ffill().reindex(index)
+
+def exogenous_columns(index: pd.DatetimeIndex, cfg: dict, past_days: int | None = None) -> list[tuple[str, np.ndarray, int]]:
+    """(name, aligned source values, lag) for every indicator and weather column, in output order."""
+    indicators, wdf = fetch_exogenous(cfg, past_days=past_days or max(365, len(index)))
+    cols = []
+    for key, s in indicators.items():
+        v = _align(s, index).to_numpy(dtype=float)
+        cols += [(f"ind_{key}", v, 0)] + [(f"ind_{key}_lag{l}", v, l) for l in IND_LAGS]
+    if wdf is not None:
+        wdf = _align(wdf, index)
+        vals = {c: wdf[c].to_numpy(dtype=float) for c in wdf.columns}
+        cols += [(c, v, 0) for c, v in vals.items()]
+        for col in [c for c in vals if c.endswith("_avg")]:
+            cols += [(f"{col}_lag{l}", vals[col], l) for l in WEATHER_LAGS]
+    return cols
+
+def _fill(out: np.ndarray, cols: list[tuple[str, np.ndarray, int]]):
+    # a lag is the source array read at an offset: one copy from a view straight into the output column
+    n = out.shape[0]
+    for j, (_, v, lag) in enumerate(cols):
+        out[:min(lag, n), j] = np.nan; out[lag:, j] = v[:max(n - lag, 0)]
+
+def exogenous_features(index: pd.DatetimeIndex, cfg: dict, past_days: int | None = None) -> pd.DataFrame:
+    """Indicator and weather columns (plus their lags) aligned to ``index``, as one float32 block."""
+    cols = exogenous_columns(index, cfg, past_days)
+    out = np.empty((len(index), len(cols)), dtype=np.float32)
+    _fill(out, cols)
+    return pd.DataFrame(out, index=index, columns=[c[0] for c in cols], copy=False)
+
+def build_features(price_s: pd.Series, cfg: dict, exo: list | None = None, path: str | None = None) -> pd.DataFrame:
+    """Price and exogenous features in one preallocated, C-contiguous float32 matrix (a single-block frame).
+
+    ``exo`` is ``exogenous_columns`` output for ``price_s.index``; it is fetched when not given. With ``path``
+    the matrix is written straight into that ``.npy`` file and the frame returned is memory-mapped from it
+    (see ``load_features``), so it never has to fit in memory.
+    """
+    if exo is None:
+        with stage("exogenous_features"):
+            exo = exogenous_columns(price_s.index, cfg)
+    names = feature_columns() + [c[0] for c in exo]
+    shape = (len(price_s), len(names))
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape) if path else np.empty(shape, dtype=np.float32)
+    k = len(feature_columns())
+    with stage("rolling_features", rows=len(price_s)):
+        feature_matrix(price_s.to_numpy(dtype=float), out=out[:, :k])
+    _fill(out[:, k:], exo)
+    if not path:
+        return pd.DataFrame(out, index=price_s.index, columns=names, copy=False)
+    out.flush(); del out
+    stem = os.path.splitext(path)[0]
+    np.save(f"{stem}.index.npy", price_s.index.to_numpy(dtype="datetime64[ns]"))
+    with open(f"{stem}.columns.json", "w", encoding="utf-8") as f: json.dump(names, f)
+    return load_features(path)
+
+def load_features(path: str) -> pd.DataFrame:
+    """The frame ``build_features(..., path=path)`` wrote, memory-mapped read-only."""
+    stem = os.path.splitext(path)[0]
+    with open(f"{stem}.columns.json", "r", encoding="utf-8") as f: names = json.load(f)
+    index = pd.DatetimeIndex(np.load(f"{stem}.index.npy"))
+    return pd.DataFrame(np.load(path, mmap_mode="r"), index=index, columns=names, copy=False)
+
+def make_future_features_builder(cfg: dict, state: FeatureState | None = None, exo: pd.DataFrame | None = None):
+    """Future feature rows for the hybrid model: the last price is carried forward and rolled through a
+    ``FeatureState``, so the cost depends on the horizon only. Pass ``state`` (already advanced to the end of
+    the history) to skip replaying the history as well, and ``exo`` (``exogenous_features`` over a range that
+    covers the horizon) to reuse exogenous columns instead of reading them again."""
     def _builder(history_series: pd.Series, future_index: pd.DatetimeIndex) -> pd.DataFrame:
-        combined = history_series.copy()
-        if len(future_index):
-            ext = pd.Series([combined.iloc[-1]] * len(future_index), index=future_index, name=combined.name)
-            combined = pd.concat([combined, ext])
-        feats = build_features(combined, cfg).loc[future_index]
-        feats = feats.drop(columns=['price'], errors='ignore').fillna(method='ffill').fillna(method='bfill')
-        return feats
+        st = state if state is not None and state.last_date == history_series.index.max() else None
+        st = (st or FeatureState.from_series(history_series)).copy()
+        ext = pd.Series(history_series.iloc[-1], index=future_index, name=history_series.name, dtype=float)
+        price_feats = st.extend(ext)
+        if exo is not None:
+            feats = pd.concat([price_feats, exo.reindex(future_index)], axis=1)
+            return feats.drop(columns=['price'], errors='ignore').ffill().bfill()
+        lookback = max(IND_LAGS + WEATHER_LAGS)
+        exo_index = pd.date_range(future_index[0] - pd.Timedelta(days=lookback), future_index[-1], freq="D") \
+            if len(future_index) else future_index
+        window = exogenous_features(exo_index, cfg, past_days=max(365, len(history_series) + len(future_index)))
+        feats = pd.concat([price_feats, window.reindex(future_index)], axis=1)
+        return feats.drop(columns=['price'], errors='ignore').ffill().bfill()
     return _builder
 
-def run_pipeline(config_path: str = "config.yaml", horizons=None):
+def train_full(price_s: pd.Series, feats: pd.DataFrame, cfg: dict, models_dir: str):
+    """Fit both models from scratch and save the feature state next to them; returns (TrainResult, state)."""
+    from train import train_models
+    # the state goes first: train_models writes the manifest last, which marks the model directory complete
+    state = FeatureState.from_series(price_s); state.save(os.path.join(models_dir, "feature_state.json"))
+    with stage("train_models"):
+        tr = train_models(
+            series=price_s, features=feats, artifacts_dir=models_dir,
+            sarimax_cfg=cfg.get("model", {}).get("sarimax", {}),
+            xgb_cfg=cfg.get("model", {}).get("xgboost", {}),
+            test_size_days=cfg.get("model", {}).get("test_size_days", 60),
+        )
+    return tr, state
+
+def _load_trained(path: str) -> dict:
+    with open(os.path.join(path, "metrics.json"), "r", encoding="utf-8") as f:
+        metrics = json.load(f)
+    return {"dir": path, "metrics": metrics, "state": FeatureState.load(os.path.join(path, "feature_state.json"))}
+
+def pipeline_stages(cfg: dict) -> list[Stage]:
+    """prices and exogenous (sources, read every run) -> features -> train -> forecast.
+
+    ``cfg`` carries the effective ``horizons`` and ``output.plots``, so they are part of the forecast fingerprint.
+    """
+    def _prices(inp, out_dir):
+        return load_prices(price_query(cfg))
+
+    def _exogenous(inp, out_dir):
+        return exogenous_columns(inp["prices"].index, cfg)
+
+    def _features(inp, out_dir):
+        return build_features(inp["prices"], cfg, exo=inp["exogenous"], path=os.path.join(out_dir, "features.npy"))
+
+    def _train(inp, out_dir):
+        tr, state = train_full(inp["prices"], inp["features"], cfg, out_dir)
+        with open(os.path.join(out_dir, "metrics.json"), "w", encoding="utf-8") as f:
+            json.dump(tr.metrics, f, indent=2)
+        return {"dir": out_dir, "metrics": tr.metrics, "state": state}
+
+    def _forecast(inp, out_dir):
+        from infer import model_files, forecast
+        sar_path, xgb_path, _ = model_files(inp["train"]["dir"])
+        renderer = plot_renderer(cfg)
+        forecast(sar_path, xgb_path, inp["prices"], make_future_features_builder(cfg, inp["train"]["state"]),
+                 cfg["horizons"], out_dir, "forecast", formats=output_formats(cfg), renderer=renderer,
+                 intervals=cfg.get("intervals"))
+        with stage("plots_wait"):
+            renderer.wait()
+        return out_dir
+
+    return [
+        Stage("prices", _prices, config=("prices", "price_csv")),
+        Stage("exogenous", _exogenous, deps=("prices",), config=("indicators", "weather")),
+        Stage("features", _features, deps=("prices", "exogenous"), code=("tech_indicators.py", "pipeline.py"),
+              load=lambda path: load_features(os.path.join(path, "features.npy"))),
+        Stage("train", _train, deps=("prices", "features"), config=("model",),
+              code=("train.py", "model_store.py", "tech_indicators.py", "pipeline.py"), load=_load_trained),
+        Stage("forecast", _forecast, deps=("prices", "exogenous", "train"), config=("horizons", "intervals", "output"),
+              code=("infer.py", "sinks.py", "pipeline.py", "model_store.py", "tech_indicators.py"), load=lambda path: path),
+    ]
+
+def _publish(src: str, dst: str):
+    """Replace ``dst`` with the files of ``src`` as a whole, so readers (serve, update, the dashboard) never see a
+    mix of old and new files. The files are staged in a sibling directory, along with whatever ``dst`` holds
+    that ``src`` does not (panel and hierarchy models, other tables of the day), which is renamed into place."""
+    dst = os.path.normpath(dst)
+    tmp = f"{dst}.publish-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True); os.makedirs(tmp)
+    names = set()
+    for e in os.scandir(src):
+        if e.is_file() and e.name != STAGE_META:
+            shutil.copy2(e.path, os.path.join(tmp, e.name)); names.add(e.name)
+    if os.path.isdir(dst):
+        for e in os.scandir(dst):
+            if e.name not in names: os.replace(e.path, os.path.join(tmp, e.name))
+        old = tmp + ".old"
+        os.replace(dst, old); os.replace(tmp, dst)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.replace(tmp, dst)
+
+def run_pipeline(config_path: str = "config.yaml", horizons=None, plots: str | None = None, force=(), dry_run: bool = False):
+    """Run the pipeline stages, reusing the stored output of every stage whose inputs are unchanged.
+
+    Stage outputs are memoized under ``pipeline.store``; the trained models are then copied to
+    ``artifacts/models`` and the forecast tables and plots to ``artifacts/<today>``. ``force`` names stages to
+    recompute (with everything downstream); ``dry_run`` reads the sources and prints what would run.
+    """
     cfg = load_config(config_path)
-    price_s = load_price_csv(cfg["price_csv"])
-    feats = build_features(price_s, cfg)
-    out_root = os.path.join("artifacts", today_str()); ensure_dir(out_root)
-    models_dir = os.path.join("artifacts", "models"); ensure_dir(models_dir)
-    tr = train_models(
-        series=price_s, features=feats, artifacts_dir=models_dir,
-        sarimax_cfg=cfg.get("model", {}).get("sarimax", {}),
-        xgb_cfg=cfg.get("model", {}).get("xgboost", {}),
-        test_size_days=cfg.get("model", {}).get("test_size_days", 60),
-    )
-    hz = horizons or cfg.get("horizons", [7, 30, 180])
-    fut_builder = make_future_features_builder(cfg)
-    forecast(tr.sarimax_model_path, tr.xgb_model_path, price_s, fut_builder, hz, out_root, "forecast")
-    print("Training metrics:", tr.metrics)
+    ocfg = cfg.get("output", {}) or {}
+    cfg = {**cfg, "horizons": list(horizons or cfg.get("horizons", [7, 30, 180])),
+           "output": {**ocfg, "plots": plots or ocfg.get("plots", "background")}}
+    pcfg = cfg.get("pipeline", {}) or {}
+    store = ArtifactStore(pcfg.get("store", os.path.join("artifacts", "pipeline")), int(pcfg.get("keep", 5)))
+    values, plan = run_dag(pipeline_stages(cfg), cfg, store, force=force, dry_run=dry_run)
+    print("Plan:" if dry_run else "Stages:"); print_plan(plan, dry_run)
+    if dry_run:
+        return plan
+    _publish(values["train"]["dir"], os.path.join("artifacts", "models"))
+    out_root = os.path.join("artifacts", today_str())
+    _publish(values["forecast"], out_root)
+    print("Training metrics:", values["train"]["metrics"])
     print(f"Done. Artifacts at: {out_root}")
+    return plan
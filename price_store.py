@@ -0,0 +1,107 @@
+from __future__ import annotations
+import os, sqlite3
+from contextlib import closing
+from dataclasses import dataclass, field
+import pandas as pd
+from csv_source import load_price_csv, load_panel_csv
+
+KEYS = ["state", "market", "variety", "commodity"]
+PRICE_COLUMNS = ["min_price", "max_price", "modal_price", "price"]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (source TEXT NOT NULL, date TEXT NOT NULL, state TEXT NOT NULL DEFAULT '',
+                                   market TEXT NOT NULL DEFAULT '', variety TEXT NOT NULL DEFAULT '',
+                                   commodity TEXT NOT NULL DEFAULT '', min_price REAL, max_price REAL,
+                                   modal_price REAL, price REAL,
+                                   PRIMARY KEY (source, date, state, market, variety, commodity));
+CREATE INDEX IF NOT EXISTS prices_date ON prices (date, state, market, variety);
+CREATE INDEX IF NOT EXISTS prices_series ON prices (state, market, variety, date);
+"""
+
+@dataclass
+class PriceQuery:
+    """What to load: the backend, row filters (pushed down into the store) and the daily aggregation.
+
+    ``by`` lists key columns to keep separate (one series per key tuple); otherwise all matching rows are averaged
+    per day. ``price`` picks the stored price column. The csv backend reads ``path`` as before, ignoring filters.
+    """
+    backend: str = "csv"
+    path: str = "data/basmati_prices.csv"
+    source: str | None = None
+    state: str | None = None
+    market: str | None = None
+    variety: str | None = None
+    commodity: str | None = None
+    date_from: str | None = None
+    date_to: str | None = None
+    price: str = "price"
+    by: list[str] = field(default_factory=list)
+
+class PriceStore:
+    """Raw market rows (min/max/modal price per date, state, market, variety) in an indexed SQLite table."""
+    def __init__(self, path: str = "data/prices.sqlite"):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def upsert(self, df: pd.DataFrame, source: str) -> int:
+        """Insert or replace rows of ``df`` (a ``date`` column, any of ``KEYS`` and ``PRICE_COLUMNS``)."""
+        if df.empty: return 0
+        cols = {c.lower(): c for c in df.columns}
+        out = pd.DataFrame({"source": source, "date": pd.to_datetime(df[cols["date"]]).dt.strftime("%Y-%m-%d")})
+        for k in KEYS:
+            out[k] = df[cols[k]].fillna("").astype(str) if k in cols else ""
+        for c in PRICE_COLUMNS:
+            out[c] = pd.to_numeric(df[cols[c]], errors="coerce") if c in cols else None
+        out = out.astype(object).where(out.notna(), None)
+        with closing(self._connect()) as con, con:
+            con.executemany(f"INSERT OR REPLACE INTO prices ({','.join(out.columns)}) VALUES ({','.join('?' * len(out.columns))})",
+                            out.itertuples(index=False, name=None))
+        return len(out)
+
+    def query(self, q: PriceQuery) -> pd.DataFrame:
+        """Daily mean of ``q.price`` per date (and ``q.by`` keys), filtered and aggregated inside SQLite."""
+        if q.price not in PRICE_COLUMNS: raise ValueError(f"Unknown price column '{q.price}'")
+        by = [k.lower() for k in q.by]
+        if any(k not in KEYS for k in by): raise ValueError(f"Unknown key columns {q.by} (expected some of {KEYS})")
+        where, args = [f"{q.price} IS NOT NULL"], []
+        for k in ["source", *KEYS]:
+            if getattr(q, k) is not None: where.append(f"{k} = ?"); args.append(getattr(q, k))
+        if q.date_from: where.append("date >= ?"); args.append(str(pd.Timestamp(q.date_from).date()))
+        if q.date_to: where.append("date <= ?"); args.append(str(pd.Timestamp(q.date_to).date()))
+        group = ", ".join(["date", *by])
+        sql = f"SELECT {group}, AVG({q.price}) AS price FROM prices WHERE {' AND '.join(where)} GROUP BY {group} ORDER BY {group}"
+        with closing(self._connect()) as con:
+            df = pd.read_sql_query(sql, con, params=args)
+        df["date"] = pd.to_datetime(df["date"])
+        return df
+
+def _daily(s: pd.Series) -> pd.Series:
+    return s.sort_index().asfreq("D").ffill().rename("price")
+
+def load_prices(q: PriceQuery) -> pd.Series | dict[tuple, pd.Series]:
+    """Daily forward-filled price series for ``q``; with ``q.by`` a {key tuple: series} dict as ``load_panel_csv``."""
+    if q.backend == "csv":
+        return load_panel_csv(q.path, list(q.by)) if q.by else load_price_csv(q.path)
+    if q.backend != "sqlite":
+        raise ValueError(f"Unknown price backend '{q.backend}' (expected csv or sqlite)")
+    df = PriceStore(q.path).query(q)
+    if not q.by:
+        return _daily(df.set_index("date")["price"])
+    by = [k.lower() for k in q.by]
+    return {key if isinstance(key, tuple) else (key,): _daily(g.set_index("date")["price"])
+            for key, g in df.groupby(by, sort=True)}
+
+def price_query(cfg: dict, panel: bool = False) -> PriceQuery:
+    """Query for the configured price source: the ``prices`` section if present, else the CSV files as before."""
+    pcfg = cfg.get("panel", {}) or {}
+    keys = list(pcfg.get("keys", ["State", "Market", "Variety"])) if panel else []
+    scfg = cfg.get("prices")
+    if not scfg or scfg.get("backend", "csv") == "csv":
+        path = pcfg.get("csv", "data/panel_prices.csv") if panel else cfg["price_csv"]
+        return PriceQuery(path=path, by=keys)
+    fields = {k: scfg[k] for k in ("source", *KEYS, "date_from", "date_to", "price") if scfg.get(k) is not None}
+    return PriceQuery(backend=scfg["backend"], path=scfg.get("path", "data/prices.sqlite"), by=keys, **fields)
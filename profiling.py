@@ -0,0 +1,191 @@
+from __future__ import annotations
+import os, io, sys, json, time, pstats, cProfile, threading, datetime as dt
+from contextlib import contextmanager
+
+SAMPLE_SECONDS = 0.05
+_active: "Profiler | None" = None
+
+def _rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc; elsewhere the peak RSS so far)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return int(peak_rss_mb() * 2**20)
+
+def peak_rss_mb() -> float:
+    """Highest resident set size of this process so far, in MB."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round((peak if sys.platform == "darwin" else peak * 1024) / 2**20, 1)
+
+class Profiler:
+    """Stage timings, sampled RSS and per-source HTTP counts for one run.
+
+    Stages may nest and may run on several threads at once; each records its thread, so the Chrome trace shows
+    concurrent fetches and fits side by side. Stages named in ``cprofile`` are also run under cProfile (one at a
+    time: a stage that starts while another is being profiled is only timed).
+    """
+    def __init__(self, cprofile=(), sample_seconds: float = SAMPLE_SECONDS):
+        self.cprofile = set(cprofile or ())
+        self.t0 = time.perf_counter()
+        self.started = dt.datetime.now().isoformat(timespec="seconds")
+        self.stages: list[dict] = []
+        self.http: dict[str, dict] = {}
+        self.samples: list[tuple[float, int]] = []
+        self.profiles: dict[str, pstats.Stats] = {}
+        self._lock = threading.Lock()
+        self._profiling = False
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, args=(sample_seconds,), name="rss-sampler", daemon=True)
+
+    def _now(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def _sample(self, every: float):
+        while not self._stop.is_set():
+            self.samples.append((self._now(), _rss_bytes()))
+            self._stop.wait(every)
+
+    def __enter__(self):
+        global _active
+        _active = self
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        self._stop.set(); self._sampler.join()
+        self.samples.append((self._now(), _rss_bytes()))
+        _active = None
+
+    @contextmanager
+    def stage(self, name: str, **args):
+        prof = None
+        if name in self.cprofile:
+            with self._lock:
+                if not self._profiling: self._profiling, prof = True, cProfile.Profile()
+        rec = {"name": name, "thread": threading.current_thread().name, "start": self._now(), "args": args}
+        try:
+            if prof is not None: prof.enable()
+            yield rec
+        finally:
+            if prof is not None:
+                prof.disable()
+                with self._lock:
+                    self._profiling = False
+                    if name in self.profiles: self.profiles[name].add(prof)
+                    else: self.profiles[name] = pstats.Stats(prof)
+            rec["end"] = self._now()
+            with self._lock: self.stages.append(rec)
+
+    def record_http(self, source: str, requests: int = 0, nbytes: int = 0, calls: int = 0, retries: int = 0,
+                    errors: int = 0, seconds: float = 0.0, metered: bool = True):
+        """``metered=False`` marks a source whose requests bypass ``net.session``: its request and byte counts
+        are reported as None (not measured) rather than zero."""
+        with self._lock:
+            h = self.http.setdefault(source, {"calls": 0, "requests": 0, "bytes": 0, "retries": 0, "errors": 0, "seconds": 0.0})
+            h["calls"] += calls; h["requests"] += requests; h["bytes"] += nbytes
+            h["retries"] += retries; h["errors"] += errors; h["seconds"] += seconds
+            if not metered: h["metered"] = False
+
+    def _http(self) -> dict:
+        out = {}
+        for source, v in self.http.items():
+            h = {**v, "seconds": round(v["seconds"], 4)}
+            if not h.pop("metered", True): h.update(requests=None, bytes=None)
+            out[source] = h
+        return out
+
+    def _peak(self, start: float, end: float) -> int | None:
+        inside = [m for t, m in self.samples if start <= t <= end]
+        return max(inside) if inside else None
+
+    def summary(self) -> dict:
+        """Per stage name: count, total and max seconds, and the highest RSS sampled while it ran."""
+        out: dict[str, dict] = {}
+        for s in self.stages:
+            agg = out.setdefault(s["name"], {"count": 0, "total_s": 0.0, "max_s": 0.0, "peak_rss_mb": None})
+            dur = s["end"] - s["start"]
+            agg["count"] += 1; agg["total_s"] += dur; agg["max_s"] = max(agg["max_s"], dur)
+            peak = self._peak(s["start"], s["end"])
+            if peak is not None:
+                agg["peak_rss_mb"] = max(agg["peak_rss_mb"] or 0.0, round(peak / 2**20, 1))
+        for agg in out.values():
+            agg["total_s"], agg["max_s"] = round(agg["total_s"], 4), round(agg["max_s"], 4)
+        return out
+
+    def report(self) -> dict:
+        return {"started": self.started, "wall_s": round(self._now(), 4),
+                "peak_rss_mb": round(max((m for _, m in self.samples), default=0) / 2**20, 1),
+                "stages": self.summary(), "http": self._http(),
+                "spans": [{"name": s["name"], "thread": s["thread"], "start_s": round(s["start"], 4),
+                           "seconds": round(s["end"] - s["start"], 4), **({"args": s["args"]} if s["args"] else {})}
+                          for s in sorted(self.stages, key=lambda s: s["start"])]}
+
+    def chrome_trace(self) -> dict:
+        """Trace Event Format: one complete event per stage on its thread's lane, plus an RSS counter."""
+        pid, tids = os.getpid(), {}
+        events = []
+        for s in sorted(self.stages, key=lambda s: s["start"]):
+            tid = tids.setdefault(s["thread"], len(tids))
+            events.append({"name": s["name"], "ph": "X", "pid": pid, "tid": tid, "ts": s["start"] * 1e6,
+                           "dur": (s["end"] - s["start"]) * 1e6, "args": s["args"]})
+        events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}} for name, tid in tids.items()]
+        events += [{"name": "rss_mb", "ph": "C", "pid": pid, "ts": t * 1e6, "args": {"rss_mb": round(m / 2**20, 1)}}
+                   for t, m in self.samples]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, out_dir: str, name: str | None = None) -> dict[str, str]:
+        """Write ``<name>.json`` (report), ``<name>.trace.json`` (chrome://tracing / Perfetto) and one
+        ``<name>.<stage>.prof`` per cProfiled stage; returns {kind: path}."""
+        os.makedirs(out_dir, exist_ok=True)
+        name = name or dt.datetime.now().strftime("%Y%m%d-%H%M%S")
+        paths = {"report": os.path.join(out_dir, f"{name}.json"), "trace": os.path.join(out_dir, f"{name}.trace.json")}
+        report = self.report()
+        for stage_name, stats in self.profiles.items():
+            paths[f"cprofile:{stage_name}"] = os.path.join(out_dir, f"{name}.{stage_name}.prof")
+            stats.dump_stats(paths[f"cprofile:{stage_name}"])
+            buf = io.StringIO(); pstats.Stats(paths[f"cprofile:{stage_name}"], stream=buf).sort_stats("cumulative").print_stats(15)
+            report.setdefault("cprofile", {})[stage_name] = buf.getvalue()
+        with open(paths["report"], "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+        with open(paths["trace"], "w", encoding="utf-8") as f: json.dump(self.chrome_trace(), f)
+        return paths
+
+@contextmanager
+def stage(name: str, **args):
+    """Time a block as stage ``name`` of the active profiler; a no-op when nothing is being profiled."""
+    if _active is None:
+        yield None; return
+    with _active.stage(name, **args) as rec:
+        yield rec
+
+def record_http(source: str, **counts):
+    if _active is not None: _active.record_http(source, **counts)
+
+def compare(report: dict, baseline: dict) -> list[dict]:
+    """Stage totals of ``report`` against ``baseline`` (both ``Profiler.report`` dicts), largest slowdown first."""
+    rows = []
+    for name in sorted(set(report["stages"]) | set(baseline["stages"])):
+        new, old = report["stages"].get(name, {}).get("total_s"), baseline["stages"].get(name, {}).get("total_s")
+        delta = None if new is None or old is None else round(new - old, 4)
+        rows.append({"stage": name, "baseline_s": old, "run_s": new, "delta_s": delta,
+                     "ratio": round(new / old, 3) if delta is not None and old else None})
+    return sorted(rows, key=lambda r: -(r["delta_s"] or 0))
+
+def profile_run(fn, out_dir: str = os.path.join("artifacts", "profiles"), cprofile=(), baseline: str | None = None,
+                name: str | None = None) -> dict:
+    """Run ``fn()`` under a ``Profiler`` and write its report and trace to ``out_dir``.
+
+    Returns the report with the written ``paths`` and, given a ``baseline`` report file, a ``compare`` table.
+    """
+    prof = Profiler(cprofile=cprofile)
+    with prof:
+        with prof.stage("total"):
+            fn()
+    paths = prof.write(out_dir, name)
+    report = {**prof.report(), "paths": paths}
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as f:
+            report["compare"] = compare(report, json.load(f))
+    return report
@@ -0,0 +1,190 @@
+from __future__ import annotations
+import os, json, time, threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np, pandas as pd
+from utils import load_config
+from infer import load_sarimax, load_xgb, base_forecast, model_files
+from model_store import MANIFEST, align_features
+from pipeline import make_future_features_builder, FeatureState
+
+MODELS_ROOT = os.path.join("artifacts", "models")
+
+def _version(model_dir: str) -> int:
+    """mtime of the manifest in ``model_dir``. Training and updates write it after every other artifact, so a
+    model counts as a new version only once it is complete."""
+    try:
+        return os.stat(os.path.join(model_dir, MANIFEST)).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No trained model in '{model_dir}'") from None
+
+class ModelCache:
+    """LRU of loaded models keyed by (model dir, version), so a new version is picked up on the next request.
+
+    Models load outside the cache lock, so a reload does not hold up requests for other models; concurrent
+    requests for the same version wait for a single load.
+    """
+    def __init__(self, cfg: dict, capacity: int = 8, models_root: str = MODELS_ROOT):
+        self.cfg, self.capacity, self.models_root = cfg, capacity, models_root
+        self._entries: OrderedDict = OrderedDict()
+        self._loading: dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, model: str) -> str:
+        path = os.path.normpath(os.path.join(self.models_root, model or ""))
+        if os.path.commonpath([os.path.abspath(path), os.path.abspath(self.models_root)]) != os.path.abspath(self.models_root):
+            raise ValueError(f"Unknown model '{model}'")
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No model directory '{path}'")
+        return path
+
+    def _history(self, model: str) -> pd.Series:
+        from panel import model_history
+        return model_history(self.cfg, model)
+
+    def _load(self, model: str, path: str, version: int) -> dict:
+        history = self._history(model)
+        state_path = os.path.join(path, "feature_state.json")
+        state = FeatureState.load(state_path) if os.path.exists(state_path) else None
+        sar_path, xgb_path, columns = model_files(path)
+        return {"model": model, "version": version, "sar": load_sarimax(sar_path), "xgb": load_xgb(xgb_path),
+                "columns": columns, "history": history, "builder": make_future_features_builder(self.cfg, state),
+                "prepared": None, "min_steps": max(self.cfg.get("horizons") or [1]), "lock": threading.Lock()}
+
+    def get(self, model: str) -> dict:
+        path = self._resolve(model)
+        key = (path, _version(path))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key); return self._entries[key]
+            fut, loader = self._loading.get(key), key not in self._loading
+            if loader:
+                fut = self._loading[key] = Future()
+        if not loader:
+            return fut.result()
+        try:
+            entry = self._load(model, path, key[1])
+        except BaseException as e:
+            with self._lock: del self._loading[key]
+            fut.set_exception(e); raise
+        try:
+            fresh = _version(path) == key[1]  # not rewritten while loading: safe to keep
+        except FileNotFoundError:
+            fresh = False
+        with self._lock:
+            del self._loading[key]
+            if fresh:
+                for old in [k for k in self._entries if k[0] == path]:
+                    del self._entries[old]  # superseded version
+                self._entries[key] = entry
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+        fut.set_result(entry)
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"capacity": self.capacity, "loaded": [{"model": e["model"], "version": e["version"]} for e in self._entries.values()]}
+
+def prepare(entry: dict, steps: int) -> tuple[pd.DataFrame, np.ndarray]:
+    """Base SARIMAX forecast and hybrid forecast values for ``steps`` days.
+
+    Each loaded model version keeps one forecast, for the longest horizon asked so far (at least the longest
+    configured one); every shorter request is a slice of it, so concurrent requests share one feature build
+    and one ``predict`` whatever their horizons, and the memo does not grow with them.
+    """
+    with entry["lock"]:
+        base, values = entry["prepared"] or (None, None)
+        if base is None or len(base) < steps:
+            n = max(steps, entry["min_steps"])
+            history = entry["history"]
+            base = base_forecast(entry["sar"], n)
+            base.insert(0, "date", pd.date_range(history.index.max() + pd.Timedelta(days=1), periods=n, freq="D"))
+            values = base["base"].to_numpy(dtype=float)
+            if entry["xgb"] is not None:
+                feats = entry["builder"](history, pd.DatetimeIndex(base["date"]))
+                names = entry["columns"] or getattr(entry["xgb"], "feature_names_in_", None)
+                feats = align_features(feats, list(names) if names is not None else None)
+                if not feats.empty:
+                    values = values + np.asarray(entry["xgb"].predict(feats.to_numpy(dtype=float)), dtype=float)
+            entry["prepared"] = (base, values)
+        return base.iloc[:steps], values[:steps]
+
+class LatencyTracker:
+    def __init__(self, size: int = 10000):
+        self._samples: dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self.size = size
+
+    def record(self, route: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(route, deque(maxlen=self.size)).append(seconds * 1000.0)
+
+    def report(self) -> dict:
+        with self._lock:
+            snap = {k: np.array(v) for k, v in self._samples.items()}
+        return {k: {"count": int(len(v)), "p50_ms": float(np.percentile(v, 50)), "p90_ms": float(np.percentile(v, 90)),
+                    "p99_ms": float(np.percentile(v, 99)), "max_ms": float(v.max())} for k, v in snap.items() if len(v)}
+
+class ForecastService:
+    def __init__(self, cfg: dict, models_root: str = MODELS_ROOT):
+        scfg = cfg.get("server", {}) or {}
+        self.models = ModelCache(cfg, capacity=int(scfg.get("cache_size", 8)), models_root=models_root)
+        self.latency = LatencyTracker()
+
+    def forecast(self, model: str, horizon: int) -> dict:
+        entry = self.models.get(model)
+        base, values = prepare(entry, horizon)
+        return {"model": model, "version": entry["version"], "horizon": horizon,
+                "forecast": [{"date": d.date().isoformat(), "forecast": float(v), "lower_95": float(lo), "upper_95": float(hi)}
+                             for d, v, lo, hi in zip(base["date"], values, base["lower_95"], base["upper_95"])]}
+
+def make_handler(service: ForecastService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload: dict):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers(); self.wfile.write(body)
+
+        def do_GET(self):
+            t0 = time.perf_counter()
+            url = urlparse(self.path); qs = parse_qs(url.query)
+            try:
+                if url.path == "/forecast":
+                    horizon = int(qs.get("horizon", ["30"])[0])
+                    if not 1 <= horizon <= 3650: raise ValueError("horizon must be between 1 and 3650 days")
+                    self._send(200, service.forecast(qs.get("model", [""])[0], horizon))
+                elif url.path == "/latency":
+                    self._send(200, {"latency": service.latency.report()})
+                elif url.path == "/health":
+                    self._send(200, {"status": "ok", "models": service.models.stats()})
+                else:
+                    self._send(404, {"error": f"unknown path {url.path}"})
+            except (ValueError, KeyError, FileNotFoundError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            finally:
+                service.latency.record(url.path, time.perf_counter() - t0)
+
+        def log_message(self, fmt, *args):
+            pass
+    return Handler
+
+def serve(config_path: str = "config.yaml", host: str | None = None, port: int | None = None):
+    """Serve JSON forecasts: GET /forecast?horizon=30[&model=panel/<slug>], /latency, /health."""
+    cfg = load_config(config_path)
+    scfg = cfg.get("server", {}) or {}
+    host, port = host or scfg.get("host", "127.0.0.1"), int(port or scfg.get("port", 8000))
+    httpd = ThreadingHTTPServer((host, port), make_handler(ForecastService(cfg)))
+    print(f"Serving forecasts on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
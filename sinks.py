@@ -0,0 +1,90 @@
+from __future__ import annotations
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from profiling import stage
+
+HISTORY_DAYS = 120
+COLUMNS = ["horizon", "date", "forecast", "lower_95", "upper_95"]
+
+def consolidate(outs: dict[int, pd.DataFrame]) -> pd.DataFrame:
+    """One long table for all horizons, keyed by a ``horizon`` column (extra columns such as quantiles follow)."""
+    table = pd.concat([df.assign(horizon=h) for h, df in outs.items()], ignore_index=True)
+    return table[COLUMNS + [c for c in table.columns if c not in COLUMNS]]
+
+def write_table(table: pd.DataFrame, path_stem: str, fmt: str) -> str | None:
+    """Write ``table`` to ``<path_stem>.<fmt>`` (csv, parquet or arrow); None if that format's library is missing."""
+    if fmt not in ("csv", "parquet", "arrow"):
+        raise ValueError(f"Unknown output format '{fmt}' (expected parquet, arrow or csv)")
+    path = f"{path_stem}.{fmt}"
+    try:
+        if fmt == "csv": table.to_csv(path, index=False)
+        elif fmt == "parquet": table.to_parquet(path, index=False)
+        else: table.to_feather(path)
+    except ImportError as e:
+        print(f"Skipping {fmt} output: {e}"); return None
+    return path
+
+def write_tables(outs: dict[int, pd.DataFrame], out_dir: str, prefix: str = "forecast",
+                 formats=("parquet", "csv")) -> list[str]:
+    """``parquet``/``arrow`` write one consolidated file; ``csv`` keeps the per-horizon ``<prefix>_<h>d.csv`` files."""
+    paths, table = [], None
+    for fmt in formats:
+        if fmt == "csv":
+            paths += [write_table(df, os.path.join(out_dir, f"{prefix}_{h}d"), "csv") for h, df in outs.items()]
+            continue
+        table = consolidate(outs) if table is None else table
+        path = write_table(table, os.path.join(out_dir, prefix), fmt)
+        if path: paths.append(path)
+    return paths
+
+def history_tail(s: pd.Series, days: int = HISTORY_DAYS) -> pd.Series:
+    return s[s.index > s.index.max() - pd.Timedelta(days=days)]
+
+def render_plot(hist: pd.Series, df: pd.DataFrame, h: int, path: str) -> str:
+    # a bare Figure renders through Agg without touching pyplot's global state, so it is safe in any process
+    from matplotlib.figure import Figure
+    fig = Figure(); ax = fig.subplots()
+    ax.plot(hist.index, hist.values, label="History")
+    ax.plot(df["date"], df["forecast"], label=f"Forecast {h}d")
+    ax.fill_between(df["date"], df["lower_95"], df["upper_95"], alpha=0.2, label="95% PI")
+    ax.set_title(f"Rice Price {h}-Day Forecast"); ax.set_xlabel("Date"); ax.set_ylabel("Price"); ax.legend()
+    fig.tight_layout(); fig.savefig(path, dpi=120)
+    return path
+
+class PlotRenderer:
+    """Forecast plots rendered ``inline``, in a ``background`` process pool, or not at all (``off``).
+
+    In background mode ``submit`` returns immediately; call ``wait`` before exiting to collect the files.
+    """
+    def __init__(self, mode: str = "background", workers: int = 2):
+        if mode not in ("inline", "background", "off"):
+            raise ValueError(f"Unknown plot mode '{mode}' (expected inline, background or off)")
+        self.mode, self.workers = mode, workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._futs: list = []
+
+    def submit(self, history: pd.Series, df: pd.DataFrame, h: int, path: str):
+        if self.mode == "off": return
+        hist = history_tail(history)
+        if self.mode == "inline":
+            with stage("render_plot", horizon=h):
+                render_plot(hist, df, h, path)
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._futs.append(self._pool.submit(render_plot, hist, df, h, path))
+
+    def wait(self) -> list[str]:
+        paths = [f.result() for f in self._futs]
+        self._futs = []
+        if self._pool is not None:
+            self._pool.shutdown(); self._pool = None
+        return paths
+
+def output_formats(cfg: dict) -> list[str]:
+    return list((cfg.get("output", {}) or {}).get("formats", ["parquet", "csv"]))
+
+def plot_renderer(cfg: dict, mode: str | None = None) -> PlotRenderer:
+    ocfg = cfg.get("output", {}) or {}
+    return PlotRenderer(mode or ocfg.get("plots", "background"), int(ocfg.get("plot_workers", 2)))
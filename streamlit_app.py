@@ -1,62 +1,232 @@
-
 import os, datetime
 import streamlit as st
 import pandas as pd
 
-from data_gov_india import fetch_datagov_prices_csv
-
-st.set_page_config(page_title="Rice Fetcher — Minimal", page_icon="🌾", layout="wide")
-st.title("🌾 Rice Data Fetcher (Minimal, Self-contained)")
-
-with st.expander("Fetch from data.gov.in", expanded=True):
-    col1, col2 = st.columns(2)
-    with col1:
-        api_key     = st.text_input("API key", type="password", key="api_key")
-        resource_id = st.text_input("Resource ID (UUID or full URL)", "", key="res_id")
-        commodity   = st.text_input("Commodity filter", "Rice", key="comm")
-    with col2:
-        state   = st.text_input("State (optional)", "", key="state")
-        centre  = st.text_input("Centre/City (optional)", "", key="centre")
-        dfrom   = st.text_input("From (YYYY-MM-DD)", "", key="from")
-        dto     = st.text_input("To (YYYY-MM-DD)", "", key="to")
-
-    st.markdown("**Save options**")
-    c3, c4 = st.columns([2,1])
-    with c3:
-        base_name = st.text_input("Output file name (no folders)", "basmati_prices.csv", key="outname")
-    with c4:
-        add_ts = st.checkbox("Add date suffix", value=True, key="addts")
-
-    if st.button("Fetch data", key="fetch"):
-        if not api_key or not resource_id:
-            st.error("Please enter API key and resource_id")
+from jobs import JobRunner
+from utils import load_config, ensure_dir, today_str
+from price_store import load_prices, price_query
+
+MODELS_ROOT = os.path.join("artifacts", "models")
+
+st.set_page_config(page_title="Rice Price Forecasts", page_icon="🌾", layout="wide")
+st.title("🌾 Rice Price Forecasts")
+
+# --- cached resources: everything is keyed by file mtimes, so a fetch or retrain is picked up on the next rerun ---
+
+def _mtime(path: str) -> int:
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+
+@st.cache_resource
+def job_runner() -> JobRunner:
+    return JobRunner(max_workers=2)
+
+@st.cache_data(show_spinner=False)
+def config(path: str, version: int) -> dict:
+    return load_config(path)
+
+@st.cache_data(show_spinner="Loading prices…", max_entries=4)
+def price_history(config_path: str, version: tuple) -> pd.Series:
+    return load_prices(price_query(config(config_path, version[0])))
+
+@st.cache_resource(show_spinner="Loading models…", max_entries=2)
+def forecast_service(config_path: str, version: int):
+    # the service's ModelCache is itself keyed by (model dir, manifest mtime), as is ``model_version``
+    from server import ForecastService
+    return ForecastService(config(config_path, version))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def cached_forecast(config_path: str, version: int, model: str, model_version: int, horizon: int) -> pd.DataFrame:
+    out = forecast_service(config_path, version).forecast(model, horizon)
+    df = pd.DataFrame(out["forecast"])
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+def price_version(cfg_path: str, cfg: dict) -> tuple:
+    return (_mtime(cfg_path), _mtime(price_query(cfg).path))
+
+def model_version(model_dir: str) -> int:
+    from server import _version  # the server's own key: the manifest, written once a model is complete
+    return _version(model_dir)
+
+def available_models() -> list[str]:
+    """Trained model names as the forecast server takes them: "" for the main model, then ``panel/<slug>``."""
+    def trained(d: str) -> bool:
+        return os.path.exists(os.path.join(d, "manifest.json"))
+    models = [""] if os.path.isdir(MODELS_ROOT) and trained(MODELS_ROOT) else []
+    panel_root = os.path.join(MODELS_ROOT, "panel")
+    if os.path.isdir(panel_root):
+        models += [f"panel/{e.name}" for e in sorted(os.scandir(panel_root), key=lambda e: e.name)
+                   if e.is_dir() and trained(e.path)]
+    return models
+
+# --- background jobs: each takes a progress callback first ---
+
+def _fetch_datagov_job(progress, **kwargs):
+    from data_gov_india import fetch_datagov_prices_csv
+    progress(0.1, "downloading pages")
+    return fetch_datagov_prices_csv(**kwargs)
+
+def _fetch_agmarknet_job(progress, **kwargs):
+    from agmarknet_api import fetch_basmati_prices_csv
+    progress(0.1, "requesting prices")
+    return fetch_basmati_prices_csv(**kwargs)
+
+def _train_job(progress, config_path: str):
+    from pipeline import run_pipeline
+    progress(0.1, "training models and writing forecasts")
+    run_pipeline(config_path=config_path, plots="off")
+    return os.path.join("artifacts", today_str())
+
+def _update_job(progress, config_path: str):
+    from update import run_update
+    progress(0.1, "updating models with new prices")
+    return run_update(config_path=config_path, plots="off")
+
+def _forecast_job(progress, config_path: str, horizons: list[int]):
+    from infer import model_files, forecast
+    from pipeline import make_future_features_builder, FeatureState
+    from sinks import output_formats
+    cfg = load_config(config_path)
+    progress(0.1, "loading prices")
+    price_s = load_prices(price_query(cfg))
+    state_path = os.path.join(MODELS_ROOT, "feature_state.json")
+    state = FeatureState.load(state_path) if os.path.exists(state_path) else None
+    sar_path, xgb_path, _ = model_files(MODELS_ROOT)
+    out_root = os.path.join("artifacts", today_str()); ensure_dir(out_root)
+    progress(0.3, "forecasting")
+    forecast(sar_path, xgb_path, price_s, make_future_features_builder(cfg, state), horizons, out_root, "forecast",
+             plot=False, formats=output_formats(cfg), intervals=cfg.get("intervals"))
+    return out_root
+
+def submit(name: str, fn, *args, **kwargs):
+    runner = job_runner()
+    if runner.running(name):
+        st.warning(f"A '{name}' job is already running.")
+    else:
+        runner.submit(name, fn, *args, **kwargs)
+        st.toast(f"Started: {name}")
+
+# --- layout ---
+
+with st.sidebar:
+    config_path = st.text_input("Config file", "config.yaml", key="cfg_path")
+    if not os.path.exists(config_path):
+        st.error(f"Config file not found: {config_path}"); st.stop()
+    cfg_version = _mtime(config_path)
+    cfg = config(config_path, cfg_version)
+    horizons = [int(h) for h in cfg.get("horizons", [7, 30, 180])]
+    st.markdown("**Jobs**")
+    if st.button("Train (full refit)", key="job_train", use_container_width=True):
+        submit("train", _train_job, config_path)
+    if st.button("Update models", key="job_update", use_container_width=True):
+        submit("update", _update_job, config_path)
+    if st.button("Write forecasts", key="job_forecast", use_container_width=True, disabled=not available_models()):
+        submit("forecast", _forecast_job, config_path, horizons)
+
+def job_panel():
+    jobs = job_runner().jobs()
+    seen = st.session_state.setdefault("finished_jobs", set())
+    newly = [j for j in jobs if not j.active and j.id not in seen]
+    if newly:
+        seen.update(j.id for j in newly)
+        st.rerun()  # new artifacts (and no more polling if nothing else runs): refresh the whole page
+    if not jobs:
+        st.caption("No jobs yet."); return
+    for j in jobs[:5]:
+        label = f"**{j.name}** · {j.status} · {j.seconds:.1f}s"
+        if j.active:
+            st.progress(j.progress, text=f"{label} · {j.message}")
+        elif j.status == "failed":
+            st.error(label); st.code(j.error or "", language=None)
         else:
-            # Force root save only; optionally add timestamp
-            name_only = os.path.basename(base_name.strip() or "basmati_prices.csv")
-            if add_ts:
-                stem, ext = os.path.splitext(name_only)
-                name_only = f"{stem}_{datetime.date.today().isoformat()}{ext or '.csv'}"
-            try:
-                path = fetch_datagov_prices_csv(
-                    api_key=api_key,
-                    resource_id=resource_id,
-                    out_csv=name_only,            # <-- always root
-                    commodity_filter=commodity,
-                    state=state or None,
-                    centre=centre or None,
-                    date_from=dfrom or None,
-                    date_to=dto or None,
-                    prefer_csv=False
-                )
-                st.success(f"Saved: {path}")
-                try:
-                    df = pd.read_csv(path)
-                    st.dataframe(df.tail(20))
-                    st.download_button("Download CSV", data=df.to_csv(index=False).encode("utf-8"),
-                                       file_name=os.path.basename(path), mime="text/csv", key="dl")
-                except Exception as e:
-                    st.info(f"File saved to {path}. (Preview failed: {e})")
-            except Exception as e:
-                st.exception(e)
-
-st.caption("Tip: Resource ID must be the dataset UUID (or you can paste the full URL; the app will extract it).")
+            st.success(f"{label} · {j.result if isinstance(j.result, str) else 'ok'}")
+
+with st.sidebar:
+    # poll only while something runs; submitting a job reruns the page, which turns polling back on
+    st.fragment(run_every=1.0 if job_runner().running() else None)(job_panel)()
+
+tab_fc, tab_data = st.tabs(["Forecast", "Data"])
+
+with tab_fc:
+    models = available_models()
+    if not models:
+        st.info("No trained models yet: fetch prices in the Data tab, then start **Train** from the sidebar.")
+    else:
+        c1, c2 = st.columns([2, 1])
+        with c1:
+            model = st.selectbox("Model", models, format_func=lambda m: m or "main", key="fc_model")
+        with c2:
+            horizon = st.select_slider("Horizon (days)", options=sorted(set(horizons + [7, 14, 30, 60, 90, 180])),
+                                       value=max(horizons), key="fc_h")
+        try:
+            fc = cached_forecast(config_path, cfg_version, model, model_version(os.path.join(MODELS_ROOT, model)), horizon)
+            history = price_history(config_path, price_version(config_path, cfg)) if not model else None
+            chart = fc.set_index("date")[["forecast", "lower_95", "upper_95"]]
+            if history is not None:
+                chart = pd.concat([history[history.index > history.index.max() - pd.Timedelta(days=120)].rename("history"), chart], axis=1)
+            st.line_chart(chart)
+            st.dataframe(fc, use_container_width=True, hide_index=True)
+            st.download_button("Download CSV", data=fc.to_csv(index=False).encode("utf-8"),
+                               file_name=f"forecast_{horizon}d.csv", mime="text/csv", key="fc_dl")
+        except Exception as e:
+            st.exception(e)
+
+with tab_data:
+    try:
+        hist = price_history(config_path, price_version(config_path, cfg))
+        st.caption(f"{len(hist)} days, {hist.index.min().date()} → {hist.index.max().date()}")
+        st.line_chart(hist.rename("price"))
+    except Exception as e:
+        st.info(f"No price history yet ({e}).")
+
+    with st.expander("Fetch from data.gov.in", expanded=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            api_key     = st.text_input("API key", type="password", key="dg_api")
+            resource_id = st.text_input("Resource ID (UUID or full URL)", "", key="dg_resid")
+            commodity   = st.text_input("Commodity filter", "Rice", key="dg_comm")
+        with col2:
+            state   = st.text_input("State (optional)", "", key="dg_state")
+            centre  = st.text_input("Centre/City (optional)", "", key="dg_centre")
+            dfrom   = st.text_input("From (YYYY-MM-DD)", "", key="dg_from")
+            dto     = st.text_input("To (YYYY-MM-DD)", "", key="dg_to")
+        c3, c4 = st.columns([2, 1])
+        with c3:
+            out_csv = st.text_input("Save to CSV", cfg.get("price_csv", "basmati_prices.csv"), key="dg_outcsv")
+        with c4:
+            add_ts = st.checkbox("Add date suffix", value=False, key="dg_addts")
+        if st.button("Fetch data", key="dg_btn"):
+            if not api_key or not resource_id:
+                st.error("Please enter API key and resource_id")
+            else:
+                path = out_csv.strip() or "basmati_prices.csv"
+                if add_ts:
+                    stem, ext = os.path.splitext(path)
+                    path = f"{stem}_{datetime.date.today().isoformat()}{ext or '.csv'}"
+                if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+                submit("fetch data.gov.in", _fetch_datagov_job, api_key=api_key, resource_id=resource_id, out_csv=path,
+                       commodity_filter=commodity, state=state or None, centre=centre or None,
+                       date_from=dfrom or None, date_to=dto or None)
+        st.caption("Tip: Resource ID must be the dataset UUID (or you can paste the full URL; the app will extract it).")
+
+    with st.expander("Fetch from Agmarknet (CEDA API)", expanded=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            ag_state = st.text_input("State", "Haryana", key="ag_state")
+            market = st.text_input("Market", "Karnal", key="ag_market")
+            variety = st.text_input("Variety keywords (comma-separated)", "Basmati,1121,1509,1718,PB-1", key="ag_variety")
+        with col2:
+            ag_from = st.text_input("From (YYYY-MM-DD)", "", key="ag_from")
+            ag_to   = st.text_input("To (YYYY-MM-DD)", "", key="ag_to")
+            ag_out  = st.text_input("Save to CSV", cfg.get("price_csv", "data/basmati_prices.csv"), key="ag_outcsv")
+        col3, col4 = st.columns(2)
+        with col3:
+            base_url = st.text_input("CEDA API Base URL", "https://api.ceda.ashoka.edu.in", key="ag_base")
+        with col4:
+            ag_key = st.text_input("CEDA API Key (optional)", "", key="ag_key")
+        sync = st.checkbox("Only fetch dates after the latest saved one", value=True, key="ag_sync")
+        if st.button("Fetch from Agmarknet", key="ag_btn"):
+            submit("fetch Agmarknet", _fetch_agmarknet_job, out_csv=ag_out, state=ag_state or None, market=market or None,
+                   variety_keywords=[k.strip() for k in variety.split(",") if k.strip()],
+                   date_from=ag_from or None, date_to=ag_to or None, commodity_name="Paddy",
+                   base_url=base_url, api_key=(ag_key or None), sync=sync)
@@ -1,7 +1,12 @@
-
 from __future__ import annotations
+import json, math, copy
+from collections import deque
 import pandas as pd, numpy as np
 
+WINDOWS = [3, 7, 14, 30]
+LAGS = [1, 2, 3, 7, 14, 30]
+RSI_PERIOD = 14
+
 def rsi(series: pd.Series, period: int = 14) -> pd.Series:
     delta = series.diff()
     gain = (delta.where(delta > 0, 0)).rolling(period).mean()
@@ -9,14 +14,255 @@ def rsi(series: pd.Series, period: int = 14) -> pd.Series:
     rs = gain / (loss.replace(0, 1e-9))
     return 100 - (100 / (1 + rs))
 
-def rolling_features(s: pd.Series) -> pd.DataFrame:
+def rolling_features_reference(s: pd.Series) -> pd.DataFrame:
+    """The column-by-column pandas definition of the price features (float64); ``FeatureState`` reproduces it
+    exactly, ``feature_matrix`` to float32 precision, missing prices included."""
     df = pd.DataFrame({'price': s})
-    df['ret'] = df['price'].pct_change()
-    for win in [3,7,14,30]:
+    df['ret'] = df['price'].pct_change(fill_method=None)  # no padding over gaps: a return next to one is NaN
+    for win in WINDOWS:
         df[f'sma_{win}'] = df['price'].rolling(win).mean()
         df[f'ema_{win}'] = df['price'].ewm(span=win, adjust=False).mean()
         df[f'vol_{win}'] = df['ret'].rolling(win).std()
-    df['rsi_14'] = rsi(df['price'], 14)
-    for l in [1,2,3,7,14,30]:
+    df['rsi_14'] = rsi(df['price'], RSI_PERIOD)
+    for l in LAGS:
         df[f'lag_{l}'] = df['price'].shift(l)
     return df
+
+def rolling_features(s: pd.Series) -> pd.DataFrame:
+    """Price features of ``s`` as one float32 block (see ``feature_matrix``)."""
+    return pd.DataFrame(feature_matrix(s.to_numpy(dtype=float)), index=s.index, columns=feature_columns(), copy=False)
+
+def feature_columns() -> list[str]:
+    cols = ['price', 'ret']
+    for win in WINDOWS:
+        cols += [f'sma_{win}', f'ema_{win}', f'vol_{win}']
+    return cols + ['rsi_14'] + [f'lag_{l}' for l in LAGS]
+
+def _window_sums(x: np.ndarray, win: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Trailing ``win``-sums of x and x**2 from cumulative sums, and a mask of windows without NaN/inf
+    (pandas' min_periods=win). Row i covers x[i-win+1..i]; the first win-1 rows are never complete."""
+    ok = np.isfinite(x)
+    v = np.where(ok, x, 0.0)
+    c1 = np.concatenate(([0.0], np.cumsum(v))); c2 = np.concatenate(([0.0], np.cumsum(v * v)))
+    cn = np.concatenate(([0], np.cumsum(ok)))
+    s1, s2, full = np.zeros(len(x)), np.zeros(len(x)), np.zeros(len(x), dtype=bool)
+    s1[win - 1:], s2[win - 1:] = c1[win:] - c1[:-win], c2[win:] - c2[:-win]
+    full[win - 1:] = (cn[win:] - cn[:-win]) == win
+    return s1, s2, full
+
+def _rolling_mean(x: np.ndarray, win: int) -> np.ndarray:
+    s1, _, full = _window_sums(x, win)
+    return np.where(full, s1 / win, np.nan)
+
+def _rolling_std(x: np.ndarray, win: int) -> np.ndarray:
+    s1, s2, full = _window_sums(x, win)
+    var = np.maximum(s2 - s1 * s1 / win, 0.0) / (win - 1)
+    return np.where(full, np.sqrt(var), np.nan)
+
+def _ema(x: np.ndarray, win: int) -> np.ndarray:
+    """``ewm(span=win, adjust=False).mean()`` as one linear recursion (scipy's lfilter) from the first valid value."""
+    ok = np.isfinite(x)
+    if not ok.any(): return np.full(len(x), np.nan)
+    f = int(np.argmax(ok))
+    if not ok[f:].all():  # gaps inside the series: pandas' NaN weighting, not worth re-deriving
+        return pd.Series(x).ewm(span=win, adjust=False).mean().to_numpy()
+    from scipy.signal import lfilter
+    a = 2.0 / (win + 1.0)
+    out = np.full(len(x), np.nan)
+    out[f:] = lfilter([a], [1.0, a - 1.0], x[f:], zi=[(1.0 - a) * x[f]])[0]
+    return out
+
+def feature_matrix(prices: np.ndarray, out: np.ndarray | None = None, dtype=np.float32) -> np.ndarray:
+    """All ``feature_columns()`` of a daily price array in one pass over cumulative sums, written into ``out``
+    (an (n, len(feature_columns())) array or column slice of a wider one; allocated as ``dtype`` if None).
+
+    Window statistics are accumulated in float64 and stored once; lag columns are copied straight from offset
+    views of ``prices``. Matches ``rolling_features_reference`` to float32 precision, NaN for NaN.
+    """
+    p = np.asarray(prices, dtype=np.float64)
+    n = len(p)
+    if out is None: out = np.empty((n, len(feature_columns())), dtype=dtype)
+    out[:, 0] = p
+    ret = np.full(n, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret[1:] = p[1:] / p[:-1] - 1
+    out[:, 1] = ret
+    j = 2
+    for win in WINDOWS:
+        out[:, j] = _rolling_mean(p, win); out[:, j + 1] = _ema(p, win); out[:, j + 2] = _rolling_std(ret, win)
+        j += 3
+    delta = np.empty(n); delta[0] = np.nan; delta[1:] = p[1:] - p[:-1]
+    gain = _rolling_mean(np.where(delta > 0, delta, 0.0), RSI_PERIOD)
+    loss = _rolling_mean(np.where(delta < 0, -delta, 0.0), RSI_PERIOD)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[:, j] = 100 - 100 / (1 + gain / np.where(loss == 0, 1e-9, loss))
+    for l in LAGS:
+        j += 1
+        out[:min(l, n), j] = np.nan; out[l:, j] = p[:max(n - l, 0)]
+    return out
+
+# Running accumulators below follow pandas' own online kernels (Kahan-compensated add/remove for rolling
+# mean, Welford for rolling variance, the adjust=False ewm recursion) so that results are bit-identical.
+
+def _isnan(x: float) -> bool:
+    return x != x
+
+def _window(win: int) -> dict:
+    return {"win": win, "buf": deque(), "nobs": 0, "sum": 0.0, "mean": 0.0, "ssq": 0.0, "neg": 0,
+            "comp_add": 0.0, "comp_rem": 0.0, "same": 0, "prev": float("nan")}
+
+def _dump(w: dict) -> dict:
+    return {**w, "buf": list(w["buf"])}
+
+def _undump(w: dict) -> dict:
+    return {**w, "buf": deque(w["buf"])}
+
+def _mean_push(w: dict, val: float):
+    if math.isinf(val): val = float("nan")  # pandas drops +-inf before windowing
+    w["buf"].append(val)
+    if len(w["buf"]) > w["win"]:
+        old = w["buf"].popleft()
+        if not _isnan(old):
+            w["nobs"] -= 1
+            y = -old - w["comp_rem"]; t = w["sum"] + y
+            w["comp_rem"] = t - w["sum"] - y; w["sum"] = t
+            if math.copysign(1.0, old) < 0: w["neg"] -= 1
+    if not _isnan(val):
+        w["nobs"] += 1
+        y = val - w["comp_add"]; t = w["sum"] + y
+        w["comp_add"] = t - w["sum"] - y; w["sum"] = t
+        if math.copysign(1.0, val) < 0: w["neg"] += 1
+        w["same"] = w["same"] + 1 if val == w["prev"] else 1
+        w["prev"] = val
+
+def _mean_value(w: dict) -> float:
+    n = w["nobs"]
+    if n < w["win"] or n == 0: return float("nan")
+    if w["same"] >= n: return w["prev"]
+    res = w["sum"] / n
+    if w["neg"] == 0 and res < 0: return 0.0
+    if w["neg"] == n and res > 0: return 0.0
+    return res
+
+def _var_push(w: dict, val: float):
+    if math.isinf(val): val = float("nan")  # pandas drops +-inf before windowing
+    w["buf"].append(val)
+    if len(w["buf"]) > w["win"]:
+        old = w["buf"].popleft()
+        if not _isnan(old):
+            w["nobs"] -= 1
+            if w["nobs"]:
+                prev_mean = w["mean"] - w["comp_rem"]
+                y = old - w["comp_rem"]; t = y - w["mean"]
+                w["comp_rem"] = t + w["mean"] - y
+                w["mean"] = w["mean"] - t / w["nobs"]
+                w["ssq"] = w["ssq"] - (old - prev_mean) * (old - w["mean"])
+            else:
+                w["mean"] = 0.0; w["ssq"] = 0.0
+    if not _isnan(val):
+        w["nobs"] += 1
+        w["same"] = w["same"] + 1 if val == w["prev"] else 1
+        w["prev"] = val
+        prev_mean = w["mean"] - w["comp_add"]
+        y = val - w["comp_add"]; t = y - w["mean"]
+        w["comp_add"] = t + w["mean"] - y
+        w["mean"] = w["mean"] + t / w["nobs"]
+        w["ssq"] = w["ssq"] + (val - prev_mean) * (val - w["mean"])
+
+def _std_value(w: dict) -> float:
+    n = w["nobs"]
+    if n < w["win"] or n <= 1: return float("nan")
+    if w["same"] >= n: return 0.0
+    var = w["ssq"] / (n - 1)
+    return math.sqrt(var) if var > 0 else 0.0
+
+class FeatureState:
+    """Running state behind ``rolling_features``: one O(1) update per new daily price.
+
+    ``FeatureState.from_series(s).extend(new)`` returns the same rows as
+    ``rolling_features_reference(pd.concat([s, new]))`` restricted to ``new``, without touching the history again. The state round-trips through ``to_dict``/JSON.
+    """
+    def __init__(self):
+        self.n = 0
+        self.last_date: pd.Timestamp | None = None
+        self.prices = deque(maxlen=max(LAGS) + 1)
+        self.ema = {win: None for win in WINDOWS}
+        self.ema_wt = {win: 1.0 for win in WINDOWS}  # weight of the running ema, decayed over missing prices
+        self.sma = {win: _window(win) for win in WINDOWS}
+        self.vol = {win: _window(win) for win in WINDOWS}
+        self.gain, self.loss = _window(RSI_PERIOD), _window(RSI_PERIOD)
+
+    @classmethod
+    def from_series(cls, s: pd.Series) -> "FeatureState":
+        st = cls()
+        for v in s.to_numpy(dtype=float):
+            st.update(v)
+        if len(s): st.last_date = pd.Timestamp(s.index[-1])
+        return st
+
+    def update(self, price: float) -> list[float]:
+        """Consume one observation and return its feature row in ``feature_columns()`` order."""
+        price = float(price)
+        prev = self.prices[-1] if self.prices else float("nan")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ret = float(np.float64(price) / prev) - 1 if self.prices else float("nan")
+        self.prices.append(price); self.n += 1
+        delta = price - prev
+        _mean_push(self.gain, delta if delta > 0 else 0.0)
+        _mean_push(self.loss, -(delta if delta < 0 else 0.0))
+        row = [price, ret]
+        for win in WINDOWS:
+            _mean_push(self.sma[win], price); _var_push(self.vol[win], ret)
+            alpha = 2.0 / (win + 1.0); w = self.ema[win]
+            if w is None or _isnan(w):
+                w = price
+            else:
+                old = self.ema_wt[win] * (1.0 - alpha)
+                if _isnan(price):
+                    self.ema_wt[win] = old
+                else:
+                    if w != price: w = (old * w + alpha * price) / (old + alpha)
+                    self.ema_wt[win] = 1.0
+            self.ema[win] = w
+            row += [_mean_value(self.sma[win]), w, _std_value(self.vol[win])]
+        g, l = _mean_value(self.gain), _mean_value(self.loss)
+        rs = g / (l if l != 0 else 1e-9)
+        row.append(100 - (100 / (1 + rs)))
+        row += [self.prices[-1 - l] if len(self.prices) > l else float("nan") for l in LAGS]
+        return row
+
+    def extend(self, s: pd.Series) -> pd.DataFrame:
+        rows = [self.update(v) for v in s.to_numpy(dtype=float)]
+        if len(s): self.last_date = pd.Timestamp(s.index[-1])
+        return pd.DataFrame(rows, index=s.index, columns=feature_columns(), dtype=float)
+
+    def copy(self) -> "FeatureState":
+        return copy.deepcopy(self)
+
+    def to_dict(self) -> dict:
+        return {"n": self.n, "last_date": None if self.last_date is None else self.last_date.isoformat(),
+                "prices": list(self.prices), "ema": {str(k): v for k, v in self.ema.items()},
+                "ema_wt": {str(k): v for k, v in self.ema_wt.items()},
+                "sma": {str(k): _dump(v) for k, v in self.sma.items()}, "vol": {str(k): _dump(v) for k, v in self.vol.items()},
+                "gain": _dump(self.gain), "loss": _dump(self.loss)}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "FeatureState":
+        st = cls()
+        st.n = d["n"]; st.last_date = pd.Timestamp(d["last_date"]) if d.get("last_date") else None
+        st.prices.extend(d["prices"])
+        st.ema = {int(k): v for k, v in d["ema"].items()}
+        st.ema_wt.update({int(k): v for k, v in (d.get("ema_wt") or {}).items()})
+        st.sma = {int(k): _undump(v) for k, v in d["sma"].items()}
+        st.vol = {int(k): _undump(v) for k, v in d["vol"].items()}
+        st.gain, st.loss = _undump(d["gain"]), _undump(d["loss"])
+        return st
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> "FeatureState":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
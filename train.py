@@ -1,10 +1,15 @@
 
 from __future__ import annotations
-import os, pandas as pd, numpy as np, joblib
+import os, time, tempfile, pandas as pd, numpy as np, joblib, xgboost
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 from sklearn.metrics import mean_absolute_error, mean_squared_error
-from xgboost import XGBRegressor
+from xgboost import XGBRegressor, DataIter, DMatrix, QuantileDMatrix
+from model_store import save_sarimax, save_xgb, write_manifest
+from profiling import stage, peak_rss_mb
+
+CHUNK_ROWS = 65536
 
 @dataclass
 class TrainResult:
@@ -12,9 +17,13 @@ class TrainResult:
     xgb_model_path: str | None
     metrics: dict
 
-def fit_sarimax(series: pd.Series, order=(1,1,1), seasonal_order=(0,1,1,7)):
+def fit_sarimax(series: pd.Series, order=(1,1,1), seasonal_order=(0,1,1,7), maxiter: int = 50, start_params=None):
     model = SARIMAX(series, order=order, seasonal_order=seasonal_order, enforce_stationarity=False, enforce_invertibility=False)
-    return model.fit(disp=False)
+    if start_params is not None:
+        # warm start only when it beats the default (CSS) starting point; one filter pass each
+        start_params = np.asarray(start_params)
+        if not model.loglike(start_params) > model.loglike(model.start_params): start_params = None
+    return model.fit(disp=False, maxiter=maxiter, start_params=start_params)
 
 def _metrics(y_true, y_pred):
     mae = mean_absolute_error(y_true, y_pred)
@@ -22,44 +31,164 @@ def _metrics(y_true, y_pred):
     mape = (abs((y_true - y_pred) / y_true).replace([float("inf")], float("nan"))).dropna().mean() * 100
     return {"MAE": float(mae), "RMSE": float(rmse), "MAPE_pct": float(mape)}
 
+def _xgb_model(xgb_cfg: dict) -> XGBRegressor:
+    return XGBRegressor(
+        n_estimators=xgb_cfg.get("n_estimators", 400),
+        max_depth=xgb_cfg.get("max_depth", 4),
+        learning_rate=xgb_cfg.get("learning_rate", 0.05),
+        n_jobs=xgb_cfg.get("n_jobs"), tree_method=xgb_cfg.get("tree_method", "hist"),
+        subsample=xgb_cfg.get("subsample", 0.9), colsample_bytree=xgb_cfg.get("colsample_bytree", 0.9),
+        min_child_weight=xgb_cfg.get("min_child_weight", 1), objective="reg:squarederror", random_state=42
+    )
+
+def design_matrix(features: pd.DataFrame, series: pd.Series) -> tuple[np.ndarray, pd.Series, list[str]]:
+    """(X, y, feature columns) over the rows where the price and every feature are known, as ``dropna`` would.
+
+    X is a float32 view of the features' block, not a copy, when the frame is a single float32 block (as
+    ``build_features`` returns) whose ``price`` column comes first and whose complete rows form one run; a
+    block memory-mapped from disk then stays on disk. Rows are checked ``CHUNK_ROWS`` at a time.
+    """
+    cols = [c for c in features.columns if c != "price"]
+    arr = features.to_numpy(dtype=np.float32, copy=False)
+    if "price" in features.columns:
+        pos = features.columns.get_loc("price")
+        arr = arr[:, 1:] if pos == 0 else np.delete(arr, pos, axis=1)
+    yv = series.reindex(features.index).to_numpy(dtype=float)
+    ok = ~np.isnan(yv)
+    for i in range(0, len(ok), CHUNK_ROWS):
+        ok[i:i + CHUNK_ROWS] &= ~np.isnan(arr[i:i + CHUNK_ROWS]).any(axis=1)
+    rows = np.flatnonzero(ok)
+    sel = slice(rows[0], rows[-1] + 1) if len(rows) and rows[-1] - rows[0] + 1 == len(rows) else rows
+    return arr[sel], pd.Series(yv[sel], index=features.index[sel], name="price"), cols
+
+class ResidualChunks(DataIter):
+    """Row chunks of a (possibly memory-mapped) feature matrix with their residuals, so XGBoost builds its
+    matrix without the training rows ever being copied whole; rows with a NaN residual are skipped."""
+    def __init__(self, X: np.ndarray, resid: np.ndarray, chunk_rows: int = CHUNK_ROWS, cache_prefix: str | None = None,
+                 feature_names: list[str] | None = None):
+        self.X, self.resid, self.chunk_rows, self.feature_names, self._start = X, resid, chunk_rows, feature_names, 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data) -> bool:
+        while self._start < len(self.resid):
+            stop = min(self._start + self.chunk_rows, len(self.resid))
+            y, X = self.resid[self._start:stop], np.asarray(self.X[self._start:stop])
+            self._start = stop
+            ok = ~np.isnan(y)
+            if ok.any():
+                input_data(data=X if ok.all() else X[ok], label=y[ok], feature_names=self.feature_names)
+                return True
+        return False
+
+    def reset(self):
+        self._start = 0
+
+def fit_residual_model(X: np.ndarray, resid: np.ndarray, xgb_cfg: dict, cols: list[str] | None = None) -> XGBRegressor:
+    """XGBoost residual model on the rows of ``X`` whose residual is known.
+
+    ``xgb_cfg["data"]`` picks how the rows reach XGBoost: ``memory`` fits on the array, ``quantile`` streams
+    ``chunk_rows`` at a time into a QuantileDMatrix (only the quantized matrix is held, about a byte per value)
+    and ``external`` into an external-memory DMatrix whose pages are cached on disk under ``cache_dir``.
+    """
+    model, mode = _xgb_model(xgb_cfg), xgb_cfg.get("data", "memory")
+    if mode == "memory":
+        ok = ~np.isnan(resid)
+        model.fit(X if ok.all() else X[ok], resid[ok])
+    elif mode in ("quantile", "external"):
+        chunk = int(xgb_cfg.get("chunk_rows", CHUNK_ROWS))
+        with tempfile.TemporaryDirectory(prefix="xgb-pages-", dir=xgb_cfg.get("cache_dir")) as cache:
+            it = ResidualChunks(X, resid, chunk, os.path.join(cache, "train") if mode == "external" else None, cols)
+            dtrain = QuantileDMatrix(it) if mode == "quantile" else DMatrix(it)
+            booster = xgboost.train(model.get_xgb_params(), dtrain, num_boost_round=model.n_estimators)
+            del dtrain
+        model.load_model(bytearray(booster.save_raw("ubj")))
+    else:
+        raise ValueError(f"Unknown model.xgboost.data '{mode}' (expected memory, quantile or external)")
+    if cols: model.get_booster().feature_names = cols
+    return model
+
+def _timed(name: str, fn, *args, **kwargs):
+    with stage(name):
+        t0 = time.perf_counter(); out = fn(*args, **kwargs)
+    return out, round(time.perf_counter() - t0, 4)
+
+def _iterations(res) -> int | None:
+    it = getattr(res, "mle_retvals", None) or {}
+    return int(it["iterations"]) if "iterations" in it else None
+
 def train_models(series: pd.Series, features: pd.DataFrame, artifacts_dir: str, sarimax_cfg: dict,
                  xgb_cfg: dict | None, test_size_days: int = 60) -> TrainResult:
+    """Fit the SARIMAX baseline and the XGBoost residual model, on the train split and on the full series.
+
+    The full-series SARIMAX fit starts from the train-split parameters and runs concurrently with the
+    train-split XGBoost fit; per-fit wall times and optimizer iterations are reported under
+    ``metrics["timings"]`` and ``metrics["sarimax_iterations"]``, the residual model's data mode and the peak
+    RSS under ``metrics["training"]``.
+    """
     os.makedirs(artifacts_dir, exist_ok=True)
-    df = features.copy(); df['price'] = series; df = df.dropna()
-    y = df['price']; X = df.drop(columns=['price'])
-    cutoff = y.index.max() - pd.Timedelta(days=test_size_days)
-    y_train, y_test = y[y.index <= cutoff], y[y.index > cutoff]
-    X_train, X_test = X.loc[y_train.index], X.loc[y_test.index]
-
-    sar_train = fit_sarimax(y_train, order=tuple(sarimax_cfg.get("order",(1,1,1))),
-                            seasonal_order=tuple(sarimax_cfg.get("seasonal_order",(0,1,1,7))))
+    t_start = time.perf_counter()
+    X, y, cols = design_matrix(features, series)
+    n_train = int((y.index <= y.index.max() - pd.Timedelta(days=test_size_days)).sum())
+    y_train, y_test = y.iloc[:n_train], y.iloc[n_train:]
+    X_train, X_test = X[:n_train], X[n_train:]
+    sar_kw = dict(order=tuple(sarimax_cfg.get("order",(1,1,1))),
+                  seasonal_order=tuple(sarimax_cfg.get("seasonal_order",(0,1,1,7))),
+                  maxiter=sarimax_cfg.get("maxiter", 50))
+    timings = {}
+
+    sar_train, timings["sarimax_train_s"] = _timed("sarimax_train", fit_sarimax, y_train, **sar_kw)
     base_pred_test = sar_train.get_forecast(steps=len(y_test)).predicted_mean
     base_pred_test.index = y_test.index
     metrics_base = _metrics(y_test, base_pred_test)
+    use_xgb = bool(xgb_cfg and xgb_cfg.get("enabled", True))
+    start_params = sar_train.params if sarimax_cfg.get("warm_start", True) else None
 
-    xgb_path = None
-    if xgb_cfg and xgb_cfg.get("enabled", True):
-        xgb = XGBRegressor(
-            n_estimators=xgb_cfg.get("n_estimators", 400),
-            max_depth=xgb_cfg.get("max_depth", 4),
-            learning_rate=xgb_cfg.get("learning_rate", 0.05),
-            subsample=0.9, colsample_bytree=0.9, objective="reg:squarederror", random_state=42
-        )
-        resid_train = (y_train - sar_train.fittedvalues.reindex(y_train.index).ffill()).dropna()
-        xgb.fit(X_train.loc[resid_train.index], resid_train.values)
-        resid_pred_test = pd.Series(xgb.predict(X_test), index=X_test.index)
-        metrics_hybrid = _metrics(y_test, (base_pred_test + resid_pred_test).reindex(y_test.index))
-    else:
-        xgb = None; metrics_hybrid = metrics_base
+    # one-step errors on the test split with the train-split parameters; the hybrid's are what its residual
+    # model leaves of them, and forecast intervals resample those (see infer.hybrid_paths)
+    innov_test = y_test.to_numpy() - np.asarray(sar_train.extend(y_test.to_numpy()).fittedvalues, dtype=float) \
+        if len(y_test) else np.empty(0)
 
-    sar_full = fit_sarimax(y, order=tuple(sarimax_cfg.get("order",(1,1,1))),
-                           seasonal_order=tuple(sarimax_cfg.get("seasonal_order",(0,1,1,7))))
-    sar_path = os.path.join(artifacts_dir, "sarimax.pkl"); joblib.dump(sar_full, sar_path)
+    def _xgb_holdout():
+        resid = y_train.to_numpy() - sar_train.fittedvalues.reindex(y_train.index).ffill().to_numpy()
+        xgb = fit_residual_model(X_train, resid, xgb_cfg)
+        resid_pred_test = xgb.predict(X_test)
+        metrics = _metrics(y_test, base_pred_test + pd.Series(resid_pred_test, index=y_test.index))
+        return metrics, innov_test - resid_pred_test
 
-    if xgb is not None:
-        base_fit = sar_full.fittedvalues.reindex(y.index).ffill()
-        resid_full = (y - base_fit).dropna()
-        xgb.fit(X.loc[resid_full.index], resid_full.values)
-        xgb_path = os.path.join(artifacts_dir, "xgb.pkl"); joblib.dump(xgb, xgb_path)
+    # the full-data SARIMAX fit and the train-split XGBoost fit are independent of each other
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        fut_full = ex.submit(_timed, "sarimax_full", fit_sarimax, y, start_params=start_params, **sar_kw)
+        fut_hold = ex.submit(_timed, "xgb_holdout", _xgb_holdout) if use_xgb else None
+        sar_full, timings["sarimax_full_s"] = fut_full.result()
+        if fut_hold is not None:
+            (metrics_hybrid, errors), timings["xgb_train_s"] = fut_hold.result()
+        else:
+            metrics_hybrid, errors = metrics_base, innov_test
+    compact = sarimax_cfg.get("artifact_format", "compact") != "pickle"
+    with stage("save_sarimax"):
+        if compact:
+            sar_path = os.path.join(artifacts_dir, "sarimax.npz"); sar_spec = save_sarimax(sar_full, sar_path)
+        else:
+            sar_path = os.path.join(artifacts_dir, "sarimax.pkl"); joblib.dump(sar_full, sar_path); sar_spec = {}
+
+    xgb_path = None
+    if use_xgb:
+        t0 = time.perf_counter()
+        resid = y.to_numpy() - sar_full.fittedvalues.reindex(y.index).ffill().to_numpy()
+        with stage("xgb_full"):
+            xgb = fit_residual_model(X, resid, xgb_cfg, cols)  # names kept in the saved model
+        if compact:
+            xgb_path = os.path.join(artifacts_dir, "xgb.ubj"); save_xgb(xgb, xgb_path)
+        else:
+            xgb_path = os.path.join(artifacts_dir, "xgb.pkl"); joblib.dump(xgb, xgb_path)
+        timings["xgb_full_s"] = round(time.perf_counter() - t0, 4)
+    timings["total_s"] = round(time.perf_counter() - t_start, 4)
+    last = str(y.index.max().date())
+    write_manifest(artifacts_dir, sarimax={"file": os.path.basename(sar_path), **sar_spec},
+                   xgb={"file": os.path.basename(xgb_path)} if xgb_path else None, feature_columns=cols,
+                   trained_through=last, refit_date=last, holdout_errors=[float(e) for e in errors if np.isfinite(e)])
 
-    return TrainResult(sarimax_model_path=sar_path, xgb_model_path=xgb_path, metrics={"baseline":metrics_base,"hybrid":metrics_hybrid})
+    return TrainResult(sarimax_model_path=sar_path, xgb_model_path=xgb_path,
+                       metrics={"baseline":metrics_base, "hybrid":metrics_hybrid, "timings":timings,
+                                "sarimax_iterations":{"train":_iterations(sar_train), "full":_iterations(sar_full)},
+                                "training":{"xgb_data":(xgb_cfg or {}).get("data", "memory"), "peak_rss_mb":peak_rss_mb()}})
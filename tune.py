@@ -0,0 +1,184 @@
+from __future__ import annotations
+import os, json, time, itertools
+import numpy as np, pandas as pd, yaml
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from utils import load_config, ensure_dir, today_str
+from price_store import load_prices, price_query
+from pipeline import build_features
+from train import fit_sarimax, _xgb_model, design_matrix
+
+DEFAULT_SPACE = {
+    "sarimax": {"p": [0, 1, 2], "d": [1], "q": [0, 1, 2], "P": [0, 1], "D": [1], "Q": [0, 1], "s": [7],
+                "maxiter": [10, 30, 90]},
+    "xgboost": {"max_depth": [3, 4, 6], "learning_rate": [0.03, 0.05, 0.1], "subsample": [0.8, 1.0],
+                "n_estimators": [100, 300, 900]},
+}
+_W: dict = {}
+
+def _init_worker(data_dir: str):
+    # every worker maps the same .npy files read-only: the feature matrix is shared through the page cache
+    for name in ("y", "X", "base_test", "resid_train"):
+        path = os.path.join(data_dir, f"{name}.npy")
+        _W[name] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+    with open(os.path.join(data_dir, "meta.json"), "r", encoding="utf-8") as f:
+        _W.update(json.load(f))
+
+def _rmse(a: np.ndarray, b: np.ndarray) -> float:
+    ok = np.isfinite(a) & np.isfinite(b)
+    return float(np.sqrt(np.mean((a[ok] - b[ok]) ** 2))) if ok.any() else float("inf")
+
+def _sarimax_trial(cand: dict, maxiter: int, start_params) -> tuple[float, list | None]:
+    """Holdout RMSE of a SARIMAX fitted on the train split with ``maxiter`` iterations, and its parameters."""
+    y, n = np.asarray(_W["y"]), _W["n_train"]
+    try:
+        res = fit_sarimax(y[:n], order=tuple(cand["order"]), seasonal_order=tuple(cand["seasonal_order"]),
+                          maxiter=maxiter, start_params=start_params)
+        return _rmse(y[n:], np.asarray(res.forecast(steps=len(y) - n), dtype=float)), list(map(float, res.params))
+    except Exception:
+        return float("inf"), None
+
+def _xgb_trial(cand: dict, n_estimators: int, _prev) -> tuple[float, None]:
+    """Hybrid holdout RMSE of an XGBoost residual model with ``n_estimators`` trees on top of the tuned SARIMAX."""
+    n, X = _W["n_train"], _W["X"]
+    ok = np.isfinite(_W["resid_train"])
+    try:
+        model = _xgb_model({**_W["xgb_base"], **cand, "n_estimators": n_estimators, "n_jobs": 1})
+        model.fit(X[:n][ok], _W["resid_train"][ok])
+        y = np.asarray(_W["y"])
+        return _rmse(y[n:], np.asarray(_W["base_test"]) + model.predict(X[n:])), None
+    except Exception:
+        return float("inf"), None
+
+def _pool(workers: int, data_dir: str) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data_dir,))
+
+def _stop(ex: ProcessPoolExecutor):
+    """Shut the pool down without waiting for trials still running at the deadline: drop the queued ones and
+    terminate the workers."""
+    procs = list((getattr(ex, "_processes", None) or {}).values())
+    ex.shutdown(wait=False, cancel_futures=True)
+    for p in procs:
+        if p.is_alive(): p.terminate()
+    for p in procs: p.join()
+
+def _grid(space: dict, resource: str) -> tuple[list[dict], list[int]]:
+    """All combinations of the non-resource keys, and the sorted resource rungs."""
+    keys = [k for k in space if k != resource]
+    return [dict(zip(keys, vals)) for vals in itertools.product(*(space[k] for k in keys))], sorted(space[resource])
+
+def _sarimax_candidates(space: dict) -> tuple[list[dict], list[int]]:
+    combos, rungs = _grid(space, "maxiter")
+    return [{"order": [c["p"], c["d"], c["q"]], "seasonal_order": [c["P"], c["D"], c["Q"], c["s"]]} for c in combos], rungs
+
+def successive_halving(ex: ProcessPoolExecutor, trial, candidates: list[dict], rungs: list[int], eta: int,
+                       deadline: float, phase: str, log: list[dict]) -> tuple[dict, float, int, object] | None:
+    """Run every candidate at the smallest resource, keep the best 1/``eta`` for the next rung, and so on.
+
+    A rung that reaches ``deadline`` is cut short: only its completed trials count, and the caller stops the
+    pool (see ``_stop``) rather than waiting for the rest. Returns (candidate, score, resource, extra) of the
+    best trial at the highest rung reached.
+    """
+    alive = [(c, None) for c in candidates]
+    best = None
+    for rung, resource in enumerate(rungs):
+        left = deadline - time.monotonic()
+        if left <= 0 or not alive: break
+        futs = {ex.submit(trial, c, resource, extra): (c, time.monotonic()) for c, extra in alive}
+        done, scored = set(), []
+        while len(done) < len(futs):
+            left = deadline - time.monotonic()
+            if left <= 0: break
+            finished, _ = wait(set(futs) - done, timeout=left, return_when=FIRST_COMPLETED)
+            for f in finished:
+                c, t0 = futs[f]
+                score, extra = f.result()
+                scored.append((score, c, extra))
+                log.append({"phase": phase, "rung": rung, "resource": resource, "score": score,
+                            "seconds": round(time.monotonic() - t0, 3), **{k: str(v) for k, v in c.items()}})
+            done |= finished
+        for f in set(futs) - done: f.cancel()
+        scored = [s for s in scored if np.isfinite(s[0])]
+        if not scored: break
+        scored.sort(key=lambda s: s[0])
+        best = (scored[0][1], scored[0][0], resource, scored[0][2])
+        alive = [(c, extra) for _, c, extra in scored[:max(1, len(scored) // eta)]]
+        if len(done) < len(futs): break  # out of time inside this rung
+    return best
+
+def tune(price_s: pd.Series, features: pd.DataFrame, cfg: dict, budget_seconds: float, out_dir: str,
+         max_workers: int | None = None) -> dict:
+    """Search SARIMAX orders, then XGBoost settings on its residuals, within ``budget_seconds`` of wall time.
+
+    Both searches are successive halving across a process pool (SARIMAX over ``maxiter``, XGBoost over
+    ``n_estimators``); the SARIMAX one gets ``tune.sarimax_share`` of the budget. Candidates are scored on the
+    same last ``model.test_size_days`` holdout as ``train_models``.
+    """
+    tcfg = cfg.get("tune", {}) or {}
+    mcfg = cfg.get("model", {}) or {}
+    space = {k: {**DEFAULT_SPACE[k], **((tcfg.get("space") or {}).get(k) or {})} for k in DEFAULT_SPACE}
+    eta = int(tcfg.get("eta", 3))
+    workers = max_workers or tcfg.get("max_workers") or os.cpu_count() or 1
+    t_end = time.monotonic() + float(budget_seconds)
+
+    X, y_s, _ = design_matrix(features, price_s)
+    y = y_s.to_numpy()
+    n_train = int((y_s.index <= y_s.index.max() - pd.Timedelta(days=mcfg.get("test_size_days", 60))).sum())
+    data_dir = os.path.join(out_dir, "data"); ensure_dir(data_dir)
+    np.save(os.path.join(data_dir, "y.npy"), y); np.save(os.path.join(data_dir, "X.npy"), X)
+    meta = {"n_train": n_train, "xgb_base": {k: v for k, v in (mcfg.get("xgboost") or {}).items() if k != "enabled"}}
+    with open(os.path.join(data_dir, "meta.json"), "w", encoding="utf-8") as f: json.dump(meta, f)
+
+    log: list[dict] = []
+    cands, rungs = _sarimax_candidates(space["sarimax"])
+    sar_deadline = time.monotonic() + float(budget_seconds) * float(tcfg.get("sarimax_share", 0.6))
+    ex = _pool(workers, data_dir)
+    try:
+        sar_best = successive_halving(ex, _sarimax_trial, cands, rungs, eta, sar_deadline, "sarimax", log)
+    finally:
+        _stop(ex)
+    if sar_best is None:
+        raise RuntimeError("No SARIMAX candidate finished within the budget; raise --budget or shrink the grid.")
+    best = {"sarimax": {**sar_best[0], "maxiter": sar_best[2]}, "sarimax_rmse": sar_best[1]}
+
+    xgb_enabled = bool((mcfg.get("xgboost") or {}).get("enabled", True))
+    if xgb_enabled and time.monotonic() < t_end:
+        sar = fit_sarimax(y[:n_train], order=tuple(sar_best[0]["order"]), seasonal_order=tuple(sar_best[0]["seasonal_order"]),
+                          maxiter=sar_best[2], start_params=sar_best[3])
+        np.save(os.path.join(data_dir, "base_test.npy"), np.asarray(sar.forecast(steps=len(y) - n_train), dtype=float))
+        np.save(os.path.join(data_dir, "resid_train.npy"), y[:n_train] - np.asarray(sar.fittedvalues, dtype=float))
+        cands, rungs = _grid(space["xgboost"], "n_estimators")
+        ex = _pool(workers, data_dir)
+        try:
+            xgb_best = successive_halving(ex, _xgb_trial, cands, rungs, eta, t_end, "xgboost", log)
+        finally:
+            _stop(ex)
+        if xgb_best is not None:
+            best.update(xgboost={**xgb_best[0], "n_estimators": xgb_best[2]}, hybrid_rmse=xgb_best[1])
+    pd.DataFrame(log).to_csv(os.path.join(out_dir, "trials.csv"), index=False)
+    return {**best, "trials": len(log)}
+
+def overlay(best: dict) -> dict:
+    """The ``model`` settings of ``best`` as a config overlay (see ``overlays`` in config.yaml)."""
+    model = {"sarimax": best["sarimax"]}
+    if "xgboost" in best: model["xgboost"] = best["xgboost"]
+    return {"model": model}
+
+def run_tune(config_path: str = "config.yaml", budget_seconds: float | None = None, max_workers: int | None = None,
+             overlay_path: str | None = None) -> dict:
+    cfg = load_config(config_path)
+    tcfg = cfg.get("tune", {}) or {}
+    price_s = load_prices(price_query(cfg))
+    feats = build_features(price_s, cfg)
+    out_dir = os.path.join("artifacts", today_str(), "tune"); ensure_dir(out_dir)
+    t0 = time.perf_counter()
+    best = tune(price_s, feats, cfg, budget_seconds or tcfg.get("budget_seconds", 600), out_dir, max_workers)
+    best["seconds"] = round(time.perf_counter() - t0, 3)
+    with open(os.path.join(out_dir, "best.json"), "w", encoding="utf-8") as f: json.dump(best, f, indent=2)
+    overlay_path = overlay_path or os.path.join(os.path.dirname(config_path), tcfg.get("overlay", "config.tuned.yaml"))
+    with open(overlay_path, "w", encoding="utf-8") as f:
+        f.write(f"# written by `cli.py tune` on {today_str()}: holdout RMSE sarimax {best['sarimax_rmse']:.4f}"
+                + (f", hybrid {best['hybrid_rmse']:.4f}" if "hybrid_rmse" in best else "") + "\n")
+        yaml.safe_dump(overlay(best), f, sort_keys=False)
+    print(json.dumps(best, indent=2))
+    print(f"Done in {best['seconds']:.1f}s, {best['trials']} trials. Overlay: {overlay_path}; trials at: {out_dir}")
+    return best
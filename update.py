@@ -0,0 +1,124 @@
+from __future__ import annotations
+import os, time, shutil, datetime as dt
+import numpy as np, pandas as pd, joblib
+from utils import load_config, ensure_dir, today_str
+from price_store import load_prices, price_query
+from infer import load_sarimax, load_xgb, model_files, forecast
+from model_store import save_sarimax, save_xgb, read_manifest, write_manifest, align_features
+from train import _xgb_model
+from sinks import plot_renderer, output_formats
+from profiling import stage
+from pipeline import (build_features, exogenous_features, make_future_features_builder, train_full, FeatureState,
+                      IND_LAGS, WEATHER_LAGS, _publish)
+
+def _new_feature_rows(cfg: dict, state: FeatureState, new: pd.Series) -> pd.DataFrame:
+    """Feature rows for the new observations only: ``state`` is advanced in place, exogenous columns are read
+    for a window that covers their lags."""
+    price_feats = state.extend(new)
+    idx = pd.date_range(new.index[0] - pd.Timedelta(days=max(IND_LAGS + WEATHER_LAGS)), new.index[-1], freq="D")
+    return pd.concat([price_feats, exogenous_features(idx, cfg).reindex(new.index)], axis=1).drop(columns=["price"])
+
+def update_models(series: pd.Series, cfg: dict, models_dir: str) -> dict:
+    """Bring the saved models up to the end of ``series`` without re-estimating them.
+
+    SARIMAX keeps its parameters and only filters the new observations (``append`` onto the stored state);
+    the XGBoost residual model gets ``update.xgb_rounds`` extra boosting rounds fitted on the new one-step
+    residuals. Both are re-estimated from scratch instead when the last full fit is ``update.refit_every_days``
+    old, or when the RMS of the standardized one-step errors on the new data exceeds ``update.drift_threshold``.
+
+    The files are updated in a copy of ``models_dir`` that is then published over it like ``run_pipeline``'s
+    models, so the server and the dashboard never read a half-updated model.
+    """
+    staging = f"{os.path.normpath(models_dir)}.update-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True); os.makedirs(staging)
+    try:
+        for e in os.scandir(models_dir):
+            if e.is_file(): shutil.copy2(e.path, os.path.join(staging, e.name))
+        report = _update_models(series, cfg, staging)
+        if report["action"] != "none": _publish(staging, models_dir)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return report
+
+def _update_models(series: pd.Series, cfg: dict, models_dir: str) -> dict:
+    ucfg = cfg.get("update", {}) or {}
+    t0 = time.perf_counter()
+    manifest = read_manifest(models_dir)
+    if not manifest or "trained_through" not in manifest:
+        return _refit(series, cfg, models_dir, "no previous artifact", t0)
+    last = pd.Timestamp(manifest["trained_through"])
+    new = series[series.index > last].dropna()
+    report = {"action": "none", "trained_through": str(last.date()), "new_obs": len(new)}
+    if new.empty:
+        return {**report, "seconds": round(time.perf_counter() - t0, 4)}
+
+    sar_path, xgb_path, cols = model_files(models_dir)
+    sar = load_sarimax(sar_path)
+    res = sar.append(new.rename(sar.model.data.orig_endog.name), copy_initialization=True)
+    z = np.asarray(res.standardized_forecasts_error)[0, -len(new):]
+    drift = float(np.sqrt(np.nanmean(z ** 2))) if np.isfinite(z).any() else 0.0
+    age = (new.index[-1] - pd.Timestamp(manifest.get("refit_date", last))).days
+    if age >= int(ucfg.get("refit_every_days", 30)):
+        return _refit(series, cfg, models_dir, f"scheduled ({age} days since last fit)", t0, drift=drift)
+    if drift > float(ucfg.get("drift_threshold", 3.0)):
+        return _refit(series, cfg, models_dir, f"drift {drift:.2f}", t0, drift=drift)
+
+    sar_info = dict(manifest["sarimax"])
+    if sar_path.endswith(".npz"):
+        sar_info.update(save_sarimax(res, sar_path), nobs=int(sar_info.get("nobs", 0)) + len(new))
+    else:
+        joblib.dump(res, sar_path)
+
+    state_path = os.path.join(models_dir, "feature_state.json")
+    state = FeatureState.load(state_path) if os.path.exists(state_path) else None
+    if state is None or state.last_date != last:
+        state = FeatureState.from_series(series.loc[:last])
+    xgb, rounds = load_xgb(xgb_path), 0
+    if xgb is not None:
+        X = align_features(_new_feature_rows(cfg, state, new), cols)
+        resid = (new - res.fittedvalues.reindex(new.index)).rename("resid")
+        keep = X.notna().all(axis=1) & resid.notna()
+        if keep.any():
+            xgb_cfg = cfg.get("model", {}).get("xgboost", {}) or {}
+            rounds = int(ucfg.get("xgb_rounds", 10))
+            # "approx" keeps a plain DMatrix: on a few-row QuantileDMatrix ("hist") the existing trees would be
+            # evaluated on bin boundaries, not on the actual feature values, and the new rounds fit the wrong margin
+            booster = _xgb_model({**xgb_cfg, "n_estimators": rounds, "tree_method": "approx"})
+            booster.fit(X[keep], resid[keep].values, xgb_model=xgb.get_booster())
+            if xgb_path.endswith((".ubj", ".json")): save_xgb(booster, xgb_path)
+            else: joblib.dump(booster, xgb_path)
+    else:
+        state.extend(new)
+    state.save(state_path)
+    write_manifest(models_dir, **{**{k: v for k, v in manifest.items() if k != "format"}, "sarimax": sar_info,
+                                  "trained_through": str(new.index[-1].date()),
+                                  "updated": dt.datetime.now().isoformat(timespec="seconds")})
+    return {**report, "action": "update", "trained_through": str(new.index[-1].date()), "drift": round(drift, 4),
+            "xgb_rounds_added": rounds, "seconds": round(time.perf_counter() - t0, 4)}
+
+def _refit(series: pd.Series, cfg: dict, models_dir: str, reason: str, t0: float, drift: float | None = None) -> dict:
+    tr, _ = train_full(series, build_features(series, cfg), cfg, models_dir)
+    return {"action": "refit", "reason": reason, "trained_through": str(series.dropna().index[-1].date()),
+            "drift": None if drift is None else round(drift, 4), "metrics": tr.metrics,
+            "seconds": round(time.perf_counter() - t0, 4)}
+
+def run_update(config_path: str = "config.yaml", horizons=None, plots: str | None = None):
+    """Daily refresh: update the saved models with the newest prices, then forecast from them."""
+    cfg = load_config(config_path)
+    with stage("load_prices"):
+        price_s = load_prices(price_query(cfg))
+    models_dir = os.path.join("artifacts", "models"); ensure_dir(models_dir)
+    with stage("update_models"):
+        report = update_models(price_s, cfg, models_dir)
+    print("Update:", report)
+    out_root = os.path.join("artifacts", today_str()); ensure_dir(out_root)
+    sar_path, xgb_path, _ = model_files(models_dir)
+    state_path = os.path.join(models_dir, "feature_state.json")
+    state = FeatureState.load(state_path) if os.path.exists(state_path) else None
+    renderer = plot_renderer(cfg, plots)
+    forecast(sar_path, xgb_path, price_s, make_future_features_builder(cfg, state), horizons or cfg.get("horizons", [7, 30, 180]),
+             out_root, "forecast", formats=output_formats(cfg), renderer=renderer, intervals=cfg.get("intervals"))
+    with stage("plots_wait"):
+        renderer.wait()
+    print(f"Done. Artifacts at: {out_root}")
+    return report
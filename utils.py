@@ -2,9 +2,23 @@
 from __future__ import annotations
 import os, yaml, datetime as dt
 
+def _merge(base: dict, over: dict) -> dict:
+    out = dict(base)
+    for k, v in over.items():
+        out[k] = _merge(out[k], v) if isinstance(v, dict) and isinstance(out.get(k), dict) else v
+    return out
+
 def load_config(path: str) -> dict:
+    """Read ``path`` and deep-merge the files listed under ``overlays`` (relative to it) over it, in order;
+    overlays that do not exist yet are skipped."""
     with open(path, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+        cfg = yaml.safe_load(f) or {}
+    for overlay in cfg.get("overlays") or []:
+        opath = os.path.join(os.path.dirname(path), overlay)
+        if os.path.exists(opath):
+            with open(opath, 'r', encoding='utf-8') as f:
+                cfg = _merge(cfg, yaml.safe_load(f) or {})
+    return cfg
 
 def today_str() -> str:
     return dt.date.today().isoformat()
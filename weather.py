@@ -1,24 +1,37 @@
-
 from __future__ import annotations
-import pandas as pd, requests
+import pandas as pd
+from net import session, with_retry, fetch_all
 OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+MAX_PAST_DAYS = 92
+
+def _get_daily(params: dict) -> dict:
+    r = session().get(OPEN_METEO_URL, params=params, timeout=30); r.raise_for_status()
+    return r.json()
 
-def fetch_weather_daily(lat: float, lon: float, past_days: int = 365) -> pd.DataFrame:
-    params = {"latitude": lat, "longitude": lon, "past_days": min(past_days,92),
+def fetch_weather_daily(lat: float, lon: float, past_days: int = 365, cache=None) -> pd.DataFrame:
+    if cache is not None:
+        today = pd.Timestamp.today().normalize()
+        start = today - pd.Timedelta(days=min(past_days, MAX_PAST_DAYS))
+        fetch = lambda since: fetch_weather_daily(lat, lon, past_days=(today - since).days)
+        return cache.fetch("open_meteo", f"{lat:.4f},{lon:.4f}", fetch, start).asfreq("D").ffill()
+    params = {"latitude": lat, "longitude": lon, "past_days": min(past_days, MAX_PAST_DAYS),
               "daily": "temperature_2m_mean,precipitation_sum", "timezone": "auto"}
-    r = requests.get(OPEN_METEO_URL, params=params, timeout=30); r.raise_for_status()
-    js = r.json()
+    js = with_retry("open_meteo", _get_daily, params)
     df = pd.DataFrame({"date": pd.to_datetime(js["daily"]["time"]),
                        "temp_mean": js["daily"]["temperature_2m_mean"],
                        "precip": js["daily"]["precipitation_sum"]}).set_index("date").asfreq("D").ffill()
     return df
 
-def aggregate_regions(regions, past_days: int = 365):
-    frames = []
-    for reg in regions:
-        df = fetch_weather_daily(reg["lat"], reg["lon"], past_days=past_days).add_prefix(f'{reg["name"]}_')
-        frames.append(df)
-    out = pd.concat(frames, axis=1).ffill()
+def combine_regions(frames: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    out = pd.concat([df.add_prefix(f"{name}_") for name, df in frames.items()], axis=1).ffill()
     out["temp_mean_avg"] = out.filter(like="_temp_mean").mean(axis=1)
     out["precip_sum_avg"] = out.filter(like="_precip").sum(axis=1)
     return out
+
+def aggregate_regions(regions, past_days: int = 365, cache=None):
+    tasks = {reg["name"]: (lambda reg=reg: fetch_weather_daily(reg["lat"], reg["lon"], past_days=past_days, cache=cache))
+             for reg in regions}
+    frames = fetch_all(tasks)
+    for name, res in frames.items():
+        if isinstance(res, Exception): raise res
+    return combine_regions(frames)
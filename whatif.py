@@ -0,0 +1,118 @@
+from __future__ import annotations
+import os, time
+import numpy as np, pandas as pd, yaml
+from utils import load_config, ensure_dir, today_str
+from model_store import read_manifest, align_features
+from profiling import stage
+from tech_indicators import feature_columns
+
+BASELINE = "baseline"
+
+def load_scenarios(path: str) -> list[dict]:
+    """Scenario definitions from YAML/JSON: a list (or ``{scenarios: [...]}``) of
+    ``{name, shocks: {<column>: {pct: -30} | {shift: 2.5} | {path: [v1, v2, ...]}}}``.
+
+    A column is an exogenous source column of the model (``ind_<key>``, ``*_avg`` or a region's weather
+    column); its ``_lag<n>`` columns follow it. ``pct`` scales and ``shift`` offsets the future values the
+    baseline assumes; ``path`` replaces them day by day, holding its last value to the end of the horizon.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        doc = yaml.safe_load(f) or []
+    scenarios = doc.get("scenarios", []) if isinstance(doc, dict) else doc
+    for i, sc in enumerate(scenarios):
+        sc.setdefault("name", f"scenario_{i + 1}")
+        sc.setdefault("shocks", {})
+    return scenarios
+
+def _sources(columns: list[str], targets) -> dict[str, list[tuple[int, int]]]:
+    """{source column: [(column position, lag), ...]} for every shocked source and its lag columns."""
+    pos = {c: j for j, c in enumerate(columns)}
+    price_cols = set(feature_columns())
+    out = {}
+    for t in targets:
+        if t not in pos or t in price_cols:
+            raise ValueError(f"Cannot shock '{t}': not an exogenous column of the model")
+        out[t] = [(pos[t], 0)] + [(j, int(c[len(t) + 4:])) for c, j in pos.items()
+                                   if c.startswith(f"{t}_lag") and c[len(t) + 4:].isdigit()]
+    return out
+
+def scenario_matrices(base: pd.DataFrame, scenarios: list[dict]) -> np.ndarray:
+    """(scenarios, steps, columns) future feature matrices: ``base`` (the builder's rows) with each scenario's
+    shocks applied to its source columns and carried into their lag columns, all scenarios at once."""
+    cols, F = list(base.columns), base.to_numpy(dtype=np.float32)
+    n, h = len(scenarios), len(base)
+    X = np.repeat(F[None], n, axis=0)
+    targets = sorted({t for sc in scenarios for t in sc["shocks"]})
+    for t, members in _sources(cols, targets).items():
+        v0 = F[:, members[0][0]].astype(float)
+        pct, shift = np.zeros(n), np.zeros(n)
+        paths: dict[int, np.ndarray] = {}
+        for i, sc in enumerate(scenarios):
+            spec = sc["shocks"].get(t)
+            if not spec: continue
+            pct[i], shift[i] = float(spec.get("pct", 0.0)), float(spec.get("shift", 0.0))
+            if spec.get("path") is not None:
+                p = np.asarray(spec["path"], dtype=float)[:h]
+                paths[i] = np.concatenate([p, np.full(h - len(p), p[-1])]) if len(p) else v0
+        U = v0[None, :] * (1.0 + pct[:, None] / 100.0) + shift[:, None]
+        for i, p in paths.items(): U[i] = p
+        for j, lag in members:
+            if lag < h: X[:, lag:, j] = U[:, :h - lag]  # earlier rows of a lag column are history: unchanged
+    return X
+
+def run_scenarios(model_dir: str, history: pd.Series, feature_maker, horizon: int, scenarios: list[dict]) -> pd.DataFrame:
+    """Forecast every scenario (plus the unshocked ``baseline``) ``horizon`` days ahead from the trained models in
+    ``model_dir``: one feature build, one batched shock, one ``predict`` over all scenario rows.
+
+    Returns a long table: scenario, step, date, forecast and ``delta`` against the baseline.
+    """
+    from infer import load_sarimax, load_xgb, model_files, base_forecast
+    sar_path, xgb_path, cols = model_files(model_dir)
+    xgb = load_xgb(xgb_path)
+    if xgb is None:
+        raise ValueError(f"No residual model in {model_dir}: scenarios shift exogenous features, which only it uses")
+    scenarios = [{"name": BASELINE, "shocks": {}}] + [sc for sc in scenarios if sc["name"] != BASELINE]
+    base = base_forecast(load_sarimax(sar_path), horizon)["base"].to_numpy()
+    fut_idx = pd.date_range(history.index.max() + pd.Timedelta(days=1), periods=horizon, freq="D")
+    with stage("whatif_features"):
+        feats = align_features(feature_maker(history, fut_idx), cols)
+        X = scenario_matrices(feats, scenarios)
+    with stage("whatif_predict", rows=X.shape[0] * X.shape[1]):
+        adj = np.asarray(xgb.predict(X.reshape(-1, X.shape[2])), dtype=float).reshape(len(scenarios), horizon)
+    fc = base[None, :] + adj
+    return pd.DataFrame({"scenario": np.repeat([sc["name"] for sc in scenarios], horizon),
+                         "step": np.tile(np.arange(1, horizon + 1), len(scenarios)),
+                         "date": np.tile(fut_idx.to_numpy(), len(scenarios)),
+                         "forecast": fc.ravel(), "delta": (fc - fc[:1]).ravel()})
+
+def summary(table: pd.DataFrame, horizons) -> pd.DataFrame:
+    """Scenario x horizon: the forecast ``h`` days ahead, for each requested ``h``."""
+    sel = table[table["step"].isin(list(horizons))]
+    out = sel.pivot(index="scenario", columns="step", values="forecast")
+    out.columns = [f"{h}d" for h in out.columns]
+    return out.reindex(list(dict.fromkeys(table["scenario"])))
+
+def run_whatif(scenarios_path: str, config_path: str = "config.yaml", horizon: int | None = None,
+               model: str = "") -> pd.DataFrame:
+    from pipeline import make_future_features_builder, FeatureState
+    from panel import model_history
+    cfg = load_config(config_path)
+    horizons = cfg.get("horizons", [7, 30, 180])
+    horizon = horizon or max(horizons)
+    model_dir = os.path.join("artifacts", "models", model)
+    if not read_manifest(model_dir):
+        raise FileNotFoundError(f"No trained model in {model_dir}; run `cli.py run-all` first")
+    price_s = model_history(cfg, model)
+    state_path = os.path.join(model_dir, "feature_state.json")
+    state = FeatureState.load(state_path) if os.path.exists(state_path) else None
+    scenarios = load_scenarios(scenarios_path)
+    t0 = time.perf_counter()
+    table = run_scenarios(model_dir, price_s, make_future_features_builder(cfg, state), horizon, scenarios)
+    seconds = time.perf_counter() - t0
+    out_root = os.path.join("artifacts", today_str()); ensure_dir(out_root)
+    table.to_csv(os.path.join(out_root, "whatif.csv"), index=False)
+    summ = summary(table, [h for h in horizons if h <= horizon] or [horizon])
+    summ.to_csv(os.path.join(out_root, "whatif_summary.csv"))
+    print(summ.round(2).to_string())
+    print(f"{len(scenarios)} scenarios x {horizon} days in {seconds:.2f}s. Tables at: {out_root}")
+    return table
@@ -1,11 +1,23 @@
-
 from __future__ import annotations
-import pandas as pd, yfinance as yf
+import pandas as pd
 from datetime import datetime, timedelta
+from net import with_retry
 
-def fetch_yf(ticker: str, lookback_days: int = 365) -> pd.Series:
-    end = datetime.utcnow(); start = end - timedelta(days=lookback_days + 10)
-    data = yf.download(ticker, start=start, end=end, progress=False, auto_adjust=True)
+def _download(ticker: str, start, end) -> pd.Series:
+    import yfinance as yf  # slow to import; only needed on a cache miss
+    # Ticker.history keeps no module-level state, unlike yf.download, so it is safe to call from fetch threads
+    data = with_retry("yfinance", yf.Ticker(ticker).history, start=start, end=end, auto_adjust=True)
     if data is None or data.empty: return pd.Series(dtype=float)
     s = data['Close'].copy(); s.name = ticker
-    return s.asfreq('D').ffill()
+    if s.index.tz is not None: s.index = s.index.tz_localize(None)
+    s.index = s.index.normalize()
+    return s[~s.index.duplicated(keep="last")].asfreq('D').ffill()
+
+def fetch_yf(ticker: str, lookback_days: int = 365, cache=None) -> pd.Series:
+    end = datetime.utcnow(); start = end - timedelta(days=lookback_days + 10)
+    if cache is None:
+        return _download(ticker, start, end)
+    df = cache.fetch("yfinance", ticker, lambda since: _download(ticker, since, datetime.utcnow()).to_frame("close"),
+                     pd.Timestamp(start.date()))
+    if df.empty or "close" not in df.columns: return pd.Series(dtype=float)
+    return df["close"].rename(ticker).asfreq('D').ffill()